@@ -0,0 +1,301 @@
+# Microbenchmarks of the functions run on every iteration of the trading loop, e.g.
+#     python -m benchmarks.hot_path --save-baseline     measures and stores the baseline
+#     python -m benchmarks.hot_path                     measures and flags the regressions against it
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+from statistics import median
+from timeit import Timer
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from constants.enums.position_type import PositionType
+from constants.enums.product_type import ProductType
+from constants.settings import BENCHMARK_DIR, BENCHMARK_REPEAT, BENCHMARK_REGRESSION_THRESHOLD, set_allocation
+from models.costs.delivery_trading_cost import DeliveryTransactionCost
+from models.costs.intraday_trading_cost import IntradayTransactionCost
+from models.stages.position import Position
+from models.stock_info import StockInfo
+from utils.clock import clock
+from utils.depth_walk import price_for_quantity, fill_for_amount
+from utils.indicators.kaufman_indicator import kaufman_indicator, kaufman_indicator_matrix
+from utils.indicators.rsi import calculate_rsi
+from utils.indicators.streaming import StreamingSignal
+from utils.market_simulator import MarketSimulator
+from utils.streaming.depth_table import depth_table
+from utils.tracking_components.stock_tracking import screen_stocks
+
+# realistic sizes of the inputs
+INTRADAY_TICKS = 750  # a trading day at 30 sec interval
+DAILY_BARS = 250  # a year of daily bars
+DEPTH_LEVELS = 20
+SYMBOLS = 1000
+
+
+@dataclass
+class Benchmark:
+    name: str
+    function: Callable[[], object]
+    # operations done by one call, the time per operation is reported as well
+    operations: int = 1
+    setup: Callable[[], None] | None = None
+
+
+@dataclass
+class BenchmarkSuite:
+    """
+        Times every benchmark with timeit, repeat times with as many calls as fit in about 0.2 seconds, and
+        keeps the median and the best time of one call. The results are written as json and compared with
+        a stored baseline on the median, and one which is slower by more than threshold is flagged as a
+        regression.
+    """
+    repeat: int = BENCHMARK_REPEAT
+    threshold: float = BENCHMARK_REGRESSION_THRESHOLD
+    directory: str = BENCHMARK_DIR
+    benchmarks: list[Benchmark] = field(default_factory=list)
+
+    @property
+    def baseline_path(self) -> str:
+        return f"{self.directory}/baseline.json"
+
+    def add(self, name: str, operations: int = 1, setup: Callable[[], None] | None = None):
+        """
+            decorator which adds the function as a benchmark
+        """
+        def register(function: Callable[[], object]):
+            self.benchmarks.append(Benchmark(name, function, operations, setup))
+            return function
+        return register
+
+    def run(self, selected: list[str] | None = None) -> dict:
+        """
+        times the benchmarks
+        :param selected: names of the benchmarks to be run, all if None
+        :return: results with the environment and the seconds per call of every benchmark
+        """
+        results = {}
+        for benchmark in self.benchmarks:
+            if selected is not None and benchmark.name not in selected:
+                continue
+            if benchmark.setup is not None:
+                benchmark.setup()
+            timer = Timer(benchmark.function)
+            number, _ = timer.autorange()
+            times = [elapsed / number for elapsed in timer.repeat(self.repeat, number)]
+            results[benchmark.name] = {
+                "median": median(times),
+                "best": min(times),
+                "per_operation": median(times) / benchmark.operations,
+                "operations": benchmark.operations,
+                "calls": number,
+            }
+            print(f"{benchmark.name:<40} {_format(median(times)):>10} per call"
+                  f" {_format(median(times) / benchmark.operations):>10} per operation", flush=True)
+        return {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "results": results,
+        }
+
+    def save(self, results: dict, path: str | None = None) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = path or f"{self.directory}/hot_path_{datetime.now():%Y%m%d_%H%M%S}.json"
+        with open(path, "w") as file:
+            json.dump(results, file, indent=2)
+        return path
+
+    def compare(self, results: dict, baseline: dict) -> dict[str, str]:
+        """
+        compares the median time of every benchmark with the baseline
+        :param results: results of run
+        :param baseline: results of an earlier run
+        :return: status of every benchmark which was run, REGRESSION, IMPROVED, SAME or NEW
+        """
+        statuses = {}
+        for name, result in results["results"].items():
+            before = baseline["results"].get(name)
+            if before is None:
+                statuses[name] = "NEW"
+                continue
+            ratio = result["median"] / before["median"]
+            statuses[name] = "REGRESSION" if ratio > 1 + self.threshold else \
+                "IMPROVED" if ratio < 1 - self.threshold else "SAME"
+            print(f"{name:<40} {_format(before['median']):>10} -> {_format(result['median']):>10}"
+                  f" x{ratio:5.2f} {statuses[name]}")
+        return statuses
+
+
+def _format(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+suite = BenchmarkSuite()
+
+# the inputs are generated once with a fixed seed so that every run measures the same work
+_generator = np.random.default_rng(0)
+_ticks = pd.Series(100 * np.exp(np.cumsum(_generator.normal(0, 0.002, INTRADAY_TICKS))))
+_daily = pd.DataFrame(
+    100 * np.exp(np.cumsum(_generator.normal(0, 0.02, (DAILY_BARS, SYMBOLS)), axis=0)),
+    index=pd.date_range(end=datetime(2024, 5, 9), periods=DAILY_BARS, freq="B"),
+    columns=[f"S{number}.NS" for number in range(SYMBOLS)],
+)
+_market = MarketSimulator(seed=0, step_seconds=0, levels=DEPTH_LEVELS)
+_symbols = [f"S{number}" for number in range(SYMBOLS)]
+_depth = _market.depths(["S0"])["S0"]["depth"]
+_stocks: list[StockInfo] = []
+_positions: list[Position] = []
+
+
+def _prepare_market():
+    """
+        tracked stocks and positions with their depth in the depth table, as in streaming mode
+    """
+    if len(_stocks) > 0:
+        return
+    _market.prices(_symbols)
+    _market.publish(depth_table)
+    # enough for a few shares of the costliest symbol
+    set_allocation(30000)
+    for symbol in _symbols:
+        stock = StockInfo(symbol)
+        stock.buy_parameters()
+        for price in _ticks.iloc[:100]:
+            stock.update_stock_df(price)
+        _stocks.append(stock)
+    # more than the 10 prices after which whether_buy looks at the positions of the signal
+    for _ in range(12):
+        _market.advance(1)
+        _market.publish(depth_table)
+        for stock in _stocks:
+            stock.update_price()
+    for stock in _stocks:
+        # a stock which was bought before, or else whether_buy only returns True on the first load
+        stock.first_load = False
+        stock.last_buy_price = stock.latest_price * 1.05
+        position = Position(buy_price=stock.latest_price, position_price=stock.latest_price, quantity=stock.quantity,
+                            product_type=ProductType.DELIVERY, position_type=PositionType.LONG, stock=stock)
+        _positions.append(position)
+
+
+@suite.add("kaufman_indicator intraday", operations=INTRADAY_TICKS)
+def kaufman_intraday():
+    return kaufman_indicator(_ticks)
+
+
+@suite.add("kaufman_indicator_matrix daily", operations=DAILY_BARS * SYMBOLS)
+def kaufman_daily():
+    return kaufman_indicator_matrix(_daily)
+
+
+@suite.add("calculate_rsi intraday", operations=INTRADAY_TICKS)
+def rsi_intraday():
+    return calculate_rsi(pd.DataFrame({"line": _ticks}))
+
+
+@suite.add("StreamingSignal.update day", operations=INTRADAY_TICKS)
+def streaming_signal_day():
+    signal = StreamingSignal()
+    for price in _ticks.tolist():
+        signal.update(price)
+
+
+@suite.add("screen_stocks", operations=SYMBOLS)
+def screen():
+    return screen_stocks(_daily, datetime(2024, 5, 10))
+
+
+@suite.add("price_for_quantity depth", operations=1)
+def depth_price():
+    return price_for_quantity(_depth["buy"], 5000)
+
+
+@suite.add("fill_for_amount depth", operations=1)
+def depth_fill():
+    return fill_for_amount(_depth["sell"], 1_000_000)
+
+
+@suite.add("DeliveryTransactionCost", operations=1)
+def delivery_cost():
+    return DeliveryTransactionCost(buying_price=101.5, selling_price=104.25, quantity=37).total_tax_and_charges
+
+
+@suite.add("IntradayTransactionCost", operations=1)
+def intraday_cost():
+    return IntradayTransactionCost(buying_price=101.5, selling_price=104.25, quantity=37).total_tax_and_charges
+
+
+@suite.add("StockInfo.update_price symbols", operations=SYMBOLS, setup=_prepare_market)
+def update_price():
+    for stock in _stocks:
+        stock.update_price()
+
+
+@suite.add("StockInfo.current_price symbols", operations=SYMBOLS, setup=_prepare_market)
+def current_price():
+    for stock in _stocks:
+        _ = stock.current_price
+
+
+@suite.add("StockInfo.buy_parameters symbols", operations=SYMBOLS, setup=_prepare_market)
+def buy_parameters():
+    for stock in _stocks:
+        stock.buy_parameters()
+
+
+@suite.add("StockInfo.whether_buy symbols", operations=SYMBOLS, setup=_prepare_market)
+def whether_buy():
+    for stock in _stocks:
+        stock.whether_buy()
+
+
+@suite.add("Stage.number_of_days positions", operations=SYMBOLS, setup=_prepare_market)
+def number_of_days():
+    for position in _positions:
+        _ = position.number_of_days
+
+
+@suite.add("Stage.set_trigger positions", operations=SYMBOLS, setup=_prepare_market)
+def set_trigger():
+    for position in _positions:
+        position.set_trigger(position.buy_price * 1.01)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="times the functions of the trading loop")
+    parser.add_argument("names", nargs="*", help="benchmarks to be run, all if none is given")
+    parser.add_argument("--save-baseline", action="store_true", help="stores the results as the new baseline")
+    parser.add_argument("--baseline", help="results to compare with instead of the stored baseline")
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT)
+    arguments = parser.parse_args()
+
+    suite.repeat = arguments.repeat
+    # the loop runs on a fixed simulated day so that nothing is written to the price files, and without the
+    # log file so that only the computation is measured
+    clock.set(datetime(2024, 5, 10, 10, 0))
+    logging.disable(logging.INFO)
+    measured = suite.run(arguments.names or None)
+    print(f"results written to {suite.save(measured)}")
+
+    if arguments.save_baseline:
+        print(f"baseline written to {suite.save(measured, suite.baseline_path)}")
+        sys.exit(0)
+    baseline_path = arguments.baseline or suite.baseline_path
+    if not os.path.exists(baseline_path):
+        print(f"no baseline at {baseline_path}, run with --save-baseline to store one")
+        sys.exit(0)
+    with open(baseline_path) as baseline_file:
+        statuses = suite.compare(measured, json.load(baseline_file))
+    # a non zero exit code lets a script stop on a regression
+    sys.exit(1 if "REGRESSION" in statuses.values() else 0)
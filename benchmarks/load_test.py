@@ -0,0 +1,330 @@
+# Runs the real background task against in process fakes of kite, yfinance and mongo for a growing number of
+# symbols on a compressed clock and reports how the time of one iteration of the loop scales, e.g.
+#     python -m benchmarks.load_test
+#     python -m benchmarks.load_test --sizes 100 500 2000 5000 --kite-latency 0.1
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import types
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from itertools import count
+from multiprocessing import get_context
+from threading import Lock
+from time import sleep, perf_counter
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from constants.settings import LOAD_TEST_SIZES, LOAD_TEST_ITERATIONS, LOAD_TEST_KITE_LATENCY, \
+    LOAD_TEST_YFINANCE_LATENCY, LOAD_TEST_DB_LATENCY, BENCHMARK_DIR, SLEEP_INTERVAL, START_TIME
+from utils.clock import clock
+from utils.market_simulator import MarketSimulator
+
+# phases of utils/loop_metrics.py shown in the report, in the order they run
+PHASES = ["snapshot", "quotes", "price_update", "buy_scan", "position_breach", "holding_breach"]
+# every symbol is priced between these, within the band of resolve_symbols
+LOWEST_PRICE, HIGHEST_PRICE = 20, 390
+# capital given to every symbol, above the highest price so that every stock can be bought
+ALLOCATION = 1000
+
+
+@dataclass
+class Latencies:
+    kite: float = LOAD_TEST_KITE_LATENCY
+    yfinance: float = LOAD_TEST_YFINANCE_LATENCY
+    db: float = LOAD_TEST_DB_LATENCY
+
+
+@dataclass
+class CallCounter:
+    """
+        calls made to every fake, counted from any thread
+    """
+    calls: Counter = field(default_factory=Counter)
+    _lock: Lock = field(default_factory=Lock)
+
+    def add(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+
+@dataclass
+class FakeKite:
+    """
+        Answers the calls of KiteConnect made by the loop after sleeping for latency seconds.
+
+        The prices come from a market simulator which moves one step for every SLEEP_INTERVAL of the clock,
+        and every order is filled at once at the last price with its postback sent to the order gateway.
+    """
+    symbols: list[str]
+    latency: float
+    counter: CallCounter
+    simulator: MarketSimulator
+    on_order_update: Callable[[dict], None]
+    _orders: dict[str, dict] = field(default_factory=dict)
+    _order_ids: count = field(default_factory=lambda: count(1))
+
+    def _call(self, name: str):
+        self.counter.add(f"kite.{name}")
+        sleep(self.latency)
+
+    def _sync(self):
+        due = max(int((clock.now() - START_TIME).total_seconds() // SLEEP_INTERVAL), 0)
+        if due > self.simulator.step:
+            self.simulator.advance(due - self.simulator.step)
+
+    def instruments(self, exchange: str) -> list[dict]:
+        self._call("instruments")
+        return [{"instrument_token": token, "tradingsymbol": symbol, "instrument_type": "EQ", "exchange": exchange,
+                 "tick_size": 0.05, "lot_size": 1} for token, symbol in enumerate(self.symbols, 1)]
+
+    def quote(self, instruments: list[str]) -> dict:
+        self._call("quote")
+        self._sync()
+        return self.simulator.quote(instruments)
+
+    def ltp(self, instruments: list[str]) -> dict:
+        self._call("ltp")
+        self._sync()
+        return {instrument: {"last_price": quote["last_price"]} for instrument, quote in
+                self.simulator.quote(instruments).items()}
+
+    def place_order(self, tradingsymbol: str, quantity: int, transaction_type: str, **kwargs) -> str:
+        self._call("place_order")
+        order_id = str(next(self._order_ids))
+        order = {"order_id": order_id, "tradingsymbol": tradingsymbol, "transaction_type": transaction_type,
+                 "quantity": quantity, "filled_quantity": quantity, "status": "COMPLETE",
+                 "average_price": self.simulator.price(tradingsymbol)}
+        self._orders[order_id] = order
+        self.on_order_update(order)
+        return order_id
+
+    def order_history(self, order_id: str) -> list[dict]:
+        self._call("order_history")
+        return [self._orders[order_id]]
+
+
+def fake_yfinance(latency: float, counter: CallCounter, seed: int = 0) -> types.ModuleType:
+    """
+    module which stands in for yfinance, download gives random walks of the Open and Close of every ticker
+    :param latency: seconds taken by every download
+    :param counter: counter of the calls
+    :param seed: seed of the random walks
+    :return: module with download
+    """
+    def download(tickers: list[str], interval: str, start: datetime | None = None, period: str | None = None,
+                 **kwargs) -> pd.DataFrame:
+        from utils.history_cache import PERIOD_DAYS
+        counter.add("yfinance.download")
+        sleep(latency)
+        end = datetime.now()
+        start = start or end - timedelta(days=PERIOD_DAYS[period])
+        if interval == "1d":
+            index = pd.bdate_range(start, end, normalize=True)
+        else:
+            index = pd.DatetimeIndex([time for day in pd.bdate_range(start, end, normalize=True)
+                                      for time in pd.date_range(day + timedelta(hours=9, minutes=15), periods=375,
+                                                                freq="1min")])
+        generator = np.random.default_rng(seed)
+        prices = 100 * np.exp(np.cumsum(generator.normal(0, 0.01, (len(index), len(tickers))), axis=0))
+        frame = pd.DataFrame(prices, index=index, columns=list(tickers))
+        return pd.concat({"Open": frame, "Close": frame}, axis=1)
+
+    module = types.ModuleType("yfinance")
+    module.download = download
+    return module
+
+
+@dataclass
+class LatentCollection:
+    """
+        collection of the in memory database whose calls take latency seconds
+    """
+    collection: object
+    latency: float
+    counter: CallCounter
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.collection, name)
+        if not asyncio.iscoroutinefunction(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            self.counter.add(f"db.{name}")
+            await asyncio.sleep(self.latency)
+            return await attribute(*args, **kwargs)
+        return call
+
+
+@dataclass
+class LatentDatabase:
+    database: object
+    latency: float
+    counter: CallCounter
+
+    def __getitem__(self, name: str) -> LatentCollection:
+        return LatentCollection(self.database[name], self.latency, self.counter)
+
+
+@dataclass
+class LoadTestResult:
+    symbols: int
+    iterations: int
+    startup: float
+    wall_mean: float
+    wall_p95: float
+    wall_max: float
+    overruns: int
+    phases: dict[str, float]
+    calls: dict[str, int]
+    peak_rss_mb: float
+
+
+def _symbols(size: int) -> list[str]:
+    return [f"LOAD{number:05d}" for number in range(size)]
+
+
+def _run(size: int, iterations: int, latencies: Latencies, holidays: str) -> LoadTestResult:
+    """
+    runs the loop for `iterations` iterations after screening, in a fresh process so that the peak memory
+    belongs to this size only
+    """
+    directory = tempfile.mkdtemp(prefix="load_test_")
+    os.makedirs(f"{directory}/temp")
+    shutil.copy(holidays, f"{directory}/temp/holidays.json")
+    pd.DataFrame({"Symbol": _symbols(size)}).to_csv(f"{directory}/temp/EQUITY_NSE.csv", index=False)
+    os.chdir(directory)
+
+    counter = CallCounter()
+    # the fakes are put in place before anything imports the real clients
+    import constants.settings as settings
+    settings.DB_IN_MEMORY = True
+    sys.modules["yfinance"] = fake_yfinance(latencies.yfinance, counter)
+
+    import services.background_task as background
+    from utils import nr_db
+    from utils.kite_scheduler import kite_scheduler
+    from utils.loop_metrics import loop_metrics
+    from utils.order_gateway import order_gateway
+
+    nr_db.DATABASE = LatentDatabase(nr_db.DATABASE, latencies.db, counter)
+    kite_scheduler.kite = FakeKite(
+        _symbols(size), latencies.kite, counter,
+        MarketSimulator(step_seconds=0, session_steps=10 ** 9, lowest_price=LOWEST_PRICE, highest_price=HIGHEST_PRICE),
+        order_gateway.on_order_update
+    )
+
+    screen = background.filter_stocks
+
+    def filter_stocks(obtained_stock_list: list[str]) -> list[str]:
+        # the screening is run for its cost but every symbol is tracked so that the loop has `size` stocks
+        return list(dict.fromkeys(screen(obtained_stock_list) + [f"{symbol}.NS" for symbol in obtained_stock_list]))
+
+    background.filter_stocks = filter_stocks
+    background.CAPITAL = size * ALLOCATION
+
+    async def stop_after_iterations():
+        # the first iteration screens the stocks and starts tracking them, it is counted in the startup
+        while len(loop_metrics.iterations) < iterations + 1:
+            await asyncio.sleep(0.01)
+        settings.set_end_process(True)
+
+    async def main() -> float:
+        started = perf_counter()
+        stopper = asyncio.create_task(stop_after_iterations())
+        await background.background_task()
+        stopper.cancel()
+        return perf_counter() - started
+
+    clock.set(START_TIME + timedelta(seconds=1))
+    total = asyncio.run(main())
+
+    measured = list(loop_metrics.iterations)[1:iterations + 1]
+    walls = np.array([iteration.wall for iteration in measured])
+    shutil.rmtree(directory, ignore_errors=True)
+    return LoadTestResult(
+        symbols=size,
+        iterations=len(measured),
+        startup=total - walls.sum(),
+        wall_mean=float(walls.mean()),
+        wall_p95=float(np.percentile(walls, 95)),
+        wall_max=float(walls.max()),
+        overruns=int((walls > SLEEP_INTERVAL).sum()),
+        phases={phase: float(np.mean([iteration.phases.get(phase, 0.0) for iteration in measured]))
+                for phase in PHASES},
+        calls=dict(sorted(counter.calls.items())),
+        # kilobytes on linux and bytes on mac
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == "darwin" else
+                                                                          2 ** 10),
+    )
+
+
+def maximum_symbols(results: list[LoadTestResult]) -> int | None:
+    """
+    largest number of symbols whose p95 iteration fits in SLEEP_INTERVAL, extrapolated linearly from the two
+    largest sizes
+    :param results: results ordered by size
+    :return: number of symbols, None if it can not be estimated
+    """
+    if len(results) < 2:
+        return None
+    first, last = results[-2], results[-1]
+    slope = (last.wall_p95 - first.wall_p95) / (last.symbols - first.symbols)
+    if slope <= 0:
+        return None
+    return int(last.symbols + (SLEEP_INTERVAL - last.wall_p95) / slope)
+
+
+def report(results: list[LoadTestResult]) -> str:
+    lines = [f"{'symbols':>8} {'mean':>8} {'p95':>8} {'max':>8} {'overrun':>8} "
+             + " ".join(f"{phase:>15}" for phase in PHASES) + f" {'rss mb':>8} {'startup':>8}"]
+    for result in results:
+        lines.append(f"{result.symbols:>8} {result.wall_mean:>8.3f} {result.wall_p95:>8.3f} {result.wall_max:>8.3f} "
+                     f"{result.overruns:>8} " + " ".join(f"{result.phases[phase]:>15.3f}" for phase in PHASES)
+                     + f" {result.peak_rss_mb:>8.1f} {result.startup:>8.1f}")
+    for result in results:
+        lines.append(f"{result.symbols} symbols, calls: " +
+                     ", ".join(f"{name} {calls}" for name, calls in result.calls.items()))
+    estimate = maximum_symbols(results)
+    if estimate is not None:
+        lines.append(f"about {estimate} symbols fit in the SLEEP_INTERVAL of {SLEEP_INTERVAL}s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="scales the background task on fakes of kite, yfinance and mongo")
+    parser.add_argument("--sizes", type=int, nargs="*", default=LOAD_TEST_SIZES)
+    parser.add_argument("--iterations", type=int, default=LOAD_TEST_ITERATIONS)
+    parser.add_argument("--kite-latency", type=float, default=LOAD_TEST_KITE_LATENCY)
+    parser.add_argument("--yfinance-latency", type=float, default=LOAD_TEST_YFINANCE_LATENCY)
+    parser.add_argument("--db-latency", type=float, default=LOAD_TEST_DB_LATENCY)
+    arguments = parser.parse_args()
+
+    latencies = Latencies(arguments.kite_latency, arguments.yfinance_latency, arguments.db_latency)
+    holidays_path = os.path.abspath("temp/holidays.json")
+    load_results = []
+    for symbol_count in sorted(arguments.sizes):
+        # each size in a new process, the modules keep state e.g. the tracked stocks and the peak memory
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+            load_results.append(executor.submit(_run, symbol_count, arguments.iterations, latencies,
+                                                holidays_path).result())
+        print(f"{symbol_count} symbols: p95 iteration {load_results[-1].wall_p95:.3f}s", flush=True)
+
+    print(report(load_results))
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    path = f"{BENCHMARK_DIR}/load_test_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(path, "w") as file:
+        json.dump({"machine": platform.platform(), "python": platform.python_version(), "latencies": asdict(latencies),
+                   "sleep_interval": SLEEP_INTERVAL, "results": [asdict(result) for result in load_results]},
+                  file, indent=2)
+    print(f"written to {path}")
@@ -0,0 +1,9 @@
+from enum import Enum
+
+
+class RequestPriority(Enum):
+    # lower value goes first when the requests wait for the rate limit
+    ORDER = 0
+    POSITION = 1
+    WATCHLIST = 2
+    SCREENING = 3
@@ -1,9 +1,11 @@
 from kiteconnect import KiteConnect
 
 from constants.kite_credentials import API_KEY
+from constants.settings import KITE_REQUEST_TIMEOUT
 
 kite_context = KiteConnect(
-    api_key=API_KEY
+    api_key=API_KEY,
+    timeout=KITE_REQUEST_TIMEOUT
 )
 
 
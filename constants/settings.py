@@ -27,7 +27,117 @@ INTRADAY_INCREMENTAL_RETURN = 0.004
 
 EXPECTED_MINIMUM_MONTHLY_RETURN = 0.06  # minimum monthly_return which is expected
 
+# market quotes are fetched once per loop for all the stocks and shared by every consumer
+QUOTE_TTL = 15  # seconds after which a quote is fetched again
+QUOTE_BATCH_SIZE = 500  # maximum instruments allowed by kite in one quote call
+
+# market data can be streamed from the kite websocket instead of polling the quotes every SLEEP_INTERVAL
+STREAMING_MODE = False
+TICKER_ROOT_URI = None  # None uses kite, "ws://127.0.0.1:8765" uses utils/streaming/replay_server.py
+TICK_RECORD_PATH = None  # e.g. "temp/ticks.jsonl" to record the received ticks so that they can be replayed
+
+# price history kept in memory for every tracked stock
+PRICE_BUFFER_CAPACITY = 2048  # a full trading day at 30 sec interval is around 750 prices
+PERSIST_PRICES = True  # whether the prices are appended to temp/<symbol>.csv
+PRICE_FLUSH_EVERY = 10  # number of new prices after which they are appended to the file
+
+# yfinance history is cached locally and only the missing days are downloaded
+HISTORY_CACHE_DIR = "temp/history"
+OFFLINE_MODE = False  # when True the history is read only from the cache, used for tests and backtests
+
+# blocking broker, http and file calls are run in a thread pool so that the event loop is never blocked
+BLOCKING_POOL_SIZE = 16
+BLOCKING_CALL_TIMEOUT = 20  # seconds, kept below SLEEP_INTERVAL so that one slow stock does not stall the loop
+BLOCKING_CALL_RETRIES = 2
+BLOCKING_RETRY_BACKOFF = 0.5  # seconds, doubled after every retry
+
+# orders are placed concurrently through utils/order_gateway.py and reconciled with their fills
+ORDER_RATE_LIMIT = 10  # orders per second allowed by kite
+ORDER_POLL_INTERVAL = 0.5  # seconds between order history checks
+ORDER_FILL_TIMEOUT = 15  # seconds after which an order which is still open is cancelled, it is followed till final
+ORDER_CANCEL_GRACE = 5  # seconds the caller waits for that cancel before it goes on with what was filled so far
+# seconds for a call of the loop which may place an order, the wait for the order and the quotes around it
+ORDER_CALL_TIMEOUT = ORDER_FILL_TIMEOUT + ORDER_CANCEL_GRACE + 2 * BLOCKING_CALL_TIMEOUT
+PAPER_BROKER = False  # orders are filled against the market depth by utils/paper_broker.py instead of kite
+PAPER_FILL_LATENCY = 0.2  # seconds after which the paper broker fills an order and sends its postback
+
+# every kite call goes through utils/kite_scheduler.py which keeps each endpoint within its rate limit
+KITE_RATE_LIMITS = {"quote": 1, "order": 10, "default": 10}  # requests per second for each endpoint
+KITE_THROTTLE_RETRIES = 2  # times a request is sent again if kite still answers with too many requests
+KITE_TOKEN_TIMEOUT = 5  # seconds a request waits for a token of its endpoint before it fails
+KITE_REQUEST_TIMEOUT = 5  # seconds kite is given to answer a request
+
+# instruments dump of the exchange kept by utils/instrument_master.py, refreshed once a day
+INSTRUMENTS_DIR = "temp/instruments"
+INSTRUMENTS_SOURCE_FILE = None  # local csv in the format of kite's instruments dump, used instead of kite if set
+
+# the universe is resolved in blocks by utils/tracking_components/verify_symbols.py
+SYMBOL_BLOCK_SIZE = 300  # symbols per ltp call, twice as many instruments if the -BE forms have to be probed
+SYMBOL_RESOLVE_CONCURRENCY = 4  # ltp calls handed to the thread pool at a time
+
+# the changed fields of the models are written in the background by utils/write_behind.py
+PERSIST_INTERVAL = 5  # seconds between the bulk writes
+PERSIST_MAX_PENDING = 1000  # documents waiting to be written after which the callers are held
+PERSIST_BACKPRESSURE_TIMEOUT = 5  # maximum seconds a caller is held
+DB_IN_MEMORY = False  # uses the in process stand in of utils/memory_db.py instead of the cluster
+DB_PAGE_SIZE = 500  # documents fetched and decoded at a time
+
+# the account is snapshot by utils/account_snapshot.py and restored on /start after a restart
+SNAPSHOT_PATH = "temp/account.snapshot"
+SNAPSHOT_INTERVAL = 30  # seconds between the snapshots
+
+# logs are written by a single listener thread, see utils/logger.py
+LOG_PATH = "temp/stock_action.log"
+EVENT_LOG_PATH = "temp/events.jsonl"  # json lines of the orders and, if LOG_TICK_EVENTS, the ticks
+LOG_HOT_SAMPLE_EVERY = 10  # one in these many messages logged on every tick is kept, 0 drops all of them
+LOG_TICK_EVENTS = False
+
+# a day of minute bars is replayed through the account by services/backtest.py on a simulated clock
+BACKTEST_CAPITAL = 30000  # split equally among the symbols like the screened stocks of the day
+BACKTEST_SPREAD = 0.001  # fraction of the price between the best bid and the best offer of the simulated depth
+BACKTEST_DEPTH_LEVELS = 5
+BACKTEST_LEVEL_QUANTITY = 5000  # quantity at every level of the simulated depth
+
+# strategy parameters are tuned by backtesting a day for many of their values with services/parameter_sweep.py
+SWEEP_RESULTS_DIR = "temp/sweeps"
+SWEEP_WORKERS = None  # processes running the backtests, all the cores if None
+
+# a deterministic market of utils/market_simulator.py can stand in for kite quotes and the DEBUG price server
+MARKET_SIMULATOR = False  # quotes and DEBUG prices are taken from the simulator in process, no http or kite
+DEBUG_PRICE_SERVER = "http://127.0.0.1:8082"  # python -m utils.market_simulator --port 8082 serves the same api
+DEBUG_PRICE_TIMEOUT = 5  # seconds the price server is given to answer
+SIMULATOR_SEED = 0
+SIMULATOR_STEP_SECONDS = SLEEP_INTERVAL  # wall clock seconds after which the prices move one step
+SIMULATOR_SESSION_STEPS = 750  # steps after which the prices end, a trading day at 30 sec interval
+SIMULATOR_VOLATILITY = 0.002  # standard deviation of the log return of one step
+SIMULATOR_DEPTH_LEVELS = 5
+SIMULATOR_LEVEL_QUANTITY = 2000  # largest quantity at one level of the depth
+
+# functions of the trading loop are timed by benchmarks/hot_path.py and compared with a stored baseline
+BENCHMARK_DIR = "temp/benchmarks"
+BENCHMARK_REPEAT = 5  # timings of every benchmark of which the median is kept
+BENCHMARK_REGRESSION_THRESHOLD = 0.2  # fraction by which the median can be slower than the baseline
+
+# the wall time of every iteration of the background task and of its phases is kept by utils/loop_metrics.py
+LOOP_METRICS_HISTORY = 1000  # latest iterations kept
+
+# metrics of the running engine are kept by utils/metrics.py and served on /metrics in the Prometheus format
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # seconds, for the calls
+METRICS_LOOP_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120]  # seconds, for the loop and its phases
+
+# the stages of the trading decisions are traced by utils/tracing.py and read from /traces
+TRACE_SAMPLE_RATE = 0.0  # fraction of the decisions traced, 0 turns tracing off, can be changed on /traces/sample
+TRACE_RING_SIZE = 20000  # latest spans kept
+
+# benchmarks/load_test.py runs the background task against in process fakes of kite, yfinance and mongo
+LOAD_TEST_SIZES = [100, 500, 2000]  # number of symbols in the universe of every run
+LOAD_TEST_ITERATIONS = 10  # iterations of the loop measured in every run
+LOAD_TEST_KITE_LATENCY = 0.05  # seconds taken by every kite call
+LOAD_TEST_YFINANCE_LATENCY = 0.5  # seconds taken by every yfinance download
+LOAD_TEST_DB_LATENCY = 0.002  # seconds taken by every database operation
+
 # total investment
+CAPITAL = 30000  # split equally among the screened stocks of the day
 MAXIMUM_STOCKS = 3
 MAXIMUM_ALLOCATION = 450
 
@@ -0,0 +1,60 @@
+from dataclasses import dataclass, fields
+
+from constants.settings import DELIVERY_INITIAL_RETURN, DELIVERY_INCREMENTAL_RETURN, INTRADAY_INITIAL_RETURN, \
+    INTRADAY_INCREMENTAL_RETURN, EXPECTED_MINIMUM_MONTHLY_RETURN
+
+
+@dataclass
+class StrategyParameters:
+    """
+        Constants of the strategy which the models read at run time so that a parameter sweep can change them.
+
+        The returns default to the ones in constants/settings.py and the thresholds to the values which were
+        written in the models.
+    """
+    delivery_initial_return: float = DELIVERY_INITIAL_RETURN
+    delivery_incremental_return: float = DELIVERY_INCREMENTAL_RETURN
+    intraday_initial_return: float = INTRADAY_INITIAL_RETURN
+    intraday_incremental_return: float = INTRADAY_INCREMENTAL_RETURN
+    expected_minimum_monthly_return: float = EXPECTED_MINIMUM_MONTHLY_RETURN
+    # a stock which was sold is bought again only below this fraction of the last buying price, see whether_buy
+    rebuy_discount: float = 0.02
+    # the signal has to be this fraction above its minimum to be taken as rising, see StreamingSignal
+    signal_margin: float = 0.002
+    # loss as a fraction of the allocation after which a falling stock is sold on the day it was bought
+    day1_loss_threshold: float = 0.005
+    # falls in a row after which such a stock is sold
+    continuous_down_limit: int = 2
+    # the trigger is sold only below numerator / denominator times it, see breached, the two are kept apart so
+    # that the bound is worked out in the same order as it always was and the default gives the same floats
+    trigger_band_numerator: float = 4
+    trigger_band_denominator: float = 3
+    # rolling window in days and the weights of its maximum and minimum in the medium line used in screening
+    screen_window: int = 60
+    screen_maximum_weight: float = 8 / 10
+    screen_minimum_weight: float = 2 / 10
+
+    def update(self, **values):
+        """
+        changes the given parameters
+        :param values: name of the parameter and its new value
+        :return: None
+        """
+        names = {item.name for item in fields(self)}
+        for name, value in values.items():
+            if name not in names:
+                raise TypeError(f"unknown strategy parameter {name}")
+            setattr(self, name, value)
+
+    def reset(self):
+        """
+            goes back to the default of every parameter
+        """
+        for item in fields(self):
+            setattr(self, item.name, item.default)
+
+    def as_dict(self) -> dict:
+        return {item.name: getattr(self, item.name) for item in fields(self)}
+
+
+strategy_parameters = StrategyParameters()
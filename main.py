@@ -7,9 +7,14 @@ from kiteconnect.exceptions import InputException
 from constants.global_contexts import set_access_token
 
 from services.background_task import background_task
-from constants.global_contexts import kite_context
+from utils.kite_scheduler import kite_scheduler
+from utils.executor import run_blocking
 from utils.logger import get_logger
+from utils.write_behind import write_behind
 from routes.stock_input import stocks_input
+from routes.order_postback import order_postback
+from routes.metrics import metrics_export
+from routes.traces import trace_export
 
 from utils.tracking_components.verify_symbols import get_correct_symbol
 
@@ -52,7 +57,7 @@ async def start_process():
     """
     try:
         # to test whether the access toke has been set after login
-        _ = kite_context.ltp("NSE:INFY")
+        _ = await run_blocking(kite_scheduler.ltp, "NSE:INFY")
 
         # starting the background task which will run the entire process
         app.add_background_task(background_task)
@@ -70,10 +75,17 @@ async def stop_background_tasks():
     global logger
     for task in app.background_tasks:
         task.cancel()
+    # whatever has changed since the last write is not lost
+    await write_behind.stop()
     logger.info("STOPPED ALL BACKGROUND SERVICES")
     return {"message": "All task cancelled"}
 
-resource_list: list[Blueprint] = [stocks_input]
+@app.after_serving
+async def flush_on_shutdown():
+    await write_behind.stop()
+
+
+resource_list: list[Blueprint] = [stocks_input, order_postback, metrics_export, trace_export]
 
 for resource in resource_list:
     app.register_blueprint(blueprint=resource)
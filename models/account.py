@@ -9,6 +9,8 @@ from models.stages.position import Position
 from models.stock_info import StockInfo
 from utils.logger import get_logger
 from utils.take_position import long
+from utils.tracing import traced
+from utils.write_behind import write_behind
 
 logger: Logger = get_logger(__name__)
 
@@ -19,12 +21,15 @@ class Account:
     positions: dict[str, Position] = field(default_factory=dict, init=False)
     holdings: dict[str, Holding] = field(default_factory=dict, init=False)
 
-    def buy_stocks(self):
+    # the loop checks one stock at a time, so each check is a decision of its own stock
+    @traced("buy_stocks", root=True, symbol=lambda account, stock_keys=None: stock_keys[0] if stock_keys else None)
+    def buy_stocks(self, stock_keys: list[str] | None = None):
         """
         if it satisfies all the buying criteria then it buys the stock
+        :param stock_keys: stocks to be checked, all the tracked stocks are checked if None
         :return: None
         """
-        for stock_key in list(self.stocks_to_track.keys()):
+        for stock_key in list(self.stocks_to_track.keys()) if stock_keys is None else stock_keys:
             if stock_key not in self.positions.keys() and stock_key not in self.holdings.keys():
                 if not DEBUG:
                     sell_orders: list = self.stocks_to_track[stock_key].get_quote["sell"]
@@ -38,13 +43,18 @@ class Account:
 
                 quantity, buy_price = self.stocks_to_track[stock_key].buy_parameters()
                 if self.stocks_to_track[stock_key].whether_buy():
-                    if long(
+                    order = long(
                         symbol=self.stocks_to_track[stock_key].stock_name,
                         quantity=int(quantity),
                         product_type=ProductType.DELIVERY,
                         exchange=self.stocks_to_track[stock_key].exchange
-                    ):
-                        logger.info(f"{self.stocks_to_track[stock_key].stock_name} has been bought @ {self.stocks_to_track[stock_key].latest_price}.")
+                    )
+                    if order:
+                        # the position is taken at the price and quantity which were actually filled
+                        buy_price = order.average_price or buy_price
+                        quantity = order.filled_quantity
+                        self.stocks_to_track[stock_key].quantity = quantity
+                        logger.info(f"{self.stocks_to_track[stock_key].stock_name} has been bought @ {buy_price} Quantity:{quantity}.")
 
                         self.stocks_to_track[stock_key].in_position = True  # now it will look for buy orders
 
@@ -54,6 +64,7 @@ class Account:
                         # never enter and there will be a loss
                         self.stocks_to_track[stock_key].first_load = False
                         self.stocks_to_track[stock_key].last_buy_price = buy_price
+                        write_behind.mark(self.stocks_to_track[stock_key], "in_position", "first_load", "last_buy_price")
                         self.positions[stock_key] = Position(
                             buy_price=buy_price,
                             stock=self.stocks_to_track[stock_key],
@@ -1,32 +1,136 @@
+import gc
 import inspect
+from dataclasses import dataclass, fields
 from enum import EnumType
-from typing import Any
+from functools import cache
+from typing import Any, Callable
 
+from constants.settings import DB_PAGE_SIZE
 from utils.nr_db import connect_to_collection
 
 
-def jsonify(dataclass_obj):
-    schema: dict = dataclass_obj.schema
-    json_data = {}
-    for key in schema.keys():
-        if isinstance(schema[key], EnumType):
-            json_data[key] = getattr(dataclass_obj, key).name
-        elif inspect.isclass(schema[key]):
-            json_data[key] = jsonify(getattr(dataclass_obj, key))
+@dataclass(frozen=True)
+class SchemaCodec:
+    """
+        Encoder and decoder of one model generated from its schema.
+
+        The schema is read once per class, the enums and nested models are resolved then and the
+        encode and decode functions are generated as plain python with one line per field, so nothing is
+        looked up while converting a document.
+    """
+    model: type
+    schema: dict
+    encode: Callable[[Any], dict]
+    decode: Callable[[dict], Any]
+    field_encoders: dict[str, Callable[[Any], Any]]
+    field_decoders: dict[str, Callable[[Any], Any]]
+
+    def decode_many(self, documents: list[dict]) -> list:
+        """
+            decodes a page of documents, the garbage collector is paused meanwhile since every model
+            refers to itself through its db functions and creating many of them keeps triggering collections
+            although all of them are kept
+        """
+        decode = self.decode
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return [decode(document) for document in documents]
+        finally:
+            if enabled:
+                gc.enable()
+
+    def decode_fields(self, document: dict, keys) -> dict:
+        """
+            decodes only the given fields, used with projections where the model can not be created
+        """
+        return {key: self.field_decoders[key](document[key]) for key in keys if key in document}
+
+
+def _model_schema(model: type) -> dict:
+    schema_field = next(item for item in fields(model) if item.name == "schema")
+    return schema_field.default_factory()
+
+
+def _identity(value):
+    return value
+
+
+@cache
+def compile_schema(model: type) -> SchemaCodec:
+    """
+    generates the codec of the model, it is cached so it is generated once per class
+    :param model: dataclass with a schema field e.g. StockInfo, Holding
+    :return: codec of the model
+    """
+    schema = _model_schema(model)
+    init_fields = {item.name for item in fields(model) if item.init}
+    namespace = {"model": model}
+    field_encoders, field_decoders = {}, {}
+    encode_lines, init_lines, late_lines = [], [], []
+
+    for key, schema_type in schema.items():
+        if isinstance(schema_type, EnumType):
+            namespace[f"enum_{key}"] = schema_type
+            encoded = f"(obj.{key}.name if obj.{key} is not None else None)"
+            decoded = f"(enum_{key}[str(value)] if value is not None else None)"
+            field_encoders[key] = lambda value: value.name if value is not None else None
+            field_decoders[key] = lambda value, enum=schema_type: enum[str(value)] if value is not None else None
+        elif inspect.isclass(schema_type):
+            nested = compile_schema(schema_type)
+            namespace[f"encode_{key}"], namespace[f"decode_{key}"] = nested.encode, nested.decode
+            encoded = f"(encode_{key}(obj.{key}) if obj.{key} is not None else None)"
+            decoded = f"(decode_{key}(value) if value is not None else None)"
+            field_encoders[key] = lambda value, encode=nested.encode: encode(value) if value is not None else None
+            field_decoders[key] = lambda value, decode=nested.decode: decode(value) if value is not None else None
         else:
-            json_data[key] = getattr(dataclass_obj, key)
-    return json_data
+            encoded, decoded = f"obj.{key}", "value"
+            field_encoders[key] = field_decoders[key] = _identity
+
+        encode_lines.append(f"        {key!r}: {encoded},")
+        target = init_lines if key in init_fields else late_lines
+        assignment = f"kwargs[{key!r}]" if key in init_fields else f"obj.{key}"
+        target.append(f"    if {key!r} in document:\n        value = document[{key!r}]\n        {assignment} = {decoded}")
+
+    source = "\n".join([
+        "def encode(obj):",
+        "    return {",
+        *encode_lines,
+        "    }",
+        "",
+        "def decode(document):",
+        "    kwargs = {}",
+        *init_lines,
+        "    obj = model(**kwargs)",
+        # the fields which are not arguments of the constructor e.g. trigger are set after creating the object
+        *late_lines,
+        "    return obj",
+    ])
+    exec(compile(source, f"<schema {model.__name__}>", "exec"), namespace)
+    return SchemaCodec(model, schema, namespace["encode"], namespace["decode"], field_encoders, field_decoders)
+
+
+def jsonify_field(dataclass_obj, key: str):
+    """
+        value of one field of the schema as it is saved in the database
+    """
+    return compile_schema(type(dataclass_obj)).field_encoders[key](getattr(dataclass_obj, key))
+
+
+def jsonify(dataclass_obj):
+    return compile_schema(type(dataclass_obj)).encode(dataclass_obj)
+
+
+def document_filter(dataclass_obj) -> dict:
+    """
+        filter of the document of the object, _id if it is in the schema else the first field of the schema
+    """
+    key = "_id" if "_id" in dataclass_obj.schema else next(iter(dataclass_obj.schema))
+    return {key: getattr(dataclass_obj, key)}
 
 
 def objectify(dataclass_obj, data):
-    final_obj = dataclass_obj(**data)
-    for key in final_obj.schema.keys():
-        if inspect.isclass(final_obj.schema[key]):
-            if isinstance(final_obj.schema[key], EnumType):
-                setattr(final_obj, key, final_obj.schema[key][str(getattr(final_obj, key))])
-            else:
-                setattr(final_obj, key, final_obj.schema[key](**getattr(final_obj, key)))
-    return final_obj
+    return compile_schema(dataclass_obj).decode(data)
 
 
 def get_save_to_db(collection_name: str, model_as_self):
@@ -39,15 +143,21 @@ def get_save_to_db(collection_name: str, model_as_self):
     return save_to_db
 
 
-async def find_by_name(collection_name: str, model_as_cls, search_dict):
+async def find_by_name(collection_name: str, model_as_cls, search_dict, projection: list[str] | None = None):
     """
         This function is used to find a collection by trade symbol
 
+        If projection is given then only those fields are fetched and returned decoded in a dictionary
+
         Note: Here object id is taken as string and code is written for 2 layers of nesting
     """
+    codec = compile_schema(model_as_cls)
     with connect_to_collection(collection_name) as collection:
-        data = await collection.find_one(search_dict)
-        return objectify(model_as_cls, data) if data else None
+        if projection is None:
+            data = await collection.find_one(search_dict)
+            return codec.decode(data) if data else None
+        data = await collection.find_one(search_dict, {key: 1 for key in projection})
+        return codec.decode_fields(data, projection) if data else None
 
 
 def get_delete_from_db(collection_name: str, model_as_self):
@@ -71,16 +181,26 @@ def get_update_in_db(collection_name: str, model_as_self):
     return update_in_db
 
 
-async def retrieve_all_services(collection_name, model_as_cls):
+async def retrieve_all_services(collection_name, model_as_cls, projection: list[str] | None = None):
     """
         If limit or skip is provided then it provides that many element
         Otherwise it provides total list of document
+
+        The documents are fetched and decoded a page at a time. If projection is given then only those
+        fields are fetched and each document is returned decoded in a dictionary
     """
+    codec = compile_schema(model_as_cls)
     document_list = []
     with connect_to_collection(collection_name) as collection:
-        cursor = collection.find({})
-        async for document in cursor:
-            document_list.append(objectify(model_as_cls, document) if document else None)
+        if projection is None:
+            cursor = collection.find({})
+        else:
+            cursor = collection.find({}, {key: 1 for key in projection})
+        while page := await cursor.to_list(length=DB_PAGE_SIZE):
+            if projection is None:
+                document_list.extend(codec.decode_many(page))
+            else:
+                document_list.extend(codec.decode_fields(document, projection) for document in page)
         return document_list
 
 
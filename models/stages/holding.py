@@ -9,8 +9,9 @@ from constants.enums.product_type import ProductType
 from models.stock_info import StockInfo
 from models.stock_stage import Stage
 from models.db_models import get_save_to_db, get_delete_from_db, get_update_in_db
+from utils.write_behind import write_behind
 
-from constants.settings import DELIVERY_INCREMENTAL_RETURN
+from constants.strategy_parameters import strategy_parameters
 
 
 def get_schema():
@@ -21,7 +22,8 @@ def get_schema():
         "quantity": "int",
         "product_type": ProductType,
         "position_type": PositionType,
-        "stock": StockInfo
+        "stock": StockInfo,
+        "trigger": "float"
     }
 
 
@@ -40,7 +42,10 @@ class Holding(Stage):
         self.delete_from_db = get_delete_from_db(self.COLLECTION, self)
         self.update_in_db = get_update_in_db(self.COLLECTION, self)
 
+    def mark_changed(self, *keys: str):
+        write_behind.mark(self, *keys)
+
     @property
     def incremental_return(self):
-        return DELIVERY_INCREMENTAL_RETURN
+        return strategy_parameters.delivery_incremental_return
 
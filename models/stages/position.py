@@ -5,7 +5,7 @@ from models.stock_info import StockInfo
 
 from constants.enums.position_type import PositionType
 from constants.enums.product_type import ProductType
-from constants.settings import INTRADAY_INCREMENTAL_RETURN
+from constants.strategy_parameters import strategy_parameters
 
 
 @dataclass
@@ -13,4 +13,4 @@ class Position(Stage):
 
     @property
     def incremental_return(self):
-        return INTRADAY_INCREMENTAL_RETURN
+        return strategy_parameters.intraday_incremental_return
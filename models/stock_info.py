@@ -1,21 +1,46 @@
+import pickle
 from datetime import datetime
 from logging import Logger
-from time import sleep
+from time import sleep, perf_counter
 from dataclasses import dataclass, field
 from typing import Callable
-import numpy as np
 
 import requests
-import pandas as pd
 
-from constants.global_contexts import kite_context
-from constants.settings import DEBUG, set_end_process, get_allocation
+from constants.enums.request_priority import RequestPriority
+from constants.settings import DEBUG, set_end_process, get_allocation, MARKET_SIMULATOR, DEBUG_PRICE_SERVER, \
+    DEBUG_PRICE_TIMEOUT
+from constants.strategy_parameters import strategy_parameters
 from models.db_models import get_save_to_db, get_delete_from_db, get_update_in_db
-from utils.indicators.kaufman_indicator import kaufman_indicator
+from utils.clock import clock
+from utils.depth_walk import price_for_quantity, fill_for_amount
+from utils.indicators.streaming import StreamingSignal
+from utils.market_simulator import market_simulator
+from utils.metrics import metrics
+from utils.price_buffer import PriceBuffer
+from utils.quote_snapshot import quote_snapshot
+from utils.streaming.depth_table import depth_table
+from utils.tracing import tracer, traced
 from utils.logger import get_logger
 
 logger: Logger = get_logger(__name__)
 
+price_seconds = metrics.histogram("symbol_price_seconds", "time taken to get the price of one stock, retries included").labels()
+price_retries = metrics.counter("symbol_price_retries_total", "failed attempts to get the price of a stock").labels()
+
+# when set the quotes are read from it instead of the websocket and kite, e.g. the simulated exchange of a backtest
+_quote_source: Callable[[str], dict | None] | None = None
+
+
+def set_quote_source(source: Callable[[str], dict | None] | None):
+    """
+    reads the quotes from the given function, None reads them from the websocket and kite again
+    :param source: takes the instrument e.g. NSE:INFY and returns its depth or None if it has none
+    :return: None
+    """
+    global _quote_source
+    _quote_source = source
+
 
 def get_schema():
     return {
@@ -23,7 +48,9 @@ def get_schema():
         "exchange": "str",
         "wallet": "float",
         "created_at": "datetime",
-        "first_load": "bool"
+        "first_load": "bool",
+        "in_position": "bool",
+        "last_buy_price": "float"
     }
 
 
@@ -38,8 +65,9 @@ class StockInfo:
     latest_price: float = field(default=None, init=False)
     low: float = field(default=None, init=False)
     high: float = field(default=None, init=False)
-    created_at: datetime = field(default_factory=datetime.now)
-    __result_stock_df: pd.DataFrame | None = field(default=None, init=False)
+    created_at: datetime = field(default_factory=clock.now)
+    __price_buffer: PriceBuffer | None = field(default=None, init=False)
+    __indicators: StreamingSignal = field(default_factory=StreamingSignal, init=False)
     schema: dict = field(default_factory=get_schema, init=False)
     save_to_db: Callable = field(default=None, init=False)
     delete_from_db: Callable = field(default=None, init=False)
@@ -54,45 +82,62 @@ class StockInfo:
         self.delete_from_db = get_delete_from_db(self.COLLECTION, self)
         self.update_in_db = get_update_in_db(self.COLLECTION, self)
 
+    @property
+    def instrument(self) -> str:
+        return f"{self.exchange}:{self.stock_name}"
+
     @property
     def get_quote(self):
-        return kite_context.quote([f"{self.exchange}:{self.stock_name}"])[f"{self.exchange}:{self.stock_name}"][
-                    "depth"]
+        if _quote_source is not None:
+            return _quote_source(self.instrument)
+        # in streaming mode the latest depth received from the websocket is used
+        depth = depth_table.depth(self.instrument)
+        if depth is not None:
+            return depth
+        # the quote of a stock which is held is needed to sell it so it goes before the others
+        return quote_snapshot.depth(
+            self.instrument, RequestPriority.POSITION if self.in_position else RequestPriority.WATCHLIST
+        )
 
     @property
+    @traced("observe_price")
     def current_price(self):
         """
             returns the current price in the market or else None if the connection interrupts
 
             tries 4 times
         """
+        started = perf_counter()
         retries = 0
-        while retries < 4:
-            try:
-                if DEBUG:
-                    response = requests.get(f"http://127.0.0.1:8082/price?symbol={self.stock_name}")
-                    return response.json()['data']
-                else:
-                    quote: dict = self.get_quote
-                    if self.in_position:
-                        orders: list = quote["buy"]
+        try:
+            while retries < 4:
+                try:
+                    if DEBUG:
+                        if MARKET_SIMULATOR:
+                            return market_simulator.price(self.stock_name)
+                        response = requests.get(f"{DEBUG_PRICE_SERVER}/price?symbol={self.stock_name}",
+                                                timeout=DEBUG_PRICE_TIMEOUT)
+                        return response.json()['data']
                     else:
-                        orders: list = quote["sell"]
-                    accumulated, quantity = 0, 0
-                    for item in orders:
-                        for order_no in range(1, item["orders"] + 1):
-                            for _ in range(1, item["quantity"] + 1):
-                                if quantity + 1 > self.quantity:
-                                    return accumulated / quantity
-                                accumulated += item["price"]
-                                quantity += 1
-                    return None
-
-            except:
-                sleep(1)
-            retries += 1
-        return None
+                        quote: dict = self.get_quote
+                        if self.in_position:
+                            orders: list = quote["buy"]
+                        else:
+                            orders: list = quote["sell"]
+                        return price_for_quantity(orders, self.quantity)
 
+                except:
+                    price_retries.inc()
+                    # the quote source has no other quote to give after a wait
+                    if _quote_source is not None:
+                        return None
+                    sleep(1)
+                retries += 1
+            return None
+        finally:
+            price_seconds.observe(perf_counter() - started)
+
+    @traced("update_price", root=True, symbol=lambda stock: stock.stock_name)
     def update_price(self):
         """
         This is required to update the latest price.
@@ -112,35 +157,19 @@ class StockInfo:
         if current_price is not None:
             self.latest_price = current_price
         if self.latest_price is not None:
+            with tracer.span("update_indicators"):
+                self.update_stock_df(self.latest_price)
+                self.__indicators.update(self.latest_price)
+                if self.__indicators.count > 1:  # first value is the buy price only so from 2nd low value is taken for triggering in a single day
+                    self.low = self.__indicators.low
+                self.latest_indicator_price = self.__indicators.latest_indicator_price
 
-            self.update_stock_df(self.latest_price)
-            actual_price: pd.DataFrame = self.__result_stock_df.copy()
-            actual_price.insert(1, "min", actual_price.price.cummin())
-            if actual_price.shape[0] > 1:  # first value is the buy price only so from 2nd low value is taken for triggering in a single day
-                self.low = actual_price['min'].iloc[-1]
-
-            actual_price.loc[:, 'line'] = kaufman_indicator(actual_price['price'])
-            actual_price.loc[:, 'signal'] = actual_price.line.ewm(span=5).mean()
-            actual_price.dropna(inplace=True)
-            actual_price.reset_index(inplace=True)
-            if actual_price.shape[0] == 0:
-                self.latest_indicator_price = None
-            else:
-                recent_price = actual_price.signal.iloc[actual_price.shape[0] - 1]
-                self.latest_indicator_price = recent_price
-
+    @traced("buy_parameters")
     def buy_parameters(self):
         amount: float = get_allocation()
 
         def get_quantity_and_price(s_orders):
-            accumulated, quantity = 0, 0
-            for item in s_orders:
-                for order_no in range(1, item["orders"] + 1):
-                    for _ in range(1, item["quantity"] + 1):
-                        if accumulated + item["price"] > amount:
-                            return quantity, accumulated/quantity
-                        accumulated += item["price"]
-                        quantity += 1
+            quantity, accumulated = fill_for_amount(s_orders, amount)
             return quantity, accumulated / quantity
         quote: dict = self.get_quote
         sell_orders: list = quote["sell"]
@@ -155,24 +184,61 @@ class StockInfo:
 
     def update_stock_df(self, current_price: float):
         """
-        This function updates the csv file which holds the price every 30 sec
+        This function adds the price to the in memory price buffer every 30 sec.
+        The prices saved earlier in temp/<symbol>.csv are loaded only once and fed to the indicators
         :param current_price:
         :return: None
         """
-        try:
-            self.__result_stock_df = pd.read_csv(f"temp/{self.stock_name}.csv")
-            self.__result_stock_df.drop(self.__result_stock_df.columns[0], axis=1, inplace=True)
-        except FileNotFoundError:
-            self.__result_stock_df = None
-        stock_df = pd.DataFrame({"price": [current_price]})
-        if self.__result_stock_df is not None:
-            self.__result_stock_df = pd.concat([self.__result_stock_df, stock_df], ignore_index=True)
-        else:
-            self.__result_stock_df = stock_df
-        # logger.info(f"{self.stock_name} : {self.__result_stock_df.shape[0]} , {current_price}")
-        self.__result_stock_df.to_csv(f"temp/{self.stock_name}.csv")
-        self.__result_stock_df = self.__result_stock_df.bfill().ffill()
-        self.__result_stock_df.dropna(axis=1, inplace=True)
+        if self.__price_buffer is None:
+            self.__price_buffer = PriceBuffer(self.stock_name)
+            for price in self.__price_buffer.load():
+                self.__indicators.update(price)
+        self.__price_buffer.append(current_price)
+        # logger.info(f"{self.stock_name} : {self.__price_buffer.count} , {current_price}")
+
+    @property
+    def prices(self):
+        """
+            read only view of the latest prices of the stock
+        """
+        return self.__price_buffer.prices if self.__price_buffer is not None else None
+
+    def flush_prices(self):
+        """
+        appends the prices which are not yet saved to the file
+        :return: None
+        """
+        if self.__price_buffer is not None:
+            self.__price_buffer.flush()
+
+    SNAPSHOT_FIELDS = ("wallet", "created_at", "first_load", "in_position", "last_buy_price", "latest_indicator_price",
+                       "latest_price", "low", "high", "quantity")
+
+    def snapshot_state(self) -> dict:
+        """
+            everything needed to carry on with the stock after a restart, including the indicators
+            and the prices in the buffer
+        """
+        return {
+            "stock_name": self.stock_name,
+            "exchange": self.exchange,
+            "fields": {key: getattr(self, key) for key in self.SNAPSHOT_FIELDS},
+            # pickled right away since it is a much faster copy than deepcopy
+            "indicators": pickle.dumps(self.__indicators, protocol=pickle.HIGHEST_PROTOCOL),
+            "prices": self.__price_buffer.state() if self.__price_buffer is not None else None,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "StockInfo":
+        stock = cls(state["stock_name"], state["exchange"])
+        for key, value in state["fields"].items():
+            setattr(stock, key, value)
+        stock.__indicators = pickle.loads(state["indicators"])
+        if state["prices"] is not None:
+            # the buffer is rebuilt as it was so the prices in the file are not fed to the indicators again
+            stock.__price_buffer = PriceBuffer(stock.stock_name)
+            stock.__price_buffer.restore(*state["prices"])
+        return stock
 
     def whether_buy(self) -> bool:
         """
@@ -186,21 +252,14 @@ class StockInfo:
             # self.first_load = False  # or else it will constantly sell and buy
             return True
         else:
-            if self.__result_stock_df.shape[0] > 10:
-                stock_df = self.__result_stock_df.copy()
-                stock_df.insert(1, "line", kaufman_indicator(stock_df['price']))
-                stock_df.insert(2, "signal", stock_df.line.ewm(span=5).mean())
-                stock_df.insert(3, "min", stock_df.signal.cummin())
-                stock_df['positions'] = np.where((stock_df['signal'] > stock_df['min']*1.002), 1, 0)
-                # logger.info(f" positions {self.stock_name}:{stock_df['positions'].iloc[-1]},{stock_df['positions'].iloc[-2]}")
-                if stock_df['positions'].iloc[-1] == 1 and stock_df['positions'].iloc[-2] == 0 and self.last_buy_price > (1+0.02)*self.latest_price:
+            if self.__indicators.count > 10:
+                positions: list = self.__indicators.positions
+                # logger.info(f" positions {self.stock_name}:{positions[-1]},{positions[-2]}")
+                if positions[-1] == 1 and positions[-2] == 0 and self.last_buy_price > (1 + strategy_parameters.rebuy_discount) * self.latest_price:
                     return True
-            elif self.__result_stock_df.shape[0] > 1:
-                stock_df = self.__result_stock_df.copy()
-                stock_df.insert(1, "signal", stock_df.price.ewm(span=5).mean())
-                stock_df.insert(2, "min", stock_df.signal.cummin())
-                stock_df['positions'] = np.where((stock_df['signal'] > stock_df['min']), 1, 0)
-                # logger.info(f" positions {self.stock_name}:{stock_df['positions'].iloc[-1]},{stock_df['positions'].iloc[-2]}")
-                if stock_df['positions'].iloc[-1] == 1 and stock_df['positions'].iloc[-2] == 0:
+            elif self.__indicators.count > 1:
+                positions: list = self.__indicators.price_positions
+                # logger.info(f" positions {self.stock_name}:{positions[-1]},{positions[-2]}")
+                if positions[-1] == 1 and positions[-2] == 0:
                     return True
         return False
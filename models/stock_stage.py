@@ -1,22 +1,25 @@
 from models.costs.delivery_trading_cost import DeliveryTransactionCost
 from models.costs.intraday_trading_cost import IntradayTransactionCost
 from models.stock_info import StockInfo
-from datetime import datetime
-from dataclasses import dataclass, field
+from datetime import date
+from math import floor, isfinite
+from dataclasses import dataclass, field, fields
 
-from dateutil.rrule import rrule, WEEKLY, MO, TU, WE, TH, FR
-from utils.exclude_dates import load_holidays
+from utils.clock import clock
+from utils.trading_calendar import trading_calendar
 
 from logging import Logger
 
-from utils.logger import get_logger
+from utils.logger import get_logger, HOT
 
 from constants.enums.position_type import PositionType
 from constants.enums.product_type import ProductType
-from constants.settings import DELIVERY_INITIAL_RETURN, DELIVERY_INCREMENTAL_RETURN, INTRADAY_INITIAL_RETURN, \
-    EXPECTED_MINIMUM_MONTHLY_RETURN, DEBUG, get_allocation
+from constants.settings import DEBUG, get_allocation
+from constants.strategy_parameters import strategy_parameters
 
 from utils.take_position import short
+from utils.tracing import traced
+from utils.write_behind import write_behind
 
 logger: Logger = get_logger(__name__)
 
@@ -34,7 +37,29 @@ class Stage:
     trigger: float = field(default=None, init=False)
     cost: float = field(default=None, init=False)
     continuous_down: int = field(default=0, init=False)
-    
+    _number_of_days: tuple[date, date, int] | None = field(default=None, init=False, repr=False)
+
+    def snapshot_state(self) -> dict:
+        """
+            values of all the fields except the stock, which is kept with the tracked stocks
+        """
+        excluded = ("stock", "schema", "save_to_db", "delete_from_db", "update_in_db", "_number_of_days")
+        return {item.name: getattr(self, item.name) for item in fields(self) if item.name not in excluded}
+
+    @classmethod
+    def from_state(cls, state: dict, stock: StockInfo) -> "Stage":
+        init_fields = {item.name for item in fields(cls) if item.init}
+        stage = cls(stock=stock, **{key: value for key, value in state.items() if key in init_fields})
+        for key, value in state.items():
+            if key not in init_fields:
+                setattr(stage, key, value)
+        return stage
+
+    def mark_changed(self, *keys: str):
+        """
+            marks the changed fields to be written by the write behind queue, positions are not stored so
+            only a stage with a collection e.g. Holding does anything here
+        """
 
     @property
     def invested_amount(self) -> float:
@@ -45,25 +70,30 @@ class Stage:
 
     @property
     def number_of_days(self):
-        dtstart, until = self.stock.created_at.date(), datetime.now().date()
-        days = rrule(WEEKLY, byweekday=(MO, TU, WE, TH, FR), dtstart=dtstart, until=until).count()
-        for day in load_holidays()['dates']:
-            if dtstart <= day.date() <= until:
-                days -= 1
-        return days
-
-    def transaction_cost(self, buying_price, selling_price) -> float:
+        """
+            trading days since the stock was bought, computed once per day
+        """
+        dtstart, until = self.stock.created_at.date(), clock.now().date()
+        if self._number_of_days is None or self._number_of_days[:2] != (dtstart, until):
+            self._number_of_days = (dtstart, until, trading_calendar.trading_days(dtstart, until))
+        return self._number_of_days[2]
+
+    def transaction_cost(self, buying_price, selling_price, quantity: int | None = None) -> float:
+        """
+            charges for buying and selling the quantity, the whole position if quantity is None
+        """
+        quantity = self.quantity if quantity is None else quantity
         if self.number_of_days > 1:
             return DeliveryTransactionCost(
                 buying_price=buying_price,
                 selling_price=selling_price,
-                quantity=self.quantity
+                quantity=quantity
             ).total_tax_and_charges
         else:
             return IntradayTransactionCost(
                 buying_price=buying_price,
                 selling_price=selling_price,
-                quantity=self.quantity
+                quantity=quantity
             ).total_tax_and_charges
 
     @property
@@ -71,20 +101,40 @@ class Stage:
         if self.number_of_days > 2:
             # if accumulated return > 0.03 then return 0.03 else accumulated return
             return min(
-                ((1 + DELIVERY_INITIAL_RETURN) ** self.number_of_days) - 1,
-                EXPECTED_MINIMUM_MONTHLY_RETURN
+                ((1 + strategy_parameters.delivery_initial_return) ** self.number_of_days) - 1,
+                strategy_parameters.expected_minimum_monthly_return
             )
         elif self.number_of_days == 2:
             return min(
-                ((1 + DELIVERY_INITIAL_RETURN) ** (self.number_of_days + 1)) - 1,
-                EXPECTED_MINIMUM_MONTHLY_RETURN
+                ((1 + strategy_parameters.delivery_initial_return) ** (self.number_of_days + 1)) - 1,
+                strategy_parameters.expected_minimum_monthly_return
             )
         else:
-            return INTRADAY_INITIAL_RETURN
+            return strategy_parameters.intraday_initial_return
 
     @property
     def incremental_return(self):
-        return DELIVERY_INCREMENTAL_RETURN
+        return strategy_parameters.delivery_incremental_return
+
+    @staticmethod
+    def trigger_counter(target, selling_price: float, step: float) -> int:
+        """
+            largest counter for which target(counter) < selling_price, 0 if there is none.
+
+            target increases by step with every counter so the counter is solved directly and then
+            the neighbours are checked, which gives the same counter as stepping one at a time from 1
+        """
+        if not step > 0:
+            return 0
+        steps = (selling_price - target(0)) / step
+        if not isfinite(steps):
+            return 0
+        counter = max(floor(steps), 0)
+        while counter >= 1 and not target(counter) < selling_price:
+            counter -= 1
+        while target(counter + 1) < selling_price:
+            counter += 1
+        return counter
 
     def set_trigger(self, stock_price: float):
         """
@@ -116,57 +166,75 @@ class Stage:
         # this handles the B part
         tx_cost = self.transaction_cost(buying_price=buy_price, selling_price=selling_price) / self.quantity
 
-        logger.info(f"the total transaction cost for {self.stock.stock_name} is {tx_cost * self.quantity}")
+        logger.log(HOT, "the total transaction cost for %s is %s", self.stock.stock_name, tx_cost * self.quantity)
 
         cost = buy_price + tx_cost
         self.cost = cost
 
-        counter = 1
         earlier_trigger = self.trigger
+        expected_return = self.current_expected_return
+        wallet_per_share = self.stock.wallet / self.quantity
 
-        logger.info(f"current : {self.current_expected_return}")
+        def target(counter):
+            return cost * (1 + expected_return + counter * self.incremental_return) - wallet_per_share
 
-        # this section iterates and finds the current trigger achieved
-        logger.info(
-            f"cost tracking {cost * (1 + self.current_expected_return + counter * self.incremental_return) - (self.stock.wallet / self.quantity)}")
-        while cost * (1 + self.current_expected_return + counter * self.incremental_return) - (
-                self.stock.wallet / self.quantity) < selling_price:
-            if self.position_type == PositionType.SHORT:
+        logger.log(HOT, "current : %s", expected_return)
 
-                self.trigger = selling_price / (cost * (
-                        1 + self.current_expected_return + counter * self.incremental_return) - (
-                                                            self.stock.wallet / self.quantity))
+        logger.log(HOT, "cost tracking %s", target(1))
+        counter = self.trigger_counter(target, selling_price, cost * self.incremental_return)
+        # the trigger is the target of the largest counter which is still below the selling price
+        if counter >= 1:
+            if self.position_type == PositionType.SHORT:
+                self.trigger = selling_price / target(counter)
             else:
-                self.trigger = cost * (1 + self.current_expected_return + counter * self.incremental_return) - (
-                            self.stock.wallet / self.quantity)
-            counter += 1
+                self.trigger = target(counter)
 
         if earlier_trigger is not None:
             if earlier_trigger > self.trigger:
                 self.trigger = earlier_trigger
+        if self.trigger != earlier_trigger:
+            self.mark_changed("trigger")
 
-        if self.trigger:
-            logger.info(
-                f"current return for {self.stock.stock_name} is  {(self.trigger / (cost - (self.stock.wallet / self.quantity))) - 1}")
+        if self.trigger and logger.isEnabledFor(HOT):
+            logger.log(HOT, "current return for %s is  %s", self.stock.stock_name,
+                       (self.trigger / (cost - (self.stock.wallet / self.quantity))) - 1)
 
+    @traced("sell")
     def sell(self):
+        """
+            sells the position and adds the profit or loss at the filled price to the wallet.
+
+            If only a part is filled then the wallet is updated for that part, the rest stays in the
+            position and False is returned so that it is sold again later
+        """
         # this has been done because if there is error while selling it still says it sold
         # suppose the stock is not even bought but still it tries to sell in that case it may fail
-        if short(
-                symbol=self.stock.stock_name,
-                quantity=self.quantity,
-                product_type=self.product_type,
-                exchange=self.stock.exchange):
-            logger.info(f"Selling {self.stock.stock_name} at {self.current_price} Quantity:{self.quantity}")
+        order = short(
+            symbol=self.stock.stock_name,
+            quantity=self.quantity,
+            product_type=self.product_type,
+            exchange=self.stock.exchange)
+        if order:
             buy_price = self.buy_price
-            selling_price = self.current_price
-            tx_cost = self.transaction_cost(buying_price=buy_price, selling_price=selling_price) / self.quantity
+            selling_price = order.average_price or self.current_price
+            sold_quantity = min(order.filled_quantity, self.quantity)
+            logger.info(f"Selling {self.stock.stock_name} at {selling_price} Quantity:{sold_quantity}/{self.quantity}")
+            tx_cost = self.transaction_cost(buying_price=buy_price, selling_price=selling_price,
+                                            quantity=sold_quantity) / sold_quantity
             wallet_value = selling_price - (buy_price + tx_cost)
-            self.stock.wallet += wallet_value * self.quantity
+            self.stock.wallet += wallet_value * sold_quantity
             logger.info(f"Wallet: {self.stock.wallet}")
+            write_behind.mark(self.stock, "wallet")
+            self.mark_changed("stock")
+            if sold_quantity < self.quantity:
+                self.quantity -= sold_quantity
+                self.stock.quantity = self.quantity
+                self.mark_changed("quantity")
+                return False
             return True
         return False
 
+    @traced("breached", root=True, symbol=lambda stage: stage.stock.stock_name)
     def breached(self):
         """
             if the current price is less than the previous trigger, then it sells else it updates the trigger
@@ -186,23 +254,25 @@ class Stage:
         selling_price = self.current_price
         tx_cost = self.transaction_cost(buying_price=buy_price, selling_price=selling_price) / self.quantity
         wallet_value = selling_price - (buy_price + tx_cost)
-        logger.info(f"Wallet: {wallet_value}")
+        logger.log(HOT, "Wallet: %s", wallet_value)
 
         low = self.stock.low
 
         # if the position was long then on achieving the trigger, it should sell otherwise it should buy
         # to clear the position
         if (self.position_type == PositionType.LONG) and (self.current_price is not None):
-            logger.info(f"{self.stock.stock_name} Earlier trigger:  {self.trigger}, latest price:{self.current_price}")
+            logger.log(HOT, "%s Earlier trigger:  %s, latest price:%s",
+                       self.stock.stock_name, self.trigger, self.current_price)
             # if self.position_price > self.current_price * (1 + 0.002) and self.number_of_days <= 1:
             if low is not None:
-                logger.info(f"buy price:{self.buy_price}")
-                if self.buy_price > self.current_price == low and self.number_of_days <= 1 and abs(wallet_value/get_allocation()) > 0.005:
+                logger.log(HOT, "buy price:%s", self.buy_price)
+                if self.buy_price > self.current_price == low and self.number_of_days <= 1 and \
+                        abs(wallet_value/get_allocation()) > strategy_parameters.day1_loss_threshold:
                     if DEBUG:
                         if self.last_price is not None:
                             if self.last_price > self.current_price:
                                 self.continuous_down += 1
-                                if self.continuous_down > 2:
+                                if self.continuous_down > strategy_parameters.continuous_down_limit:
                                     if self.sell():
                                         return "DAY1NOT"
                     else:
@@ -211,13 +281,14 @@ class Stage:
                             if self.last_price is not None:
                                 if self.last_price > self.current_price:
                                     self.continuous_down += 1
-                                    if self.continuous_down > 2:
+                                    if self.continuous_down > strategy_parameters.continuous_down_limit:
                                         if self.sell():
                                             return "DAY1NOT"
             if self.trigger is not None:
                 # if it hits trigger then square off else reset a new trigger
-                if self.cost * (1 + self.current_expected_return) < self.current_price < (4*self.trigger) / (3*(
-                        1 + self.incremental_return)):
+                if self.cost * (1 + self.current_expected_return) < self.current_price < \
+                        (strategy_parameters.trigger_band_numerator * self.trigger) / (
+                        strategy_parameters.trigger_band_denominator * (1 + self.incremental_return)):
                     if DEBUG:
                         if self.sell():
                             if self.number_of_days <= 1:
@@ -0,0 +1,14 @@
+from quart import Blueprint
+
+from utils.metrics import metrics
+
+metrics_export = Blueprint("metrics_export", __name__)
+
+
+@metrics_export.get("/metrics")
+async def read_metrics():
+    """
+        all the metrics of the engine in the text format of Prometheus, to be scraped
+    :return: text
+    """
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
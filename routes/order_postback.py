@@ -0,0 +1,42 @@
+from hashlib import sha256
+from hmac import compare_digest
+from logging import Logger
+
+from quart import Blueprint, request
+
+from utils.logger import get_logger
+from utils.order_gateway import order_gateway
+
+try:
+    from constants.kite_credentials import API_SECRET
+except ImportError:
+    API_SECRET = None
+
+logger: Logger = get_logger(__name__)
+
+order_postback = Blueprint("order_postback", __name__)
+
+
+@order_postback.post("/postback")
+async def receive_postback():
+    """
+        this route is set as the postback url in kite so that the order updates reach the order gateway
+        without waiting for the next order history check
+    :return: json
+    """
+    order: dict = await request.get_json(force=True, silent=True) or {}
+    if "order_id" not in order:
+        return {"message": "Order not found in the request"}, 400
+
+    # kite signs every postback with the checksum of order id, order timestamp and the api secret, without the
+    # secret nothing can be verified so every postback is refused and the fills come from the order history
+    if API_SECRET is None:
+        logger.warning(f"postback for order {order['order_id']} refused, API_SECRET is not configured")
+        return {"message": "Postbacks are not accepted without API_SECRET"}, 403
+    checksum = sha256(f"{order['order_id']}{order.get('order_timestamp')}{API_SECRET}".encode()).hexdigest()
+    if not compare_digest(checksum, str(order.get("checksum", ""))):
+        logger.info(f"postback with incorrect checksum for order {order['order_id']}")
+        return {"message": "Incorrect checksum"}, 400
+
+    order_gateway.on_order_update(order)
+    return {"message": "Postback received"}, 200
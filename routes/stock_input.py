@@ -1,7 +1,7 @@
-import kiteconnect
 from quart import Blueprint
 
-from constants.global_contexts import kite_context
+from utils.executor import run_blocking
+from utils.instrument_master import instrument_master
 
 stocks_input = Blueprint("stocks_input", __name__)
 
@@ -25,16 +25,16 @@ async def add_stock(stock):
         :return: json
     """
     global selected_stocks
+    # the symbol is checked in the instrument master, kite is called only if the dump of the day is not there yet
     try:
-        response = kite_context.ltp([f"NSE:{stock}"])
-        if len(response) == 0:
-            return {"message": "Incorrect stock symbol provided"}, 400
-        else:
-            selected_stocks.append(stock)
-            return {"message": "Stock added", "data": selected_stocks}, 200
-
-    except kiteconnect.exceptions.InputException:
-        return {"message": "Kindly login first"}, 400
+        await run_blocking(instrument_master.load)
+    except:
+        return {"message": "Instruments could not be loaded, kindly login first"}, 400
+    if not instrument_master.exists(stock):
+        return {"message": "Incorrect stock symbol provided"}, 400
+    else:
+        selected_stocks.append(stock)
+        return {"message": "Stock added", "data": selected_stocks}, 200
 
 
 @stocks_input.get("/delete_stock/<string:stock>")
@@ -0,0 +1,47 @@
+from quart import Blueprint, request
+
+from utils.tracing import tracer
+
+trace_export = Blueprint("trace_export", __name__)
+
+
+@trace_export.get("/traces")
+async def read_traces():
+    """
+        the latest traced decisions with the timeline of their stages, e.g. /traces?symbol=INFY&limit=20
+    :return: json
+    """
+    limit = request.args.get("limit", default=50, type=int)
+    return {"sample_rate": tracer.sample_rate,
+            "traces": tracer.traces(request.args.get("symbol"), limit)}
+
+
+@trace_export.get("/traces/summary")
+async def summarise_traces():
+    """
+        count and latency percentiles of every stage, to see which one takes most of the time
+    :return: json
+    """
+    return {"sample_rate": tracer.sample_rate, "stages": tracer.summary()}
+
+
+@trace_export.get("/traces/chrome")
+async def export_traces():
+    """
+        every span in the ring as chrome trace json, to be opened in chrome://tracing or Perfetto
+    :return: json
+    """
+    return tracer.chrome_trace(), 200, {"Content-Disposition": "attachment; filename=trace.json"}
+
+
+@trace_export.get("/traces/sample")
+async def set_sample_rate():
+    """
+        changes the fraction of the decisions which are traced, e.g. /traces/sample?rate=0.1, 0 turns it off
+    :return: json
+    """
+    try:
+        tracer.set_sample_rate(float(request.args["rate"]))
+    except (KeyError, ValueError) as error:
+        return {"message": f"rate between 0 and 1 is needed: {error}"}, 400
+    return {"sample_rate": tracer.sample_rate}
@@ -1,23 +1,137 @@
 from datetime import datetime
-from asyncio import sleep
+from asyncio import get_running_loop, gather
+from functools import partial
 from logging import Logger
-import yfinance as yf
 
+from constants.enums.request_priority import RequestPriority
 from models.account import Account
 from models.stages.holding import Holding
 from models.stages.position import Position
 from models.stock_info import StockInfo
 from routes.stock_input import chosen_stocks
+from utils.account_snapshot import account_snapshot
+from utils.clock import clock
+from utils.executor import run_blocking, run_concurrently
+from utils.history_cache import download_history
 from utils.logger import get_logger
+from utils.loop_metrics import loop_metrics
+from utils.order_gateway import order_gateway
+from utils.quote_snapshot import quote_snapshot
+from utils.streaming.tick_stream import tick_stream
+from utils.write_behind import write_behind
 
 from constants.settings import END_TIME, SLEEP_INTERVAL, get_allocation, end_process, START_TIME, STOP_BUYING_TIME, \
-    set_allocation, get_max_stocks, set_max_stocks, DEBUG
+    set_allocation, get_max_stocks, set_max_stocks, DEBUG, STREAMING_MODE, BLOCKING_CALL_RETRIES, \
+    CAPITAL, ORDER_CALL_TIMEOUT
 from utils.tracking_components.stock_tracking import filter_stocks
-from utils.tracking_components.verify_symbols import get_correct_symbol
+from utils.tracking_components.verify_symbols import resolve_symbols
 
 logger: Logger = get_logger(__name__)
 
 
+def track_filtered_stock(account: Account, stock_col: str):
+    """
+        starts tracking a filtered stock and sets its buying quantity if there are sellers
+    """
+    account.stocks_to_track[stock_col] = StockInfo(stock_col, 'NSE')
+    if not DEBUG:
+
+        sell_orders: list = account.stocks_to_track[stock_col].get_quote["sell"]
+        zero_quantity = True
+        for item in sell_orders:
+            if item['quantity'] > 0:
+                zero_quantity = False
+            break
+        if zero_quantity:
+            return
+    _, _2 = account.stocks_to_track[stock_col].buy_parameters()
+    # stock_df = prediction_df[[f"{stock_col}.NS"]]
+    # stock_df.reset_index(inplace=True)
+    # stock_df = stock_df[[f"{stock_col}.NS"]].bfill().ffill()
+    # stock_df.columns = ['price']
+    # stock_df.to_csv(f"temp/{stock_col}.csv")
+
+
+def check_position(account: Account, position_name: str, filtered_stocks: list) -> bool:
+    """
+        if the trigger for selling is breached in position then sell, the position is deleted here right
+        after it is sold so that it is never sold again even if the caller has stopped waiting
+        :return: True if the position has been deleted
+    """
+    position: Position = account.positions[position_name]
+    status = position.breached()
+    match status:
+        case "DAY1BREACHED":
+            logger.info(f" DAY1BREACHED -->sell {position.stock.stock_name} at {position.stock.latest_price}")
+            logger.info(f"breached stock wallet {position_name} {account.stocks_to_track[position_name].wallet}")
+            account.stocks_to_track[position_name].flush_prices()
+            del account.stocks_to_track[position_name]  # delete from stocks to track
+            filtered_stocks.remove(position_name)
+            del account.positions[position_name]
+            return True
+        case "DAY1NOT":
+            logger.info(f" DAY1NOT -->sell {position.stock.stock_name} at {position.stock.latest_price}")
+            account.stocks_to_track[position_name].in_position = False
+            write_behind.mark(account.stocks_to_track[position_name], "in_position")
+            del account.positions[position_name]
+            return True
+
+    # if position.breached():
+    #     logger.info(f" line 89 -->sell {position.stock.stock_name} at {position.stock.latest_price}")
+    #     positions_to_delete.append(position_name)
+    #     del account.stocks_to_track[position_name]
+    #     filtered_stocks.remove(position_name)
+    return False
+
+
+def check_holding(account: Account, holding_name: str, current_time: datetime) -> bool:
+    """
+        if the trigger for selling is breached in holding then sell, the holding is deleted here like a position
+        :return: True if the holding has been deleted
+    """
+    holding: Holding = account.holdings[holding_name]
+
+    if START_TIME < current_time:
+        if holding.breached():
+            logger.info(f" line 89 -->sell {holding.stock.stock_name} at {holding.stock.latest_price}")
+            account.stocks_to_track[holding_name].flush_prices()
+            del account.stocks_to_track[holding_name]
+            del account.holdings[holding_name]
+            return True
+    return False
+
+
+def evaluate_stock(account: Account, stock_key: str, filtered_stocks: list, current_time: datetime):
+    """
+        runs all the steps of the loop for one stock, used in streaming mode when the tick of the stock arrives
+    """
+    if stock_key not in account.stocks_to_track.keys():
+        if START_TIME < current_time < STOP_BUYING_TIME and stock_key in filtered_stocks and \
+                len(account.stocks_to_track) < get_max_stocks():
+            track_filtered_stock(account, stock_key)
+        return
+
+    account.stocks_to_track[stock_key].update_price()
+    # because the instance of the stock stored in position is not the same stored in stocks_to_track
+    if stock_key in account.positions.keys():
+        account.positions[stock_key].stock = account.stocks_to_track[stock_key]
+
+    if end_process():
+        return
+
+    if START_TIME < current_time < STOP_BUYING_TIME:
+        try:
+            account.buy_stocks([stock_key])
+        except:
+            pass
+
+    if stock_key in account.positions.keys():
+        check_position(account, stock_key, filtered_stocks)
+
+    if stock_key in account.holdings.keys():
+        check_holding(account, stock_key, current_time)
+
+
 async def background_task():
     """
         all the tasks mentioned here will be running in the background
@@ -26,36 +140,82 @@ async def background_task():
 
     logger.info("BACKGROUND TASK STARTED")
 
-    current_time = datetime.now()
-
-    account: Account = Account()
+    current_time = clock.now()
 
-    prediction_df, obtained_stock_list = None, await get_correct_symbol()
+    # orders placed from the worker threads are handled on this loop
+    order_gateway.start(get_running_loop())
+    # the changed state of the stocks and holdings is written in the background
+    write_behind.start(get_running_loop())
 
+    prediction_df, obtained_stock_list = None, []
     not_loaded = True
     filtered_stocks = []
 
+    # after a restart during the day the account is taken from the snapshot instead of screening again
+    snapshot = await run_blocking(account_snapshot.load)
+    if snapshot is not None:
+        account, session = account_snapshot.restore(snapshot)
+        obtained_stock_list, filtered_stocks = session["obtained_stock_list"], session["filtered_stocks"]
+        set_allocation(session["allocation"])
+        set_max_stocks(session["max_stocks"])
+        not_loaded = False
+        logger.info(f"account restored with {len(account.stocks_to_track)} stocks, {len(account.positions)} positions "
+                    f"and {len(account.holdings)} holdings")
+        if STREAMING_MODE:
+            tick_stream.start(get_running_loop())
+    else:
+        account: Account = Account()
+        async for symbols in resolve_symbols():
+            obtained_stock_list.extend(symbols)
+            # the daily history used for screening is cached while the rest of the universe is being resolved
+            try:
+                await run_blocking(download_history, [f"{symbol}.NS" for symbol in symbols if '-BE' not in symbol],
+                                   period='1y', interval='1d', price_field='Open', timeout=None)
+            except:
+                logger.exception("History could not be cached for the resolved symbols")
+
     """
     START OF DAY ACTIVITIES
     """
 
     # this part will loop till the trading times end
     while current_time < END_TIME:
-        await sleep(SLEEP_INTERVAL)
-
-        current_time = datetime.now()
+        if STREAMING_MODE and not not_loaded:
+            # the loop wakes up as soon as a tick arrives instead of sleeping for the whole interval
+            instrument = await tick_stream.next_tick(SLEEP_INTERVAL)
+        else:
+            instrument = None
+            await clock.sleep(SLEEP_INTERVAL)
+
+        current_time = clock.now()
+        loop_metrics.start_iteration(len(account.stocks_to_track))
+
+        if not not_loaded:
+            # taken at the start of the iteration when no worker thread is changing the account
+            with loop_metrics.phase("snapshot"):
+                account_snapshot.save_in_background(account, {
+                    "obtained_stock_list": obtained_stock_list,
+                    "filtered_stocks": filtered_stocks,
+                    "allocation": get_allocation(),
+                    "max_stocks": get_max_stocks(),
+                })
 
         try:
             if not_loaded and current_time >= START_TIME:
-                trackable_stocks = filter_stocks(obtained_stock_list)
-                filtered_stocks = [i[:-3] for i in trackable_stocks]
-                prediction_df = yf.download(tickers=trackable_stocks, period='1wk', interval='1m', show_errors=False)['Close']
-                set_allocation(30000 / len(filtered_stocks))
-                set_max_stocks(len(filtered_stocks))
+                with loop_metrics.phase("screening"):
+                    trackable_stocks = await run_blocking(filter_stocks, obtained_stock_list, timeout=None)
+                    filtered_stocks = [i[:-3] for i in trackable_stocks]
+                    prediction_df = await run_blocking(download_history, trackable_stocks, period='1wk', interval='1m',
+                                                       price_field='Close', timeout=None)
+                    set_allocation(CAPITAL / len(filtered_stocks))
+                    set_max_stocks(len(filtered_stocks))
+
+                    logger.info(f"list of stocks: {filtered_stocks}")
+                    logger.info(f"allocation: {get_allocation()}")
+                    not_loaded = False
 
-                logger.info(f"list of stocks: {filtered_stocks}")
-                logger.info(f"allocation: {get_allocation()}")
-                not_loaded = False
+                if STREAMING_MODE:
+                    tick_stream.start(get_running_loop())
 
             """
                 if any new stock is added then it will be added in the stock to track
@@ -63,15 +223,60 @@ async def background_task():
             for chosen_stock in chosen_stocks():
                 if chosen_stock not in list(account.stocks_to_track.keys()) and len(account.stocks_to_track) < get_allocation():
                     account.stocks_to_track[chosen_stock] = StockInfo(chosen_stock, 'NSE')
+
+            """
+                in streaming mode only the stock whose tick has arrived is evaluated
+            """
+            if STREAMING_MODE and not not_loaded:
+                with loop_metrics.phase("tick"):
+                    await run_blocking(
+                        tick_stream.subscribe,
+                        [stock.instrument for stock in account.stocks_to_track.values()] +
+                        [f"NSE:{stock_col}" for stock_col in filtered_stocks]
+                    )
+                    if instrument is not None:
+                        await run_blocking(evaluate_stock, account, instrument.split(":")[-1], filtered_stocks, current_time,
+                                           timeout=ORDER_CALL_TIMEOUT)
+                if end_process():
+                    break
+                continue
+
+            """
+                fetch the quotes of all the stocks needed in this loop in as few calls as possible
+            """
+            if not DEBUG:
+                try:
+                    # the quotes of the stocks which are held go first so that selling is never delayed
+                    with loop_metrics.phase("quotes"):
+                        held = [stock.instrument for name, stock in account.stocks_to_track.items()
+                                if name in account.positions.keys() or name in account.holdings.keys()]
+                        await gather(
+                            run_blocking(quote_snapshot.refresh, held, RequestPriority.POSITION,
+                                         retries=BLOCKING_CALL_RETRIES),
+                            run_blocking(
+                                quote_snapshot.refresh,
+                                [stock.instrument for stock in account.stocks_to_track.values() if stock.instrument not in held] +
+                                [f"NSE:{stock_col}" for stock_col in filtered_stocks if f"NSE:{stock_col}" not in held],
+                                RequestPriority.WATCHLIST,
+                                retries=BLOCKING_CALL_RETRIES
+                            )
+                        )
+                except:
+                    # each stock will fetch its own quote if the snapshot is not available
+                    logger.exception("Quote snapshot could not be refreshed")
+
             """
-                update price for all the stocks which are being tracked
+                update price for all the stocks which are being tracked, all of them at the same time
             """
 
-            for stock in account.stocks_to_track.keys():
-                account.stocks_to_track[stock].update_price()
-                # because the instance of the stock stored in position is not the same stored in stocks_to_track
-                if stock in account.positions.keys():
-                    account.positions[stock].stock = account.stocks_to_track[stock]
+            # every call below waits on kite for a bounded time so it finishes within its timeout, a call which
+            # is still queued when the timeout passes is never run
+            with loop_metrics.phase("price_update"):
+                await run_concurrently({stock: account.stocks_to_track[stock].update_price for stock in account.stocks_to_track.keys()})
+                for stock in account.stocks_to_track.keys():
+                    # because the instance of the stock stored in position is not the same stored in stocks_to_track
+                    if stock in account.positions.keys():
+                        account.positions[stock].stock = account.stocks_to_track[stock]
 
             if end_process():
                 break
@@ -81,83 +286,49 @@ async def background_task():
             """
 
             if START_TIME < current_time < STOP_BUYING_TIME:
-                try:
-                    # if current_time > START_BUYING_TIME:
-                    account.buy_stocks()
-                except:
-                    pass
-
-                for stock_col in filtered_stocks:
-                    if len(account.stocks_to_track) < get_max_stocks() and stock_col not in account.stocks_to_track.keys():
-                        account.stocks_to_track[stock_col] = StockInfo(stock_col, 'NSE')
-                        if not DEBUG:
-
-                            sell_orders: list = account.stocks_to_track[stock_col].get_quote["sell"]
-                            zero_quantity = True
-                            for item in sell_orders:
-                                if item['quantity'] > 0:
-                                    zero_quantity = False
-                                break
-                            if zero_quantity:
-                                continue
-                        _, _2 = account.stocks_to_track[stock_col].buy_parameters()
-                        # stock_df = prediction_df[[f"{stock_col}.NS"]]
-                        # stock_df.reset_index(inplace=True)
-                        # stock_df = stock_df[[f"{stock_col}.NS"]].bfill().ffill()
-                        # stock_df.columns = ['price']
-                        # stock_df.to_csv(f"temp/{stock_col}.csv")
+                # if current_time > START_BUYING_TIME:
+                with loop_metrics.phase("buy_scan"):
+                    await run_concurrently({stock: partial(account.buy_stocks, [stock]) for stock in list(account.stocks_to_track.keys())},
+                                           timeout=ORDER_CALL_TIMEOUT)
+
+                    for stock_col in filtered_stocks:
+                        if len(account.stocks_to_track) < get_max_stocks() and stock_col not in account.stocks_to_track.keys():
+                            await run_blocking(track_filtered_stock, account, stock_col)
 
             """
                 if the trigger for selling is breached in position then sell
             """
 
-            positions_to_delete = []  # this is needed or else it will alter the length during loop
-
-            for position_name in account.positions.keys():
-                position: Position = account.positions[position_name]
-                status = position.breached()
-                match status:
-                    case "DAY1BREACHED":
-                        logger.info(f" DAY1BREACHED -->sell {position.stock.stock_name} at {position.stock.latest_price}")
-                        positions_to_delete.append(position_name)
-                        logger.info(f"breached stock wallet {position_name} {account.stocks_to_track[position_name].wallet}")
-                        del account.stocks_to_track[position_name]  # delete from stocks to track
-                        filtered_stocks.remove(position_name)
-                    case "DAY1NOT":
-                        logger.info(f" DAY1NOT -->sell {position.stock.stock_name} at {position.stock.latest_price}")
-                        account.stocks_to_track[position_name].in_position = False
-                        positions_to_delete.append(position_name)
-
-                # if position.breached():
-                #     logger.info(f" line 89 -->sell {position.stock.stock_name} at {position.stock.latest_price}")
-                #     positions_to_delete.append(position_name)
-                #     del account.stocks_to_track[position_name]
-                #     filtered_stocks.remove(position_name)
-
-            for position_name in positions_to_delete:
-                del account.positions[position_name]
+            # each check deletes its own position once it is sold
+            with loop_metrics.phase("position_breach"):
+                await run_concurrently({
+                    position_name: partial(check_position, account, position_name, filtered_stocks)
+                    for position_name in list(account.positions.keys())
+                }, timeout=ORDER_CALL_TIMEOUT)
 
             """
                 if the trigger for selling is breached in holding then sell
             """
 
-            holdings_to_delete = []  # this is needed or else it will alter the length during loop
+            # each check deletes its own holding once it is sold
+            with loop_metrics.phase("holding_breach"):
+                await run_concurrently({
+                    holding_name: partial(check_holding, account, holding_name, current_time)
+                    for holding_name in list(account.holdings.keys())
+                }, timeout=ORDER_CALL_TIMEOUT)
 
-            for holding_name in account.holdings.keys():
-                holding: Holding = account.holdings[holding_name]
-
-                if START_TIME < current_time:
-                    if holding.breached():
-                        logger.info(f" line 89 -->sell {holding.stock.stock_name} at {holding.stock.latest_price}")
-                        holdings_to_delete.append(holding_name)
-                        del account.stocks_to_track[holding_name]
+        except:
+            logger.exception("Kite error may have happened")
+        finally:
+            loop_metrics.finish_iteration()
 
-            for holding_name in holdings_to_delete:
-                del account.holdings[holding_name]
+    if STREAMING_MODE:
+        tick_stream.stop()
 
+    for stock in account.stocks_to_track.keys():
+        account.stocks_to_track[stock].flush_prices()
 
-        except:
-            logger.exception("Kite error may have happened")
+    await write_behind.stop()
 
     wallet_list = {st: account.stocks_to_track[st].wallet for st in account.stocks_to_track.keys()}
     logger.info(f" remaining stocks wallet : {wallet_list}")
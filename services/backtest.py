@@ -0,0 +1,224 @@
+# Replays a day of minute bars through the same Account, StockInfo and Stage logic as the background task,
+# on a simulated clock and against a simulated exchange, e.g.
+#     python -m services.backtest 2024-05-10 --symbols RELIANCE TCS INFY
+#     python -m services.backtest 2024-05-10 --recording temp/ticks.jsonl
+import argparse
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from logging import Logger
+from time import perf_counter
+
+import pandas as pd
+
+from constants.settings import START_TIME, STOP_BUYING_TIME, END_TIME, BACKTEST_CAPITAL, set_allocation, \
+    set_max_stocks, get_max_stocks, end_process, set_end_process
+from models.account import Account
+from models.stock_info import StockInfo, set_quote_source
+from services.background_task import track_filtered_stock, check_position, check_holding
+from utils.clock import clock
+from utils.history_cache import HistoryCache
+from utils.logger import get_logger
+from utils.simulated_exchange import SimulatedExchange, Fill
+from utils.streaming.recording import load_recording
+from utils.take_position import set_order_executor
+
+logger: Logger = get_logger(__name__)
+
+
+def local_index(index: pd.Index) -> pd.DatetimeIndex:
+    index = pd.DatetimeIndex(index)
+    # the bars of yfinance are in the time zone of the exchange, the settings are in local time
+    return index.tz_convert("Asia/Kolkata").tz_localize(None) if index.tz is not None else index
+
+
+def load_bars(day: date, symbols: list[str] | None = None) -> pd.DataFrame:
+    """
+    minute closes of the day from the history cache, nothing is downloaded
+    :param day: day to be replayed
+    :param symbols: symbols without the .NS suffix, all the cached ones if None
+    :return: dataframe with the time of the bar as index and the symbols as columns
+    """
+    cached = HistoryCache("1m", "Close", offline=True).load()
+    if cached.empty:
+        return cached
+    cached.index = local_index(cached.index)
+    cached = cached[cached.index.date == day]
+    cached.columns = [column.removesuffix(".NS") for column in cached.columns]
+    return cached if symbols is None else cached[[symbol for symbol in symbols if symbol in cached.columns]]
+
+
+def bars_from_recording(path: str) -> pd.DataFrame:
+    """
+    last traded price of every instrument in every batch of ticks recorded by TickStream
+    :param path: path of the jsonl file
+    :return: dataframe with the time of the batch as index and the symbols as columns
+    """
+    rows = {
+        datetime.fromtimestamp(batch["time"]): {
+            tick["instrument"].split(":")[-1]: tick["last_price"] for tick in batch["ticks"] if "instrument" in tick
+        }
+        for batch in load_recording(path)
+    }
+    return pd.DataFrame.from_dict(rows, orient="index").sort_index()
+
+
+@dataclass
+class BacktestReport:
+    day: date | None
+    bars: int
+    fills: list[Fill]
+    wallets: dict[str, float]
+    open_positions: dict[str, dict]
+    elapsed: float
+
+    @property
+    def realized_pnl(self) -> float:
+        """
+            sum of the wallets, which hold the profit of every sale after the transaction cost
+        """
+        return sum(self.wallets.values())
+
+    @property
+    def unrealized_pnl(self) -> float:
+        return sum(position["unrealized_pnl"] for position in self.open_positions.values())
+
+    def summary(self) -> dict:
+        return {
+            "day": None if self.day is None else self.day.isoformat(),
+            "bars": self.bars,
+            "orders": len(self.fills),
+            "buys": sum(1 for fill in self.fills if fill.transaction_type == "BUY" and fill.filled_quantity > 0),
+            "sells": sum(1 for fill in self.fills if fill.transaction_type == "SELL" and fill.filled_quantity > 0),
+            "realized_pnl": round(self.realized_pnl, 2),
+            "unrealized_pnl": round(self.unrealized_pnl, 2),
+            "open_positions": len(self.open_positions),
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+@dataclass
+class Backtest:
+    """
+        Event driven replay of one day.
+
+        Every bar moves the clock to its time and is published by the simulated exchange as the depth of its
+        symbols, then the account goes through the same steps as one iteration of the background task: the
+        prices are updated, stocks are bought and tracked within the buying window, and the positions and
+        holdings are checked for their triggers. Quotes are read only from the exchange and orders are filled
+        by it straight away, so nothing goes to kite, nothing sleeps and the steps run one after the other in
+        the calling thread. A symbol is tracked only once it has had a price. The symbols of the bars take the
+        place of the screened stocks and share the capital equally.
+    """
+    bars: pd.DataFrame
+    capital: float = BACKTEST_CAPITAL
+    exchange: SimulatedExchange = field(default_factory=SimulatedExchange)
+    account: Account = field(default_factory=Account, init=False)
+    _stocks: dict[str, StockInfo] = field(default_factory=dict, init=False)
+
+    @staticmethod
+    def _session_time(time: datetime) -> datetime:
+        # the trading window in the settings is of today, only the time of the bar is compared with it
+        return datetime.combine(START_TIME.date(), time.time())
+
+    def _step(self, current_time: datetime, filtered_stocks: list[str]):
+        account = self.account
+        for stock in account.stocks_to_track.values():
+            # a symbol without a bar yet has no depth, it keeps its last price till it has one
+            if self.exchange.quote(stock.instrument) is not None:
+                stock.update_price()
+        for stock in account.stocks_to_track.keys():
+            # because the instance of the stock stored in position is not the same stored in stocks_to_track
+            if stock in account.positions.keys():
+                account.positions[stock].stock = account.stocks_to_track[stock]
+
+        if end_process():
+            return
+
+        if START_TIME < current_time < STOP_BUYING_TIME:
+            for stock in list(account.stocks_to_track.keys()):
+                try:
+                    account.buy_stocks([stock])
+                except:
+                    logger.exception(f"{stock} could not be bought")
+            for stock_col in filtered_stocks:
+                if len(account.stocks_to_track) < get_max_stocks() and stock_col not in account.stocks_to_track.keys() \
+                        and self.exchange.quote(f"{self.exchange.exchange}:{stock_col}") is not None:
+                    try:
+                        track_filtered_stock(account, stock_col)
+                    except:
+                        logger.exception(f"{stock_col} could not be tracked")
+
+        # the checks delete what they sell
+        for position_name in list(account.positions.keys()):
+            check_position(account, position_name, filtered_stocks)
+        for holding_name in list(account.holdings.keys()):
+            check_holding(account, holding_name, current_time)
+
+        # a stock which is sold is no longer tracked, its wallet is still needed for the report
+        self._stocks.update(account.stocks_to_track)
+
+    def run(self) -> BacktestReport:
+        """
+        replays all the bars, stopping at the end time of the settings
+        :return: fills, wallets and open positions of the day
+        """
+        symbols = [str(column) for column in self.bars.columns]
+        filtered_stocks = list(symbols)
+        set_allocation(self.capital / max(len(symbols), 1))
+        set_max_stocks(len(symbols))
+        set_end_process(False)
+        self.exchange.table.clear()
+        set_order_executor(self.exchange.execute)
+        set_quote_source(self.exchange.quote)
+
+        started = perf_counter()
+        bars = 0
+        try:
+            for time, row in zip(self.bars.index.to_pydatetime(), self.bars.to_numpy(dtype=float)):
+                current_time = self._session_time(time)
+                if current_time >= END_TIME or end_process():
+                    break
+                clock.set(time)
+                self.exchange.publish(dict(zip(symbols, row.tolist())))
+                self._step(current_time, filtered_stocks)
+                bars += 1
+        finally:
+            set_order_executor(None)
+            set_quote_source(None)
+            clock.reset()
+
+        open_positions = {}
+        for name, position in self.account.positions.items():
+            mark = self.exchange.table.last_price(position.stock.instrument) or position.buy_price
+            open_positions[name] = {
+                "buy_price": position.buy_price,
+                "quantity": position.quantity,
+                "mark_price": mark,
+                "unrealized_pnl": (mark - position.buy_price) * position.quantity,
+            }
+        return BacktestReport(
+            day=self.bars.index[0].date() if len(self.bars.index) > 0 else None,
+            bars=bars,
+            fills=self.exchange.fills,
+            wallets={name: stock.wallet for name, stock in self._stocks.items()},
+            open_positions=open_positions,
+            elapsed=perf_counter() - started,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replays a day of minute bars through the account")
+    parser.add_argument("day", type=date.fromisoformat)
+    parser.add_argument("--symbols", nargs="*")
+    parser.add_argument("--recording", help="jsonl of recorded ticks used instead of the history cache")
+    parser.add_argument("--capital", type=float, default=BACKTEST_CAPITAL)
+    arguments = parser.parse_args()
+
+    if arguments.recording:
+        history = bars_from_recording(arguments.recording)
+        history = history[history.index.date == arguments.day]
+    else:
+        history = load_bars(arguments.day, arguments.symbols)
+    report = Backtest(history, arguments.capital).run()
+    print(json.dumps(report.summary(), indent=2))
@@ -0,0 +1,215 @@
+# Runs the backtest of a day for many values of the strategy parameters on all the cores and ranks them, e.g.
+#     python -m services.parameter_sweep 2024-05-10 --samples 200
+#     python -m services.parameter_sweep 2024-05-10 --grid --screen
+import argparse
+import itertools
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from logging import Logger
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from constants.settings import BACKTEST_CAPITAL, SWEEP_RESULTS_DIR, SWEEP_WORKERS
+from constants.strategy_parameters import strategy_parameters
+from services.backtest import Backtest, load_bars, local_index
+from utils.history_cache import HistoryCache
+from utils.logger import get_logger
+from utils.tracking_components.stock_tracking import screen_stocks
+
+logger: Logger = get_logger(__name__)
+
+# values tried for every parameter, a list is taken as it is and a (low, high) tuple is sampled uniformly
+DEFAULT_SPACE: dict[str, list | tuple] = {
+    "delivery_initial_return": [0.001, 0.002, 0.003],
+    "delivery_incremental_return": [0.002, 0.004, 0.006],
+    "intraday_incremental_return": [0.002, 0.004, 0.006],
+    "expected_minimum_monthly_return": [0.04, 0.06, 0.08],
+    "rebuy_discount": (0.005, 0.04),
+    "signal_margin": (0.0, 0.005),
+    "day1_loss_threshold": (0.002, 0.01),
+    "continuous_down_limit": [1, 2, 3, 4],
+    # a band from 1.1 to 1.5 times the trigger with the denominator at its default of 3
+    "trigger_band_numerator": (3.3, 4.5),
+}
+
+# thresholds of the screening, tried only when the stocks are screened
+SCREEN_SPACE: dict[str, list | tuple] = {
+    "screen_window": [40, 60, 80],
+    "screen_maximum_weight": [0.7, 0.8, 0.9],
+    "screen_minimum_weight": [0.1, 0.2, 0.3],
+}
+
+
+def grid(space: dict[str, list | tuple]) -> list[dict]:
+    """
+    every combination of the listed values, a (low, high) tuple gives low, the middle and high
+    :param space: values of every parameter
+    :return: list of parameters to be tried
+    """
+    values = {
+        name: list(options) if isinstance(options, list) else [options[0], (options[0] + options[1]) / 2, options[1]]
+        for name, options in space.items()
+    }
+    return [dict(zip(values.keys(), combination)) for combination in itertools.product(*values.values())]
+
+
+def random_search(space: dict[str, list | tuple], samples: int, seed: int = 0) -> list[dict]:
+    """
+    random parameters from the space, the same seed always gives the same parameters
+    :param space: values of every parameter
+    :param samples: number of parameters to be tried
+    :param seed: seed of the random generator
+    :return: list of parameters to be tried
+    """
+    generator = random.Random(seed)
+
+    def sample(options: list | tuple):
+        if isinstance(options, list):
+            return generator.choice(options)
+        low, high = options
+        return generator.randint(low, high) if isinstance(low, int) and isinstance(high, int) else \
+            generator.uniform(low, high)
+
+    return [{name: sample(options) for name, options in space.items()} for _ in range(samples)]
+
+
+@dataclass
+class SharedFrame:
+    """
+        A float dataframe whose values are kept once in shared memory and are read by every worker without
+        being copied, only the index and the columns are sent to them.
+    """
+    name: str
+    shape: tuple[int, int]
+    index: pd.Index
+    columns: list[str]
+
+    @classmethod
+    def create(cls, frame: pd.DataFrame) -> tuple["SharedFrame", SharedMemory]:
+        values = frame.to_numpy(dtype=np.float64)
+        memory = SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=np.float64, buffer=memory.buf)[:] = values
+        return cls(memory.name, values.shape, frame.index, [str(column) for column in frame.columns]), memory
+
+    def attach(self) -> tuple[pd.DataFrame, SharedMemory]:
+        memory = SharedMemory(name=self.name)
+        values = np.ndarray(self.shape, dtype=np.float64, buffer=memory.buf)
+        values.flags.writeable = False
+        return pd.DataFrame(values, index=self.index, columns=self.columns, copy=False), memory
+
+
+# data of the sweep in a worker, attached once by _initialize_worker
+_bars: pd.DataFrame | None = None
+_daily: pd.DataFrame | None = None
+_memories: list[SharedMemory] = []
+
+
+def _initialize_worker(bars: SharedFrame, daily: SharedFrame | None):
+    global _bars, _daily
+    # thousands of backtests would fill the log, the workers only log the warnings
+    logging.disable(logging.INFO)
+    _bars, memory = bars.attach()
+    _memories.append(memory)
+    if daily is not None:
+        _daily, memory = daily.attach()
+        _memories.append(memory)
+
+
+def _run(parameters: dict, capital: float) -> dict:
+    strategy_parameters.reset()
+    try:
+        strategy_parameters.update(**parameters)
+        bars = _bars
+        if _daily is not None:
+            # the stocks are screened with the parameters on the history before the day
+            day = bars.index[0].date()
+            history = _daily[_daily.index.date < day].dropna(axis=1)
+            selected = {symbol.removesuffix(".NS") for symbol in screen_stocks(history, datetime.combine(day, time()))}
+            bars = bars[[symbol for symbol in bars.columns if symbol in selected]]
+        summary = Backtest(bars, capital).run().summary() if len(bars.columns) > 0 else {"bars": 0}
+        summary["pnl"] = summary.get("realized_pnl", 0.0) + summary.get("unrealized_pnl", 0.0)
+        summary["error"] = None
+    except Exception as error:
+        summary = {"pnl": float("nan"), "error": repr(error)}
+    return {**parameters, **summary}
+
+
+@dataclass
+class ParameterSweep:
+    """
+        Backtests the day once for every set of parameters in a process pool and ranks them by the profit.
+
+        The bars, and the daily history used for screening if given, are put in shared memory once and
+        attached by every worker, so a worker holds no copy of them and only the parameters and the summary
+        go between the processes.
+    """
+    bars: pd.DataFrame
+    daily: pd.DataFrame | None = None
+    capital: float = BACKTEST_CAPITAL
+    workers: int | None = SWEEP_WORKERS
+    results_dir: str = SWEEP_RESULTS_DIR
+    results: pd.DataFrame | None = field(default=None, init=False)
+
+    def run(self, candidates: list[dict]) -> pd.DataFrame:
+        """
+        backtests every set of parameters and writes the ranked results to a csv
+        :param candidates: parameters from grid or random_search
+        :return: one row per set of parameters, the most profitable first
+        """
+        shared_bars, bars_memory = SharedFrame.create(self.bars)
+        memories = [bars_memory]
+        shared_daily = None
+        if self.daily is not None:
+            shared_daily, daily_memory = SharedFrame.create(self.daily)
+            memories.append(daily_memory)
+
+        workers = self.workers or os.cpu_count()
+        try:
+            # spawned workers do not inherit the threads of this process e.g. the log listener
+            with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=_initialize_worker,
+                                     initargs=(shared_bars, shared_daily)) as executor:
+                rows = list(executor.map(_run, candidates, itertools.repeat(self.capital),
+                                         chunksize=max(len(candidates) // (4 * workers), 1)))
+        finally:
+            for memory in memories:
+                memory.close()
+                memory.unlink()
+
+        self.results = pd.DataFrame(rows).sort_values("pnl", ascending=False, na_position="last")
+        self.results.reset_index(drop=True, inplace=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+        path = f"{self.results_dir}/sweep_{self.bars.index[0]:%Y%m%d}_{datetime.now():%H%M%S}.csv"
+        self.results.to_csv(path)
+        logger.info(f"{len(candidates)} parameter sets backtested, results written to {path}")
+        return self.results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="backtests a day for many values of the strategy parameters")
+    parser.add_argument("day", type=date.fromisoformat)
+    parser.add_argument("--symbols", nargs="*")
+    parser.add_argument("--grid", action="store_true", help="every combination instead of random samples")
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--screen", action="store_true", help="screens the stocks with the cached daily history")
+    parser.add_argument("--capital", type=float, default=BACKTEST_CAPITAL)
+    parser.add_argument("--workers", type=int, default=SWEEP_WORKERS)
+    arguments = parser.parse_args()
+
+    daily_history = None
+    if arguments.screen:
+        daily_history = HistoryCache("1d", "Open", offline=True).load()
+        daily_history.index = local_index(daily_history.index)
+        daily_history = daily_history.bfill().ffill()
+    sweep = ParameterSweep(load_bars(arguments.day, arguments.symbols), daily_history, arguments.capital,
+                           arguments.workers)
+    space = {**DEFAULT_SPACE, **SCREEN_SPACE} if arguments.screen else DEFAULT_SPACE
+    ranked = sweep.run(grid(space) if arguments.grid else random_search(space, arguments.samples, arguments.seed))
+    print(ranked.head(10).to_string())
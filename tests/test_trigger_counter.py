@@ -0,0 +1,95 @@
+import math
+import random
+
+import pytest
+
+from models.stock_stage import Stage
+
+# the loop of set_trigger never ends for these, the closed form gives no trigger instead
+LOOP_LIMIT = 10_000
+
+
+def iterative_counter(target, selling_price: float) -> int | None:
+    """
+        counter of the last trigger the loop of set_trigger used to set, None if the loop would not end
+    """
+    counter = 1
+    while target(counter) < selling_price:
+        counter += 1
+        if counter > LOOP_LIMIT:
+            return None
+    return counter - 1
+
+
+def make_target(cost: float, expected_return: float, incremental_return: float, wallet_per_share: float):
+    return lambda counter: cost * (1 + expected_return + counter * incremental_return) - wallet_per_share
+
+
+def check(cost, expected_return, incremental_return, wallet_per_share, selling_price):
+    target = make_target(cost, expected_return, incremental_return, wallet_per_share)
+    expected = iterative_counter(target, selling_price)
+    actual = Stage.trigger_counter(target, selling_price, cost * incremental_return)
+    if expected is None:
+        assert actual == 0
+    else:
+        assert actual == expected, (cost, expected_return, incremental_return, wallet_per_share, selling_price)
+
+
+def random_case(generator: random.Random) -> tuple[float, float, float, float]:
+    cost = generator.choice([generator.uniform(1, 5000), round(generator.uniform(1, 5000), 2)])
+    expected_return = generator.uniform(-0.05, 0.1)
+    incremental_return = generator.choice([generator.uniform(1e-3, 0.05), 0.002, 0.005, 0.01])
+    wallet_per_share = generator.uniform(-cost * 0.05, cost * 0.05)
+    return cost, expected_return, incremental_return, wallet_per_share
+
+
+def test_random_selling_prices():
+    generator = random.Random(20)
+    for _ in range(5_000):
+        cost, expected_return, incremental_return, wallet_per_share = random_case(generator)
+        selling_price = cost * generator.uniform(0.8, 1.5)
+        check(cost, expected_return, incremental_return, wallet_per_share, selling_price)
+
+
+def test_selling_price_on_a_target():
+    generator = random.Random(21)
+    for _ in range(5_000):
+        cost, expected_return, incremental_return, wallet_per_share = random_case(generator)
+        target = make_target(cost, expected_return, incremental_return, wallet_per_share)
+        exact = target(generator.randint(0, 200))
+        for selling_price in (exact, math.nextafter(exact, math.inf), math.nextafter(exact, -math.inf)):
+            check(cost, expected_return, incremental_return, wallet_per_share, selling_price)
+
+
+@pytest.mark.parametrize("incremental_return", [0.0, -0.0, -0.002, -1.0])
+def test_step_not_positive(incremental_return):
+    generator = random.Random(22)
+    for _ in range(200):
+        cost, expected_return, _, wallet_per_share = random_case(generator)
+        for selling_price in (cost * generator.uniform(0.5, 2), cost * (1 + expected_return) - wallet_per_share):
+            check(cost, expected_return, incremental_return, wallet_per_share, selling_price)
+
+
+@pytest.mark.parametrize("selling_price", [math.nan, math.inf, -math.inf])
+def test_non_finite_selling_price(selling_price):
+    check(100.0, 0.01, 0.002, 0.0, selling_price)
+
+
+@pytest.mark.parametrize("cost", [math.nan, math.inf, -math.inf])
+def test_non_finite_cost(cost):
+    check(cost, 0.01, 0.002, 0.0, 120.0)
+
+
+@pytest.mark.parametrize("incremental_return", [math.nan, math.inf, -math.inf])
+def test_non_finite_step(incremental_return):
+    check(100.0, 0.01, incremental_return, 0.0, 120.0)
+
+
+@pytest.mark.parametrize("wallet_per_share", [math.nan, math.inf, -math.inf])
+def test_non_finite_wallet(wallet_per_share):
+    check(100.0, 0.01, 0.002, wallet_per_share, 120.0)
+
+
+def test_large_counter():
+    check(100.0, 0.0, 1e-4, 0.0, 150.0)
+    check(0.01, 0.0, 1e-4, 0.0, 0.02)
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import pickle
+import struct
+from copy import deepcopy
+from dataclasses import dataclass, field
+from datetime import date
+from logging import Logger
+from time import monotonic
+
+from constants.settings import SNAPSHOT_PATH, SNAPSHOT_INTERVAL
+from models.account import Account
+from models.stages.holding import Holding
+from models.stages.position import Position
+from models.stock_info import StockInfo
+from utils.executor import run_blocking
+from utils.logger import get_logger
+
+logger: Logger = get_logger(__name__)
+
+SNAPSHOT_MAGIC = b"ZTSNAP"
+# increased whenever the state written changes, an older snapshot is then ignored
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct(">6sHI")  # magic, version, ordinal of the trading day
+
+
+@dataclass
+class AccountSnapshot:
+    """
+        Periodic binary snapshot of the account so that a restart during the day carries on from where it stopped.
+
+        The state of every stock (wallet, flags, indicators and buffered prices), position and holding and the
+        session values of the background task are captured on the loop, which takes a few microseconds per stock,
+        and are then pickled and written in the thread pool. The file is written to a temporary path and
+        replaced so that a crash while writing leaves the previous snapshot. Only a snapshot of the same day
+        is restored.
+    """
+    path: str = SNAPSHOT_PATH
+    interval: float = SNAPSHOT_INTERVAL
+    _written_at: float | None = field(default=None, init=False)
+    _task: asyncio.Task | None = field(default=None, init=False)
+
+    @staticmethod
+    def capture(account: Account, session: dict) -> dict:
+        """
+        copies the state of the account, must be called when no worker thread is changing it
+        :param account: account of the background task
+        :param session: values of the background task e.g. filtered_stocks
+        :return: state which can be written
+        """
+        stocks = {name: stock.snapshot_state() for name, stock in account.stocks_to_track.items()}
+
+        def stage_state(name: str, stage: Position | Holding) -> dict:
+            state = {"stage": stage.snapshot_state(), "stock": None}
+            # the stock of a stage is normally the tracked one, otherwise it is kept with the stage
+            if account.stocks_to_track.get(name) is not stage.stock:
+                state["stock"] = stage.stock.snapshot_state()
+            return state
+
+        return {
+            "session": deepcopy(session),
+            "stocks": stocks,
+            "positions": {name: stage_state(name, position) for name, position in account.positions.items()},
+            "holdings": {name: stage_state(name, holding) for name, holding in account.holdings.items()},
+        }
+
+    def write(self, state: dict):
+        """
+        writes the state with the header to a temporary file and replaces the snapshot with it
+        :param state: state from capture
+        :return: None
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "wb") as file:
+            file.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, date.today().toordinal()))
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def save_in_background(self, account: Account, session: dict):
+        """
+        captures the state if the interval has passed and writes it in the thread pool without waiting,
+        nothing is captured while the previous snapshot is still being written
+        :param account: account of the background task
+        :param session: values of the background task e.g. filtered_stocks
+        :return: None
+        """
+        if self._written_at is not None and monotonic() - self._written_at < self.interval:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._written_at = monotonic()
+        self._task = asyncio.create_task(run_blocking(self.write, self.capture(account, session), timeout=None))
+        self._task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"snapshot could not be written: {task.exception()!r}")
+
+    def load(self) -> dict | None:
+        """
+        reads the snapshot of today
+        :return: state from capture or None if there is no usable snapshot
+        """
+        try:
+            with open(self.path, "rb") as file:
+                magic, version, day = HEADER.unpack(file.read(HEADER.size))
+                if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or day != date.today().toordinal():
+                    logger.info(f"snapshot {self.path} is of another day or version, it is not restored")
+                    return None
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception(f"snapshot {self.path} could not be read")
+            return None
+
+    @staticmethod
+    def restore(state: dict) -> tuple[Account, dict]:
+        """
+        builds the account back from the state
+        :param state: state from load
+        :return: account and the session values of the background task
+        """
+        account = Account()
+        for name, stock_state in state["stocks"].items():
+            account.stocks_to_track[name] = StockInfo.from_state(stock_state)
+
+        def stage(cls, name: str, stage_state: dict):
+            stock = account.stocks_to_track[name] if stage_state["stock"] is None else \
+                StockInfo.from_state(stage_state["stock"])
+            return cls.from_state(stage_state["stage"], stock)
+
+        for name, position_state in state["positions"].items():
+            account.positions[name] = stage(Position, name, position_state)
+        for name, holding_state in state["holdings"].items():
+            account.holdings[name] = stage(Holding, name, holding_state)
+        return account, state["session"]
+
+
+account_snapshot = AccountSnapshot()
@@ -0,0 +1,50 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+
+@dataclass
+class Clock:
+    """
+        Time seen by the trading logic.
+
+        It is the wall clock unless a backtest or a load test sets a simulated time, which then only moves
+        when it is advanced or slept on so that a day can be replayed without waiting for it.
+    """
+    _simulated: datetime | None = None
+
+    @property
+    def simulated(self) -> bool:
+        return self._simulated is not None
+
+    def now(self) -> datetime:
+        return datetime.now() if self._simulated is None else self._simulated
+
+    def set(self, time: datetime):
+        """
+        moves the simulated time to the given time
+        :param time: time of the bar being replayed
+        :return: None
+        """
+        self._simulated = time
+
+    async def sleep(self, seconds: float):
+        """
+        sleeps on the wall clock, or moves the simulated time forward and only lets the other tasks run
+        :param seconds: seconds to sleep
+        :return: None
+        """
+        if self._simulated is None:
+            await asyncio.sleep(seconds)
+        else:
+            self._simulated += timedelta(seconds=seconds)
+            await asyncio.sleep(0)
+
+    def reset(self):
+        """
+            goes back to the wall clock
+        """
+        self._simulated = None
+
+
+clock = Clock()
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def depth_arrays(orders: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    converts one side of the market depth into price and quantity arrays
+    :param orders: list of {"price", "quantity", "orders"} as received in the depth
+    :return: prices and quantities at every level, the quantity of a level is counted once for every order
+    """
+    prices = np.fromiter((item["price"] for item in orders), dtype=np.float64, count=len(orders))
+    quantities = np.fromiter((item["orders"] * item["quantity"] for item in orders), dtype=np.int64, count=len(orders))
+    return prices, quantities
+
+
+def price_for_quantity(orders: list[dict], quantity: int) -> float | None:
+    """
+    volume weighted price at which the given quantity gets executed by walking the depth
+    :param orders: list of {"price", "quantity", "orders"} as received in the depth
+    :param quantity: quantity to be executed
+    :return: average execution price or None if the depth cannot fill it
+    """
+    prices, quantities = depth_arrays(orders)
+    cumulative_quantities = np.cumsum(quantities)
+    # the depth has to have more than the quantity, exactly the same quantity was never treated as filled
+    if quantity <= 0 or len(orders) == 0 or cumulative_quantities[-1] <= quantity:
+        return None
+
+    level = int(np.searchsorted(cumulative_quantities, quantity))
+    taken = quantities[:level + 1].copy()
+    taken[level] = quantity - (cumulative_quantities[level - 1] if level > 0 else 0)
+    return float(np.dot(prices[:level + 1], taken) / quantity)
+
+
+def fill_for_amount(orders: list[dict], amount: float) -> tuple[int, float]:
+    """
+    quantity which can be executed without the total exceeding the amount by walking the depth
+    :param orders: list of {"price", "quantity", "orders"} as received in the depth
+    :param amount: maximum amount to be spent
+    :return: quantity and the total amount at which it gets executed
+    """
+    prices, quantities = depth_arrays(orders)
+    cumulative_quantities = np.cumsum(quantities)
+    cumulative_amounts = np.cumsum(prices * quantities)
+
+    level = int(np.searchsorted(cumulative_amounts, amount, side="right"))
+    if level == len(orders):
+        return (int(cumulative_quantities[-1]), float(cumulative_amounts[-1])) if len(orders) > 0 else (0, 0.0)
+
+    quantity_before = int(cumulative_quantities[level - 1]) if level > 0 else 0
+    amount_before = float(cumulative_amounts[level - 1]) if level > 0 else 0.0
+    # only a part of this level can be bought
+    partial = min(int((amount - amount_before) // prices[level]), int(quantities[level]) - 1)
+    while partial > 0 and amount_before + partial * prices[level] > amount:
+        partial -= 1
+    return quantity_before + partial, amount_before + partial * float(prices[level])
+
+
+def fill_for_quantity(orders: list[dict], quantity: int) -> tuple[int, float | None]:
+    """
+    quantity which gets executed out of the given quantity and its average price, used to estimate slippage
+    and to fill the orders of the paper broker
+    :param orders: list of {"price", "quantity", "orders"} as received in the depth
+    :param quantity: quantity to be executed
+    :return: executed quantity, which is less if the depth is not enough, and its average price
+    """
+    prices, quantities = depth_arrays(orders)
+    filled = int(min(quantity, quantities.sum())) if len(orders) > 0 else 0
+    if filled <= 0:
+        return 0, None
+
+    cumulative_quantities = np.cumsum(quantities)
+    level = int(np.searchsorted(cumulative_quantities, filled))
+    taken = quantities[:level + 1].copy()
+    taken[level] = filled - (cumulative_quantities[level - 1] if level > 0 else 0)
+    return filled, float(np.dot(prices[:level + 1], taken) / filled)
@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, Executor
+from functools import partial
+from logging import Logger
+from typing import Callable, Any
+
+from constants.settings import BLOCKING_POOL_SIZE, BLOCKING_CALL_TIMEOUT, BLOCKING_RETRY_BACKOFF
+from utils.logger import get_logger
+
+logger: Logger = get_logger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+
+
+async def run_blocking(function: Callable, *args, timeout: float | None = BLOCKING_CALL_TIMEOUT, retries: int = 0,
+                       backoff: float = BLOCKING_RETRY_BACKOFF, executor: Executor | None = None, **kwargs) -> Any:
+    """
+    runs a blocking function in the thread pool and waits for it without blocking the event loop.
+
+    If it fails or does not finish within the timeout then it is tried again after backoff seconds,
+    doubling the wait every time. A call which is still queued in the pool when the timeout passes is never
+    run, but one which has started cannot be stopped and its thread finishes on its own, so a call which
+    changes state has to bound its own waits.
+
+    :param function: blocking function to be called
+    :param timeout: maximum seconds to wait for one attempt, None to wait till it finishes
+    :param retries: number of times it is tried again after the first attempt
+    :param backoff: seconds to wait before the first retry
+    :param executor: pool in which it is run, the shared blocking pool if None
+    :return: whatever the function returns
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries + 1):
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(executor or _executor, partial(function, *args, **kwargs)), timeout)
+        except Exception:
+            if attempt == retries:
+                raise
+            logger.info(f"retrying {getattr(function, '__name__', function)} after attempt {attempt + 1} failed")
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+
+async def run_concurrently(calls: dict[str, Callable], timeout: float | None = BLOCKING_CALL_TIMEOUT,
+                           retries: int = 0) -> dict:
+    """
+    runs all the blocking calls concurrently in the thread pool,
+    so the time taken is that of the slowest call and not the sum of all of them
+    :param calls: dictionary with a key e.g. stock name and a function which takes no argument
+    :param timeout: maximum seconds to wait for one attempt of a call
+    :param retries: number of times a failed call is tried again
+    :return: dictionary with the key and what the call returned, failed calls are logged and left out
+    """
+    keys = list(calls.keys())
+    results = await asyncio.gather(*[
+        run_blocking(calls[key], timeout=timeout, retries=retries) for key in keys
+    ], return_exceptions=True)
+
+    output = {}
+    for key, result in zip(keys, results):
+        if isinstance(result, BaseException):
+            logger.error(f"blocking call failed for {key}: {result!r}")
+        else:
+            output[key] = result
+    return output
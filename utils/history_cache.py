@@ -0,0 +1,121 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from logging import Logger
+
+import pandas as pd
+import pyarrow.feather as feather
+import yfinance as yf
+
+from constants.settings import HISTORY_CACHE_DIR, OFFLINE_MODE
+from utils.logger import get_logger
+
+logger: Logger = get_logger(__name__)
+
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1wk": 7, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731}
+INDEX_COLUMN = "Datetime"
+
+
+@dataclass
+class HistoryCache:
+    """
+        Local columnar store of the yfinance history for one interval and one price field.
+
+        The prices are kept in a feather file with one row per bar and one column per ticker. On every
+        download only the bars after its own last cached one are fetched for each ticker already present,
+        and the whole period only for new tickers. In offline mode nothing is downloaded.
+    """
+    interval: str
+    price_field: str
+    directory: str = HISTORY_CACHE_DIR
+    offline: bool = OFFLINE_MODE
+
+    @property
+    def file_path(self) -> str:
+        return f"{self.directory}/{self.price_field}_{self.interval}.feather"
+
+    def load(self) -> pd.DataFrame:
+        """
+        reads the cached prices using a memory map
+        :return: dataframe with datetime index and tickers as columns, empty if nothing is cached
+        """
+        if not os.path.exists(self.file_path):
+            return pd.DataFrame()
+        data: pd.DataFrame = feather.read_table(self.file_path, memory_map=True).to_pandas()
+        return data.set_index(INDEX_COLUMN)
+
+    def save(self, data: pd.DataFrame):
+        """
+        writes the prices to a temporary file and then replaces the cache so that it is never half written
+        :param data: dataframe with datetime index and tickers as columns
+        :return: None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        data = data.copy()
+        data.columns = [str(column) for column in data.columns]
+        data.index.name = INDEX_COLUMN
+        feather.write_feather(data.reset_index(), self.file_path + ".tmp")
+        os.replace(self.file_path + ".tmp", self.file_path)
+
+    def _fetch(self, tickers: list[str], start: datetime | None = None, period: str | None = None) -> pd.DataFrame:
+        # the whole period is asked for as a period so that the bars are the ones yfinance gives for it
+        window = {"period": period} if start is None else {"start": start}
+        data = yf.download(tickers=tickers, interval=self.interval, show_errors=False, **window)[self.price_field]
+        # for a single ticker yfinance returns a series
+        if isinstance(data, pd.Series):
+            data = data.to_frame(tickers[0])
+        return data
+
+    def download(self, tickers: list[str], period: str) -> pd.DataFrame:
+        """
+        returns the prices of the tickers for the period, downloading only what is not cached
+        :param tickers: list of yfinance tickers e.g. ['RELIANCE.NS']
+        :param period: period as accepted by yfinance e.g. '1y', '1wk'
+        :return: dataframe with datetime index and tickers as columns
+        """
+        start = datetime.now() - timedelta(days=PERIOD_DAYS[period])
+        cached = self.load()
+        earliest = pd.Timestamp(start)
+
+        if not self.offline:
+            present = [ticker for ticker in tickers if ticker in cached.columns]
+            missing = [ticker for ticker in tickers if ticker not in cached.columns]
+            downloaded = []
+            if len(missing) > 0:
+                downloaded.append(self._fetch(missing, period=period))
+                # the first bar yfinance gives for the period may be a little before start, it is kept
+                if not downloaded[-1].empty:
+                    earliest = min(earliest, downloaded[-1].index.min().tz_localize(None))
+            if len(present) > 0:
+                # every ticker is topped up from its own last bar, which is fetched again since it may have been
+                # incomplete, the tickers with the same last bar are fetched together and one without a bar from start
+                by_last_bar: dict[datetime, list[str]] = {}
+                for ticker, last_bar in cached[present].apply(pd.Series.last_valid_index).items():
+                    by_last_bar.setdefault(start if pd.isna(last_bar) else last_bar.to_pydatetime(), []).append(ticker)
+                for last_bar, group in by_last_bar.items():
+                    downloaded.append(self._fetch(group, last_bar))
+
+            if len(downloaded) > 0:
+                fresh = pd.concat(downloaded, axis=1)
+                fresh = fresh.loc[:, ~fresh.columns.duplicated()]
+                cached = fresh.combine_first(cached) if not cached.empty else fresh
+                cached = cached[cached.index >= earliest.tz_localize(cached.index.tz)]
+                self.save(cached)
+                logger.info(f"history {self.price_field} {self.interval}: downloaded {len(missing)} new and topped up {len(present)} tickers")
+
+        available = [ticker for ticker in tickers if ticker in cached.columns]
+        if cached.empty:
+            return pd.DataFrame(columns=available)
+        return cached.loc[cached.index >= earliest.tz_localize(cached.index.tz), available]
+
+
+def download_history(tickers: list[str], period: str, interval: str, price_field: str) -> pd.DataFrame:
+    """
+    cached replacement of yf.download(tickers, period, interval)[price_field]
+    :param tickers: list of yfinance tickers e.g. ['RELIANCE.NS']
+    :param period: period as accepted by yfinance e.g. '1y', '1wk'
+    :param interval: interval as accepted by yfinance e.g. '1d', '1m'
+    :param price_field: one of Open, High, Low, Close, Adj Close, Volume
+    :return: dataframe with datetime index and tickers as columns
+    """
+    return HistoryCache(interval, price_field).download(tickers, period)
@@ -38,3 +38,48 @@ def kaufman_indicator(price: pd.Series, n=10, pow1=1, pow2=30):
             else:
                 answer[i] = answer[i - 1] + sc[i] * (price[i] - answer[i - 1])
     return answer
+
+
+def kaufman_indicator_matrix(prices: pd.DataFrame, n=10, pow1=1, pow2=30):
+    """
+    Given a dataframe with one column per stock, it returns the Kaufman indicator of all the stocks at once.
+
+    The recursion still goes day by day but every day is computed for all the stocks together, the values
+    are the same as running kaufman_indicator on every column.
+
+    :param prices: Price dataframe with days as rows and stocks as columns
+    :param n: number of observations preceding current value
+    :param pow1: the fastest period
+    :param pow2: the slowest period
+    :return: a 2D numpy array (days x stocks) with all the calculated kama indicator values
+    """
+    abs_diffx = abs(prices - prices.shift(1))
+    abs_price_change = np.abs(prices - prices.shift(n))
+    vol = abs_diffx.rolling(n).sum()
+    er = abs_price_change / vol
+    fastest_sc, slowest_sc = 2 / (pow1 + 1), 2 / (pow2 + 1)
+
+    sc = ((er * (fastest_sc - slowest_sc) + slowest_sc) ** 2.0).to_numpy()
+    vol = vol.to_numpy()
+    price = prices.to_numpy(dtype=np.float64)
+
+    answer = np.zeros(price.shape)
+    first_value = np.ones(price.shape[1], dtype=bool)
+    previous = np.zeros(price.shape[1])
+    for i in range(price.shape[0]):
+        zero_volatility = vol[i] == 0
+        missing = ~zero_volatility & (sc[i] != sc[i])
+        first = ~zero_volatility & ~missing & first_value
+        rest = ~zero_volatility & ~missing & ~first_value
+
+        # if volatility is 0, it turns out to be nan so is considered separately
+        answer[i, zero_volatility] = previous[zero_volatility] + 1 * (price[i, zero_volatility] - previous[zero_volatility])
+        # this condition is handled if the sc is np.nan
+        answer[i, missing] = np.nan
+        # the first value is the actual value to merge the indicator results fast
+        answer[i, first] = price[i, first]
+        answer[i, rest] = previous[rest] + sc[i, rest] * (price[i, rest] - previous[rest])
+
+        first_value &= ~first
+        previous = answer[i]
+    return answer
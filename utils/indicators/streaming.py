@@ -0,0 +1,197 @@
+from dataclasses import dataclass, field
+from math import nan
+
+from constants.strategy_parameters import strategy_parameters
+
+
+@dataclass
+class RollingSum:
+    """
+        Online equivalent of pandas `Series.rolling(window).sum()`.
+
+        pandas adds the incoming value and removes the outgoing one using Kahan compensation and returns
+        value * count when the whole window holds the same value, so the same steps are followed here
+        to get identical floats.
+    """
+    window: int
+    _values: list = field(default_factory=list, init=False)
+    _nobs: int = field(default=0, init=False)
+    _sum: float = field(default=0.0, init=False)
+    _compensation_add: float = field(default=0.0, init=False)
+    _compensation_remove: float = field(default=0.0, init=False)
+    _consecutive_same: int = field(default=0, init=False)
+    _prev_value: float = field(default=nan, init=False)
+
+    def _add(self, value: float):
+        if value == value:
+            self._nobs += 1
+            y = value - self._compensation_add
+            t = self._sum + y
+            self._compensation_add = t - self._sum - y
+            self._sum = t
+            if value == self._prev_value:
+                self._consecutive_same += 1
+            else:
+                self._consecutive_same = 1
+            self._prev_value = value
+
+    def _remove(self, value: float):
+        if value == value:
+            self._nobs -= 1
+            y = -value - self._compensation_remove
+            t = self._sum + y
+            self._compensation_remove = t - self._sum - y
+            self._sum = t
+
+    def update(self, value: float) -> float:
+        """
+        adds a new value and returns the sum of the latest window
+        :param value: the new observation
+        :return: sum of the window or nan till the window is full
+        """
+        if len(self._values) == 0:
+            self._prev_value = value
+        self._values.append(value)
+        if len(self._values) > self.window:
+            self._remove(self._values.pop(0))
+        self._add(value)
+
+        if self._nobs >= self.window:
+            if self._consecutive_same >= self._nobs:
+                return self._prev_value * self._nobs
+            return self._sum
+        return nan
+
+
+@dataclass
+class ExponentialMean:
+    """
+        Online equivalent of pandas `Series.ewm(span=span).mean()` with the default adjust=True.
+    """
+    span: float
+    _weighted: float = field(default=nan, init=False)
+    _old_weight: float = field(default=1.0, init=False)
+    _nobs: int = field(default=0, init=False)
+    _started: bool = field(default=False, init=False)
+
+    def update(self, value: float) -> float:
+        """
+        adds a new value and returns the latest exponential mean
+        :param value: the new observation
+        :return: the exponential mean or nan if nothing has been observed yet
+        """
+        is_observation = value == value
+        self._nobs += int(is_observation)
+        if not self._started:
+            self._started = True
+            self._weighted = value
+        elif self._weighted == self._weighted:
+            # ignore_na is False so the older weights decay even when nan is received
+            self._old_weight *= 1. - 1. / (1. + (self.span - 1.) / 2.)
+            if is_observation:
+                if self._weighted != value:
+                    self._weighted = self._old_weight * self._weighted + value
+                    self._weighted /= (self._old_weight + 1.)
+                self._old_weight += 1.
+        elif is_observation:
+            self._weighted = value
+        return self._weighted if self._nobs >= 1 else nan
+
+
+@dataclass
+class StreamingKaufman:
+    """
+        Online version of `utils.indicators.kaufman_indicator.kaufman_indicator`.
+
+        Each update costs O(1) and the value returned is the same as the last value of the batch function
+        run over all the prices seen so far.
+    """
+    n: int = 10
+    pow1: int = 1
+    pow2: int = 30
+    _prices: list = field(default_factory=list, init=False)
+    _volatility: RollingSum = field(default=None, init=False)
+    _answer: float = field(default=0.0, init=False)
+    _first_value: bool = field(default=True, init=False)
+
+    def __post_init__(self):
+        self._volatility = RollingSum(self.n)
+
+    def update(self, price: float) -> float:
+        """
+        adds a new price and returns the latest KAMA value
+        :param price: the latest price of the stock
+        :return: KAMA value which can be nan at the start
+        """
+        self._prices.append(price)
+        if len(self._prices) > self.n + 1:
+            self._prices.pop(0)
+
+        abs_diffx = abs(price - self._prices[-2]) if len(self._prices) > 1 else nan
+        abs_price_change = abs(price - self._prices[0]) if len(self._prices) > self.n else nan
+        vol = self._volatility.update(abs_diffx)
+        fastest_sc, slowest_sc = 2 / (self.pow1 + 1), 2 / (self.pow2 + 1)
+        sc = (abs_price_change / vol * (fastest_sc - slowest_sc) + slowest_sc) ** 2.0 if vol == vol and vol != 0 else nan
+
+        # if volatility is 0, it turns out to be nan so is considered separately
+        if vol == 0:
+            self._answer = self._answer + 1 * (price - self._answer)
+        # this condition is handled if the sc is np.nan
+        elif sc != sc:
+            self._answer = nan
+        else:
+            # the first value is the actual value to merge the indicator results fast
+            if self._first_value:
+                self._answer = price
+                self._first_value = False
+            else:
+                self._answer = self._answer + sc * (price - self._answer)
+        return self._answer
+
+
+@dataclass
+class StreamingSignal:
+    """
+        Keeps all the indicator values needed by StockInfo up to date one price at a time.
+
+        line is the KAMA of the price and signal is its 5 span exponential mean. The running minimums and
+        the last two crossover positions used in whether_buy are kept as well, so nothing has to be
+        recomputed over the whole day on every tick.
+    """
+    count: int = field(default=0, init=False)
+    low: float | None = field(default=None, init=False)
+    latest_indicator_price: float | None = field(default=None, init=False)
+    positions: list = field(default_factory=lambda: [0, 0], init=False)
+    price_positions: list = field(default_factory=lambda: [0, 0], init=False)
+    _kaufman: StreamingKaufman = field(default_factory=StreamingKaufman, init=False)
+    _line_signal: ExponentialMean = field(default_factory=lambda: ExponentialMean(5), init=False)
+    _price_signal: ExponentialMean = field(default_factory=lambda: ExponentialMean(5), init=False)
+    _signal_min: float = field(default=nan, init=False)
+    _price_signal_min: float = field(default=nan, init=False)
+    _price_min: float = field(default=nan, init=False)
+
+    def update(self, price: float):
+        """
+        updates every indicator with the latest price
+        :param price: the latest price of the stock
+        :return: None
+        """
+        self.count += 1
+
+        if price == price and not price >= self._price_min:
+            self._price_min = price
+        if self.count > 1:  # first value is the buy price only so from 2nd low value is taken
+            self.low = self._price_min
+
+        line = self._kaufman.update(price)
+        signal = self._line_signal.update(line)
+        if line == line and signal == signal:
+            self.latest_indicator_price = signal
+        if signal == signal and not signal >= self._signal_min:
+            self._signal_min = signal
+        self.positions = [self.positions[-1], 1 if signal > self._signal_min * (1 + strategy_parameters.signal_margin) else 0]
+
+        price_signal = self._price_signal.update(price)
+        if price_signal == price_signal and not price_signal >= self._price_signal_min:
+            self._price_signal_min = price_signal
+        self.price_positions = [self.price_positions[-1], 1 if price_signal > self._price_signal_min else 0]
@@ -0,0 +1,189 @@
+import csv
+import os
+from dataclasses import dataclass, field
+from datetime import date
+from glob import glob
+from logging import Logger
+from threading import Lock
+
+import numpy as np
+
+from constants.settings import INSTRUMENTS_DIR, INSTRUMENTS_SOURCE_FILE, OFFLINE_MODE
+from utils.kite_scheduler import kite_scheduler
+from utils.logger import get_logger
+
+logger: Logger = get_logger(__name__)
+
+INSTRUMENT_DTYPE = np.dtype([
+    ("instrument_token", "<i8"),
+    ("tradingsymbol", "S32"),
+    ("series", "S2"),
+    ("tick_size", "<f8"),
+    ("lot_size", "<i4"),
+])
+
+
+# series of NSE which kite writes as a suffix of the symbol, the dump has no series column
+NSE_SERIES = frozenset({
+    "BE", "BZ", "BL", "SM", "ST", "IL", "IT", "GB", "GS", "RR", "E1", "IV", "P1", "P2", "W1", "W2", "X1",
+    *(f"N{number}" for number in range(1, 10)),
+})
+
+
+def series_of(tradingsymbol: str) -> str:
+    """
+        kite writes the series other than EQ as a suffix e.g. 20MICRONS-BE, while symbols like BAJAJ-AUTO or
+        MCDOWELL-N have a part after the hyphen which is not a series, so only a known series is taken
+    """
+    base, _, suffix = tradingsymbol.rpartition("-")
+    return suffix if base and suffix in NSE_SERIES else "EQ"
+
+
+@dataclass
+class InstrumentMaster:
+    """
+        Equity instruments of one exchange kept on disk as a numpy structured array.
+
+        The array is built once a day from the instruments dump of kite, or from a local csv in the same
+        format, and saved with the date in its name. It is memory mapped when loaded and dictionaries from
+        tradingsymbol, token and series to the rows are built over it, so every lookup is O(1) and no
+        call is made to kite for validating a symbol or finding its token.
+    """
+    exchange: str = "NSE"
+    directory: str = INSTRUMENTS_DIR
+    source_file: str | None = INSTRUMENTS_SOURCE_FILE
+    offline: bool = OFFLINE_MODE
+    _instruments: np.ndarray | None = field(default=None, init=False, repr=False)
+    _by_symbol: dict[str, int] = field(default_factory=dict, init=False, repr=False)
+    _by_token: dict[int, int] = field(default_factory=dict, init=False, repr=False)
+    _by_series: dict[str, np.ndarray] = field(default_factory=dict, init=False, repr=False)
+    _loaded_on: date | None = field(default=None, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def file_path(self, day: date) -> str:
+        return f"{self.directory}/{self.exchange}_{day.isoformat()}.npy"
+
+    def _records(self) -> list[dict]:
+        if self.source_file is not None:
+            with open(self.source_file) as file:
+                return list(csv.DictReader(file))
+        return kite_scheduler.call("instruments", self.exchange)
+
+    def refresh(self) -> np.ndarray:
+        """
+        builds the array from the instruments dump and replaces the saved one of the day
+        :return: structured array of the equity instruments
+        """
+        records = [
+            record for record in self._records()
+            if record["instrument_type"] == "EQ" and record["exchange"] == self.exchange
+        ]
+        instruments = np.empty(len(records), dtype=INSTRUMENT_DTYPE)
+        instruments["instrument_token"] = [int(record["instrument_token"]) for record in records]
+        instruments["tradingsymbol"] = [record["tradingsymbol"].encode() for record in records]
+        instruments["series"] = [series_of(record["tradingsymbol"]).encode() for record in records]
+        instruments["tick_size"] = [float(record["tick_size"]) for record in records]
+        instruments["lot_size"] = [int(record["lot_size"]) for record in records]
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.file_path(date.today())
+        with open(path + ".tmp", "wb") as file:
+            np.save(file, instruments)
+        os.replace(path + ".tmp", path)
+        # only the latest dump is kept
+        for old_path in glob(f"{self.directory}/{self.exchange}_*.npy"):
+            if old_path != path:
+                os.remove(old_path)
+        logger.info(f"instrument master {self.exchange}: {len(instruments)} instruments saved")
+        return instruments
+
+    def _saved(self) -> np.ndarray | None:
+        if os.path.exists(self.file_path(date.today())):
+            return np.load(self.file_path(date.today()), mmap_mode="r")
+        saved = sorted(glob(f"{self.directory}/{self.exchange}_*.npy"))
+        # an older dump is used only when nothing can be downloaded
+        if self.offline and self.source_file is None and len(saved) > 0:
+            return np.load(saved[-1], mmap_mode="r")
+        return None
+
+    def load(self):
+        """
+        memory maps the dump of the day, building it first if it is not there, and indexes it
+        :return: None
+        """
+        with self._lock:
+            if self._loaded_on == date.today():
+                return
+            instruments = self._saved()
+            if instruments is None:
+                self.refresh()
+                instruments = np.load(self.file_path(date.today()), mmap_mode="r")
+
+            symbols = np.char.decode(instruments["tradingsymbol"]).tolist()
+            self._by_symbol = dict(zip(symbols, range(len(symbols))))
+            self._by_token = dict(zip(instruments["instrument_token"].tolist(), range(len(symbols))))
+            series = instruments["series"]
+            self._by_series = {value.decode(): np.flatnonzero(series == value) for value in np.unique(series)}
+            self._instruments = instruments
+            self._loaded_on = date.today()
+
+    def row(self, tradingsymbol: str) -> np.void | None:
+        """
+        :param tradingsymbol: symbol as traded e.g. RELIANCE or 20MICRONS-BE
+        :return: the row of the instrument or None if it does not exist
+        """
+        self.load()
+        index = self._by_symbol.get(tradingsymbol)
+        return None if index is None else self._instruments[index]
+
+    def exists(self, tradingsymbol: str) -> bool:
+        self.load()
+        return tradingsymbol in self._by_symbol
+
+    def resolve(self, symbol: str) -> str | None:
+        """
+        Some symbol is trade to trade basis so-BE is attached at the end
+        :param symbol: symbol without the series e.g. 20MICRONS
+        :return: symbol in correct format e.g. 20MICRONS-BE, or None if it is not traded
+        """
+        self.load()
+        for tradingsymbol in (symbol, f"{symbol}-BE"):
+            if tradingsymbol in self._by_symbol:
+                return tradingsymbol
+        return None
+
+    def token(self, tradingsymbol: str) -> int | None:
+        row = self.row(tradingsymbol)
+        return None if row is None else int(row["instrument_token"])
+
+    def symbol(self, instrument_token: int) -> str | None:
+        self.load()
+        index = self._by_token.get(instrument_token)
+        return None if index is None else self._instruments[index]["tradingsymbol"].decode()
+
+    def series(self, series: str = "EQ") -> list[str]:
+        """
+        :param series: e.g. EQ or BE
+        :return: all the symbols of the series
+        """
+        self.load()
+        rows = self._by_series.get(series)
+        return [] if rows is None else np.char.decode(self._instruments["tradingsymbol"][rows]).tolist()
+
+    def instrument_tokens(self, instruments: list[str]) -> dict[str, int]:
+        """
+        tokens needed to subscribe the instruments on the websocket
+        :param instruments: list of instruments in the form EXCHANGE:SYMBOL
+        :return: token of every instrument which is found
+        """
+        tokens = {}
+        for instrument in instruments:
+            exchange, _, tradingsymbol = instrument.rpartition(":")
+            if exchange == self.exchange:
+                token = self.token(tradingsymbol)
+                if token is not None:
+                    tokens[instrument] = token
+        return tokens
+
+
+instrument_master = InstrumentMaster()
@@ -0,0 +1,232 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from heapq import heappush, heappop, heapify
+from itertools import count
+from logging import Logger
+from threading import Condition, Lock
+from time import monotonic, perf_counter
+from typing import Callable, Any
+
+from kiteconnect import KiteConnect
+from kiteconnect.exceptions import KiteException
+
+from constants.enums.request_priority import RequestPriority
+from constants.global_contexts import kite_context
+from constants.settings import KITE_RATE_LIMITS, KITE_THROTTLE_RETRIES, KITE_TOKEN_TIMEOUT, KITE_REQUEST_TIMEOUT
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger: Logger = get_logger(__name__)
+
+requests_total = metrics.counter("kite_requests_total", "requests sent to kite", ("endpoint", "method", "outcome"))
+request_seconds = metrics.histogram("kite_request_seconds", "time taken by kite to answer a request",
+                                    ("endpoint", "method", "outcome"))
+rate_limit_wait_seconds = metrics.histogram("kite_rate_limit_wait_seconds",
+                                            "time a request waited for a token of its endpoint", ("endpoint",))
+
+# endpoint whose rate limit applies to each method of kite, the rest come under default
+ENDPOINTS = {
+    "quote": "quote",
+    "ltp": "quote",
+    "ohlc": "quote",
+    "place_order": "order",
+    "modify_order": "order",
+    "cancel_order": "order",
+}
+
+
+@dataclass
+class TokenBucket:
+    """
+        Allows rate requests per second with bursts of up to capacity requests.
+
+        The threads waiting for a token are served in the order of their priority and then in the order
+        they arrived, so a screening burst never delays an order.
+    """
+    rate: float
+    capacity: float | None = None
+    _tokens: float = field(default=0.0, init=False)
+    _updated_at: float = field(default_factory=monotonic, init=False)
+    _waiting: list = field(default_factory=list, init=False)
+    _arrivals: count = field(default_factory=count, init=False)
+    _condition: Condition = field(default_factory=Condition, init=False)
+
+    def __post_init__(self):
+        if self.capacity is None:
+            self.capacity = self.rate
+        self._tokens = self.capacity
+
+    def _refill(self):
+        now = monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, priority: RequestPriority = RequestPriority.WATCHLIST, timeout: float | None = None):
+        """
+        blocks the calling thread till a token is available and no request of a higher priority is waiting
+        :param priority: priority class of the request
+        :param timeout: seconds after which TimeoutError is raised, None to wait as long as it takes
+        :return: None
+        """
+        entry = (priority.value, next(self._arrivals))
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._condition:
+            heappush(self._waiting, entry)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiting[0] == entry and self._tokens >= 1:
+                        heappop(self._waiting)
+                        self._tokens -= 1
+                        self._condition.notify_all()
+                        return
+                    # only the first in line waits for the next token, the others wait to be notified
+                    wait = (1 - self._tokens) / self.rate if self._waiting[0] == entry else None
+                    if deadline is not None:
+                        remaining = deadline - monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(f"no token within {timeout}s")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapify(self._waiting)
+                    self._condition.notify_all()
+                raise
+
+    def drain(self):
+        """
+            empties the bucket, used when kite says that the limit has been crossed anyway
+        """
+        with self._condition:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+
+@dataclass
+class KiteScheduler:
+    """
+        Wraps kite_context so that every call waits for a token of its endpoint's bucket.
+
+        A quote, ltp or ohlc request for instruments which are all part of a request already waiting or in
+        flight is not sent again, it waits for that request and takes its instruments from the response.
+        The same is done for identical calls of the other read only methods. Orders are never merged.
+
+        A request waits at most token_timeout for its token, kite_context answers within its own timeout, and
+        a request which waits for another one gives up after both, so no call blocks its thread for long.
+
+        Anything else e.g. the constants or api_key is taken from kite_context as it is.
+    """
+    kite: KiteConnect = kite_context
+    rate_limits: dict[str, float] = field(default_factory=lambda: dict(KITE_RATE_LIMITS))
+    throttle_retries: int = KITE_THROTTLE_RETRIES
+    token_timeout: float = KITE_TOKEN_TIMEOUT
+    _buckets: dict[str, TokenBucket] = field(default_factory=dict, init=False)
+    _in_flight: dict[str, list[tuple[Any, int, Future]]] = field(default_factory=dict, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def __post_init__(self):
+        self._buckets = {endpoint: TokenBucket(rate) for endpoint, rate in self.rate_limits.items()}
+
+    def __getattr__(self, name: str):
+        # only reached for the attributes which are not of the scheduler
+        if name == "kite" or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.kite, name)
+
+    def _send(self, method: str, priority: RequestPriority, *args, **kwargs) -> Any:
+        endpoint = ENDPOINTS.get(method, "default")
+        bucket = self._buckets[endpoint]
+        for attempt in range(self.throttle_retries + 1):
+            waited_at = perf_counter()
+            bucket.acquire(priority, self.token_timeout)
+            sent_at = perf_counter()
+            rate_limit_wait_seconds.labels(endpoint).observe(sent_at - waited_at)
+            outcome = "error"
+            try:
+                response = getattr(self.kite, method)(*args, **kwargs)
+                outcome = "ok"
+                return response
+            except KiteException as error:
+                if error.code == 429:
+                    outcome = "throttled"
+                if error.code != 429 or attempt == self.throttle_retries:
+                    raise
+                logger.info(f"kite {method} throttled, attempt {attempt + 1}")
+                bucket.drain()
+            finally:
+                requests_total.labels(endpoint, method, outcome).inc()
+                request_seconds.labels(endpoint, method, outcome).observe(perf_counter() - sent_at)
+
+    def _coalesced(self, method: str, key, priority: RequestPriority, covers: Callable[[Any], bool],
+                   send: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+            returns the result of an in flight request which covers this one, or sends it as a new request.
+            A request of a lower priority is not waited for since it can be behind in the queue.
+            The boolean is True if the result belongs to another request
+        """
+        with self._lock:
+            for in_flight_key, in_flight_priority, future in self._in_flight.get(method, []):
+                if in_flight_priority <= priority.value and covers(in_flight_key):
+                    break
+            else:
+                future = None
+            if future is None:
+                entry = (key, priority.value, Future())
+                self._in_flight.setdefault(method, []).append(entry)
+        if future is not None:
+            return future.result(self.token_timeout + KITE_REQUEST_TIMEOUT), True
+
+        try:
+            result = send()
+            entry[2].set_result(result)
+            return result, False
+        except BaseException as error:
+            entry[2].set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight[method].remove(entry)
+
+    def _instrument_call(self, method: str, instruments, priority: RequestPriority) -> dict:
+        requested = [instruments] if isinstance(instruments, str) else list(instruments)
+        key = frozenset(requested)
+        response, shared = self._coalesced(
+            method, key, priority, key.issubset, lambda: self._send(method, priority, requested)
+        )
+        if shared:
+            return {instrument: response[instrument] for instrument in requested if instrument in response}
+        return response
+
+    def quote(self, instruments, priority: RequestPriority = RequestPriority.WATCHLIST) -> dict:
+        return self._instrument_call("quote", instruments, priority)
+
+    def ltp(self, instruments, priority: RequestPriority = RequestPriority.WATCHLIST) -> dict:
+        return self._instrument_call("ltp", instruments, priority)
+
+    def ohlc(self, instruments, priority: RequestPriority = RequestPriority.WATCHLIST) -> dict:
+        return self._instrument_call("ohlc", instruments, priority)
+
+    def order_history(self, order_id: str, priority: RequestPriority = RequestPriority.ORDER) -> list:
+        return self._coalesced(
+            "order_history", order_id, priority, order_id.__eq__, lambda: self._send("order_history", priority, order_id)
+        )[0]
+
+    def place_order(self, priority: RequestPriority = RequestPriority.ORDER, **kwargs) -> str:
+        return self._send("place_order", priority, **kwargs)
+
+    def cancel_order(self, priority: RequestPriority = RequestPriority.ORDER, **kwargs) -> str:
+        return self._send("cancel_order", priority, **kwargs)
+
+    def call(self, method: str, *args, priority: RequestPriority = RequestPriority.WATCHLIST, **kwargs) -> Any:
+        """
+        any other method of kite under the rate limit of its endpoint
+        :param method: name of the method of KiteConnect
+        :param priority: priority class of the request
+        :return: whatever kite returns
+        """
+        return self._send(method, priority, *args, **kwargs)
+
+
+kite_scheduler = KiteScheduler()
@@ -1,21 +1,137 @@
+import atexit
+import json
 import logging
+from datetime import datetime
+from logging import FileHandler, Formatter, Logger, LogRecord
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
 
-from logging import FileHandler, Formatter, Logger
+from constants.settings import LOG_PATH, EVENT_LOG_PATH, LOG_HOT_SAMPLE_EVERY
+
+# level of the messages logged on every tick, only one in LOG_HOT_SAMPLE_EVERY of each of them is kept
+HOT = 15
+logging.addLevelName(HOT, "HOT")
+
+EVENT_LOGGER = "events"
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+        Puts the record on the queue as it is, the message is formatted by the listener thread
+        and not by the thread which logs it
+    """
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+
+class HotSampler(logging.Filter):
+    """
+        Lets through one in every `every` HOT records of each line of code, the other levels always pass
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counts: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno != HOT:
+            return True
+        key = (record.pathname, record.lineno)
+        # a lost increment from a race between threads only shifts the sample
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+class JsonLinesFormatter(Formatter):
+    """
+        one json object per line with the time, the event and its fields
+    """
+
+    def format(self, record: LogRecord) -> str:
+        event = {"time": datetime.fromtimestamp(record.created).isoformat(), "event": record.msg}
+        event.update(record.args if isinstance(record.args, dict) else {})
+        return json.dumps(event, default=str)
+
+
+def _is_event(record: LogRecord) -> bool:
+    return record.name == EVENT_LOGGER
+
+
+_queue: SimpleQueue = SimpleQueue()
+_queue_handler = LazyQueueHandler(_queue)
+_listener: QueueListener | None = None
+_lock = Lock()
+
+
+def _start_listener():
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        file_handler: FileHandler = logging.FileHandler(LOG_PATH, delay=True)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s: %(levelname)s: %(name)s: %(message)s'))
+        file_handler.addFilter(lambda record: not _is_event(record))
+
+        event_handler: FileHandler = logging.FileHandler(EVENT_LOG_PATH, delay=True)
+        event_handler.setFormatter(JsonLinesFormatter())
+        event_handler.addFilter(_is_event)
+
+        # one thread writes everything to the files so the callers only put the record on the queue
+        _listener = QueueListener(_queue, file_handler, event_handler)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+        writes the records still in the queue and stops the listener thread, logging again starts it back
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
 
 
 def get_logger(module_name: str) -> Logger:
     """
-    it creates a logger object with the given file name and sets the format used to display in log files
+    it creates a logger object with the given file name and sets the format used to display in log files.
+    All the loggers share one handler which only queues the records, so calling it again for the same
+    module does not add another handler
     :param module_name: name of the file where its used
     :return: Logger object having file where it will be stored and format used to store
     """
+    _start_listener()
     logger: Logger = logging.getLogger(module_name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(HOT if LOG_HOT_SAMPLE_EVERY > 0 else logging.INFO)
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
+    return logger
 
-    formatter: Formatter = logging.Formatter('%(asctime)s: %(levelname)s: %(name)s: %(message)s')
 
-    file_handler: FileHandler = logging.FileHandler('temp/stock_action.log')
-    file_handler.setFormatter(formatter)
+if LOG_HOT_SAMPLE_EVERY > 1:
+    _queue_handler.addFilter(HotSampler(LOG_HOT_SAMPLE_EVERY))
 
-    logger.addHandler(file_handler)
-    return logger
+_event_logger: Logger = logging.getLogger(EVENT_LOGGER)
+_event_logger.setLevel(logging.INFO)
+_event_logger.propagate = False
+_event_logger.addHandler(_queue_handler)
+
+
+def log_event(event: str, **fields):
+    """
+    writes a structured event e.g. an order or a tick as one json line to the event log
+    :param event: name of the event
+    :param fields: values of the event, anything which is not json is written as its string
+    :return: None
+    """
+    _start_listener()
+    if fields:
+        _event_logger.info(event, fields)
+    else:
+        _event_logger.info(event)
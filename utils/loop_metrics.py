@@ -0,0 +1,82 @@
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import perf_counter
+
+from constants.settings import LOOP_METRICS_HISTORY, METRICS_LOOP_BUCKETS, SLEEP_INTERVAL
+from utils.clock import clock
+from utils.metrics import metrics
+
+iteration_seconds = metrics.histogram("loop_iteration_seconds", "wall time of one iteration of the loop",
+                                      buckets=tuple(METRICS_LOOP_BUCKETS)).labels()
+overruns = metrics.counter("loop_overruns_total", "iterations which took longer than the sleep interval").labels()
+phase_seconds = metrics.histogram("loop_phase_seconds", "wall time of each phase of an iteration", ("phase",),
+                                  buckets=tuple(METRICS_LOOP_BUCKETS))
+tracked_symbols = metrics.gauge("tracked_symbols", "stocks being tracked by the loop").labels()
+
+
+@dataclass
+class LoopIteration:
+    started_at: datetime
+    symbols: int
+    wall: float = 0.0
+    phases: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class LoopMetrics:
+    """
+        Wall time of every iteration of the background task and of each of its phases e.g. the price update or
+        the buy scan. The time spent sleeping between the iterations is not counted and only the latest
+        `history` iterations are kept. Every iteration and phase is also recorded in the metrics served on
+        /metrics, with an overrun counted when an iteration takes longer than `interval`.
+    """
+    history: int = LOOP_METRICS_HISTORY
+    interval: float = SLEEP_INTERVAL
+    iterations: deque[LoopIteration] = field(default=None, init=False)
+    _current: LoopIteration | None = field(default=None, init=False)
+    _started: float = field(default=0.0, init=False)
+
+    def __post_init__(self):
+        self.iterations = deque(maxlen=self.history)
+
+    def start_iteration(self, symbols: int):
+        """
+        starts timing an iteration
+        :param symbols: number of stocks being tracked
+        :return: None
+        """
+        self._current = LoopIteration(clock.now(), symbols)
+        tracked_symbols.set(symbols)
+        self._started = perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+            times the code in the with block as a phase of the current iteration
+        """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            phase_seconds.labels(name).observe(elapsed)
+            if self._current is not None:
+                self._current.phases[name] = self._current.phases.get(name, 0.0) + elapsed
+
+    def finish_iteration(self):
+        """
+            keeps the current iteration with its wall time
+        """
+        if self._current is None:
+            return
+        self._current.wall = perf_counter() - self._started
+        iteration_seconds.observe(self._current.wall)
+        if self._current.wall > self.interval:
+            overruns.inc()
+        self.iterations.append(self._current)
+        self._current = None
+
+
+loop_metrics = LoopMetrics()
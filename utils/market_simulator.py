@@ -0,0 +1,273 @@
+# A deterministic market which stands in for kite quotes and the DEBUG price server. It is used in process when
+# MARKET_SIMULATOR is set, or it can be served on the address of the DEBUG price server with
+#     python -m utils.market_simulator --port 8082 --seed 7
+import argparse
+import json
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlparse, parse_qs
+from zlib import crc32
+
+import numpy as np
+import pandas as pd
+
+from constants.settings import SIMULATOR_SEED, SIMULATOR_STEP_SECONDS, SIMULATOR_SESSION_STEPS, \
+    SIMULATOR_VOLATILITY, SIMULATOR_DEPTH_LEVELS, SIMULATOR_LEVEL_QUANTITY
+
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MAX_ORDERS = 10  # largest number of orders at one level of the depth
+
+# streams of random numbers drawn for every symbol and step, kept apart so that they do not repeat each other
+PRICE_STREAM, SPREAD_STREAM, QUANTITY_STREAM, ORDERS_STREAM = 1, 2, 3, 4
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finaliser, every bit of the input changes about half of the bits of the output
+    values = values + GOLDEN_GAMMA
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _uniform(keys: np.ndarray, steps: np.ndarray, stream: int) -> np.ndarray:
+    """
+    uniform numbers in (0, 1) which depend only on the key of the symbol, the step and the stream, so a symbol
+    gets the same prices whichever symbols are asked with it and in whatever order
+    """
+    hashed = _mix(_mix(keys) ^ (steps.astype(np.uint64) * GOLDEN_GAMMA + np.uint64(stream)))
+    return ((hashed >> np.uint64(11)).astype(np.float64) + 0.5) / float(1 << 53)
+
+
+def _normal(keys: np.ndarray, steps: np.ndarray) -> np.ndarray:
+    # Box-Muller on two independent streams
+    first, second = _uniform(keys, steps, PRICE_STREAM), _uniform(keys, steps, PRICE_STREAM + 16)
+    return np.sqrt(-2 * np.log(first)) * np.cos(2 * np.pi * second)
+
+
+@dataclass
+class MarketSimulator:
+    """
+        Prices and market depth of any number of symbols, the same for the same seed.
+
+        Every symbol starts from a price between lowest_price and highest_price derived from its name and then
+        follows a random walk with one step every step_seconds of the wall clock, or takes its prices from the
+        replay frame if it is a column of it. The depth has `levels` levels a tick apart on both sides of the
+        price with a spread and quantities which are random as well. Everything is computed with numpy for all the symbols asked together, so one call
+        answers thousands of them. After session_steps the price of a symbol is "ENDED" like on the DEBUG
+        price server.
+    """
+    seed: int = SIMULATOR_SEED
+    step_seconds: float = SIMULATOR_STEP_SECONDS
+    session_steps: int = SIMULATOR_SESSION_STEPS
+    volatility: float = SIMULATOR_VOLATILITY
+    levels: int = SIMULATOR_DEPTH_LEVELS
+    level_quantity: int = SIMULATOR_LEVEL_QUANTITY
+    tick_size: float = 0.05
+    lowest_price: float = 20
+    highest_price: float = 3000
+    replay: pd.DataFrame | None = None
+    step: int = field(default=0, init=False)
+    _symbols: list[str] = field(default_factory=list, init=False)
+    _index: dict[str, int] = field(default_factory=dict, init=False)
+    _keys: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.uint64), init=False)
+    _log_prices: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64), init=False)
+    _replay_prices: np.ndarray | None = field(default=None, init=False)
+    _replay_columns: dict[str, int] = field(default_factory=dict, init=False)
+    _started_at: float | None = field(default=None, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def __post_init__(self):
+        if self.replay is not None:
+            self._replay_prices = self.replay.bfill().ffill().to_numpy(dtype=np.float64)
+            self._replay_columns = {str(column): position for position, column in enumerate(self.replay.columns)}
+            self.session_steps = len(self.replay.index)
+
+    @property
+    def ended(self) -> bool:
+        return self.step >= self.session_steps
+
+    def _register(self, symbols: list[str]):
+        new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self._index]
+        if len(new) == 0:
+            return
+        keys = np.array([crc32(symbol.encode()) for symbol in new], dtype=np.uint64) ^ np.uint64(self.seed << 32)
+        # a starting price from the name, walked up to the current step
+        start = np.log(self.lowest_price + _uniform(keys, np.zeros(len(new)), SPREAD_STREAM + 16) *
+                       (self.highest_price - self.lowest_price))
+        if self.step > 0:
+            start += self.volatility * _normal(keys[:, None], np.arange(1, self.step + 1)[None, :]).sum(axis=1)
+        for symbol in new:
+            self._index[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+        self._keys = np.concatenate([self._keys, keys])
+        self._log_prices = np.concatenate([self._log_prices, start])
+
+    def advance(self, steps: int = 1):
+        """
+        moves every symbol the given number of steps, not beyond the end of the session
+        :param steps: number of steps
+        :return: None
+        """
+        with self._lock:
+            steps = min(steps, self.session_steps - self.step)
+            if steps <= 0:
+                return
+            if len(self._keys) > 0:
+                moves = _normal(self._keys[:, None], np.arange(self.step + 1, self.step + steps + 1)[None, :])
+                self._log_prices += self.volatility * moves.sum(axis=1)
+            self.step += steps
+
+    def sync(self):
+        """
+            advances to the step of the wall clock, the clock starts with the first call
+        """
+        now = monotonic()
+        if self._started_at is None:
+            self._started_at = now
+        due = int((now - self._started_at) / self.step_seconds) if self.step_seconds > 0 else self.step
+        if due > self.step:
+            self.advance(due - self.step)
+
+    def _round(self, prices: np.ndarray) -> np.ndarray:
+        return np.round(np.round(prices / self.tick_size) * self.tick_size, 2)
+
+    def _prices(self, symbols: list[str]) -> np.ndarray:
+        self._register(symbols)
+        positions = np.fromiter((self._index[symbol] for symbol in symbols), dtype=np.int64, count=len(symbols))
+        prices = np.exp(self._log_prices[positions])
+        if self._replay_prices is not None:
+            row = self._replay_prices[min(self.step, len(self._replay_prices) - 1)]
+            for position, symbol in enumerate(symbols):
+                column = self._replay_columns.get(symbol)
+                if column is not None and row[column] == row[column]:
+                    prices[position] = row[column]
+        return self._round(prices)
+
+    def prices(self, symbols: list[str]) -> dict[str, float | str]:
+        """
+        latest price of every symbol in one call
+        :param symbols: trading symbols e.g. ['INFY', 'TCS']
+        :return: dictionary with symbol as key and price, or "ENDED" after the session, as value
+        """
+        self.sync()
+        with self._lock:
+            if self.ended:
+                return {symbol: "ENDED" for symbol in symbols}
+            return dict(zip(symbols, self._prices(symbols).tolist()))
+
+    def price(self, symbol: str) -> float | str:
+        return self.prices([symbol])[symbol]
+
+    def depths(self, symbols: list[str]) -> dict[str, dict]:
+        """
+        market depth of every symbol in the format of a kite quote, computed for all of them at once
+        :param symbols: trading symbols
+        :return: dictionary with symbol as key and its last price and depth as value
+        """
+        self.sync()
+        with self._lock:
+            prices = self._prices(symbols)
+            keys = self._keys[np.fromiter((self._index[symbol] for symbol in symbols), dtype=np.int64,
+                                          count=len(symbols))]
+            steps = np.full(len(symbols), self.step)
+            spread = 1 + (_uniform(keys, steps, SPREAD_STREAM) * 3).astype(np.int64)
+            best_bid = self._round(prices - (spread // 2) * self.tick_size)
+            best_offer = best_bid + spread * self.tick_size
+            offsets = np.arange(self.levels) * self.tick_size
+            bids, offers = self._round(best_bid[:, None] - offsets), self._round(best_offer[:, None] + offsets)
+
+            # one key for every symbol, level and side
+            level_keys = _mix(keys[:, None] * np.uint64(2 * self.levels) + np.arange(2 * self.levels, dtype=np.uint64))
+            level_steps = np.broadcast_to(steps[:, None], level_keys.shape)
+            quantities = 1 + (_uniform(level_keys, level_steps, QUANTITY_STREAM) * self.level_quantity).astype(np.int64)
+            orders = 1 + (_uniform(level_keys, level_steps, ORDERS_STREAM) * MAX_ORDERS).astype(np.int64)
+
+        depths = {}
+        for position, symbol in enumerate(symbols):
+            depths[symbol] = {
+                "last_price": float(prices[position]),
+                "depth": {
+                    "buy": [{"price": price, "quantity": quantity, "orders": count} for price, quantity, count in
+                            zip(bids[position].tolist(), quantities[position, :self.levels].tolist(),
+                                orders[position, :self.levels].tolist())],
+                    "sell": [{"price": price, "quantity": quantity, "orders": count} for price, quantity, count in
+                             zip(offers[position].tolist(), quantities[position, self.levels:].tolist(),
+                                 orders[position, self.levels:].tolist())],
+                },
+            }
+        return depths
+
+    def quote(self, instruments: list[str] | str, *args, **kwargs) -> dict[str, dict]:
+        """
+        same as the quote of kite for instruments in the form EXCHANGE:SYMBOL, used in place of kite
+        :param instruments: one instrument or a list of them
+        :return: dictionary with instrument as key and quote as value
+        """
+        instruments = [instruments] if isinstance(instruments, str) else list(instruments)
+        depths = self.depths([instrument.split(":")[-1] for instrument in instruments])
+        return {instrument: depths[instrument.split(":")[-1]] for instrument in instruments}
+
+    def publish(self, table, exchange: str = "NSE"):
+        """
+        writes the depth of every symbol asked so far to a DepthTable as if it was streamed
+        :param table: depth table e.g. utils.streaming.depth_table.depth_table
+        :param exchange: exchange of the symbols
+        :return: None
+        """
+        for symbol, quote in self.depths(list(self._symbols)).items():
+            table.update(f"{exchange}:{symbol}", quote)
+
+
+market_simulator = MarketSimulator()
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    """
+        /price?symbol=INFY as the DEBUG price server, /prices?symbols=INFY,TCS and /quote?i=NSE:INFY&i=NSE:TCS
+        for many at a time
+    """
+    simulator: MarketSimulator = market_simulator
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        match url.path:
+            case "/price":
+                data = self.simulator.price(query["symbol"][0])
+            case "/prices":
+                data = self.simulator.prices([symbol for value in query["symbols"] for symbol in value.split(",")])
+            case "/quote":
+                data = self.simulator.quote(query["i"])
+            case _:
+                self.send_error(404)
+                return
+        body = json.dumps({"status": "success", "data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serves the prices and depth of the simulated market")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--seed", type=int, default=SIMULATOR_SEED)
+    parser.add_argument("--step-seconds", type=float, default=SIMULATOR_STEP_SECONDS)
+    parser.add_argument("--session-steps", type=int, default=SIMULATOR_SESSION_STEPS)
+    parser.add_argument("--replay", help="csv of prices with the time as first column and one column per symbol")
+    arguments = parser.parse_args()
+
+    SimulatorRequestHandler.simulator = MarketSimulator(
+        seed=arguments.seed,
+        step_seconds=arguments.step_seconds,
+        session_steps=arguments.session_steps,
+        replay=pd.read_csv(arguments.replay, index_col=0) if arguments.replay else None,
+    )
+    ThreadingHTTPServer((arguments.host, arguments.port), SimulatorRequestHandler).serve_forever()
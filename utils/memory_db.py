@@ -0,0 +1,153 @@
+from copy import deepcopy
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Any
+
+
+@dataclass
+class UpdateOne:
+    """
+        same arguments as pymongo.UpdateOne, used with the in memory database
+    """
+    filter: dict
+    update: dict
+    upsert: bool = False
+
+
+@dataclass
+class BulkWriteResult:
+    matched_count: int = 0
+    modified_count: int = 0
+    upserted_count: int = 0
+
+
+@dataclass
+class InsertOneResult:
+    inserted_id: Any
+
+
+def _get(document: dict, key: str):
+    value = document
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _set(document: dict, key: str, value):
+    *parents, last = key.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def _matches(document: dict, query: dict) -> bool:
+    return all(_get(document, key) == value for key, value in query.items())
+
+
+def _project(document: dict, projection: dict | None) -> dict:
+    document = deepcopy(document)
+    if projection is None:
+        return document
+    return {key: value for key, value in document.items() if key == "_id" or projection.get(key)}
+
+
+@dataclass
+class MemoryCursor:
+    documents: list[dict]
+    _position: int = field(default=0, init=False)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        if self._position >= len(self.documents):
+            raise StopAsyncIteration
+        self._position += 1
+        return self.documents[self._position - 1]
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        end = len(self.documents) if length is None else self._position + length
+        page = self.documents[self._position:end]
+        self._position += len(page)
+        return page
+
+
+@dataclass
+class MemoryCollection:
+    """
+        Keeps the documents in a list and answers the subset of the motor collection api used by the models.
+
+        Only equality filters on plain or dotted keys and $set updates are supported.
+    """
+    name: str
+    documents: list[dict] = field(default_factory=list)
+    bulk_writes: int = field(default=0, init=False)
+    _ids: count = field(default_factory=count, init=False)
+
+    def _find(self, query: dict) -> dict | None:
+        for document in self.documents:
+            if _matches(document, query):
+                return document
+        return None
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        document = deepcopy(document)
+        document.setdefault("_id", next(self._ids))
+        self.documents.append(document)
+        return InsertOneResult(document["_id"])
+
+    async def find_one(self, query: dict, projection: dict | None = None) -> dict | None:
+        document = self._find(query)
+        return _project(document, projection) if document is not None else None
+
+    def find(self, query: dict, projection: dict | None = None) -> MemoryCursor:
+        return MemoryCursor([_project(document, projection) for document in self.documents if _matches(document, query)])
+
+    def _update(self, query: dict, update: dict, upsert: bool, result: BulkWriteResult):
+        document = self._find(query)
+        if document is None:
+            if not upsert:
+                return
+            document = {}
+            for key, value in query.items():
+                _set(document, key, value)
+            document.setdefault("_id", next(self._ids))
+            self.documents.append(document)
+            result.upserted_count += 1
+        else:
+            result.matched_count += 1
+            result.modified_count += 1
+        for key, value in update.get("$set", {}).items():
+            _set(document, key, deepcopy(value))
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False) -> BulkWriteResult:
+        result = BulkWriteResult()
+        self._update(query, update, upsert, result)
+        return result
+
+    async def delete_one(self, query: dict):
+        document = self._find(query)
+        if document is not None:
+            self.documents.remove(document)
+
+    async def bulk_write(self, requests: list[UpdateOne], ordered: bool = True) -> BulkWriteResult:
+        self.bulk_writes += 1
+        result = BulkWriteResult()
+        for request in requests:
+            self._update(request.filter, request.update, request.upsert, result)
+        return result
+
+
+@dataclass
+class MemoryDatabase:
+    """
+        in process stand in for the motor database, the collections are created when first used
+    """
+    collections: dict[str, MemoryCollection] = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(name)
+        return self.collections[name]
@@ -0,0 +1,214 @@
+import os
+import resource
+import sys
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from threading import get_ident
+from typing import Callable
+
+from constants.settings import METRICS_LATENCY_BUCKETS
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+@dataclass
+class _Shards:
+    """
+        One list of numbers for every thread which records, so a thread only ever writes its own list and
+        no lock is taken. A reader adds up the lists and may miss a record which is being made.
+    """
+    size: int
+    _by_thread: dict[int, list] = field(default_factory=dict, init=False)
+
+    def own(self) -> list:
+        shard = self._by_thread.get(get_ident())
+        if shard is None:
+            # setdefault is a single operation on the dictionary so two threads can not lose each other's list
+            shard = self._by_thread.setdefault(get_ident(), [0] * self.size)
+        return shard
+
+    def total(self) -> list:
+        totals = [0] * self.size
+        for shard in list(self._by_thread.values()):
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals
+
+
+@dataclass
+class Counter:
+    name: str
+    _shards: _Shards = field(default_factory=lambda: _Shards(1), init=False)
+
+    def inc(self, amount: float = 1):
+        self._shards.own()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+
+@dataclass
+class Gauge:
+    name: str
+    # the value is taken from the function when the metrics are read, e.g. the memory in use
+    function: Callable[[], float] | None = None
+    _value: float = field(default=0, init=False)
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self.function() if self.function is not None else self._value
+
+
+@dataclass
+class Histogram:
+    """
+        counts of the observed values in fixed buckets, the upper bounds of the buckets are inclusive
+    """
+    name: str
+    buckets: tuple[float, ...]
+    _shards: _Shards = field(default=None, init=False)
+
+    def __post_init__(self):
+        # a count for every bucket, one for the values above all of them and the sum
+        self._shards = _Shards(len(self.buckets) + 2)
+
+    def observe(self, value: float):
+        shard = self._shards.own()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def totals(self) -> tuple[list[int], float]:
+        """
+        :return: cumulative count of every bucket with the +Inf bucket last, and the sum of the values
+        """
+        totals = self._shards.total()
+        cumulative, running = [], 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1]
+
+
+@dataclass
+class Family:
+    """
+        a metric with its help text and one child for every combination of the values of its labels
+    """
+    name: str
+    kind: str
+    help: str
+    label_names: tuple[str, ...]
+    create: Callable[[str], Counter | Gauge | Histogram]
+    _children: dict[tuple, Counter | Gauge | Histogram] = field(default_factory=dict, init=False)
+
+    def labels(self, *values) -> Counter | Gauge | Histogram:
+        """
+        child of the given label values, created the first time they are used
+        :param values: one value for every label name, in the same order
+        :return: counter, gauge or histogram
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} has the labels {self.label_names}, got {values}")
+            child = self._children.setdefault(values, self.create(self.name))
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            if isinstance(child, Histogram):
+                cumulative, total = child.totals()
+                for bound, count in zip(child.buckets + (float("inf"),), cumulative):
+                    labels = _labels(self.label_names, values, f'le="{_number(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulative[-1]}")
+            else:
+                lines.append(f"{self.name}{_labels(self.label_names, values)} {_number(child.value)}")
+        return lines
+
+
+@dataclass
+class MetricsRegistry:
+    """
+        Metrics of the running engine, read in the text format of Prometheus from /metrics.
+
+        Recording never takes a lock: the counters and histograms keep one shard per thread which only that
+        thread writes and the histograms have fixed buckets, so a record costs a few list operations and the
+        metrics can stay on while trading. A metric without labels is used through labels() with no values.
+    """
+    families: dict[str, Family] = field(default_factory=dict)
+
+    def _register(self, name: str, kind: str, help: str, label_names: tuple[str, ...],
+                  create: Callable[[str], Counter | Gauge | Histogram]) -> Family:
+        if name in self.families:
+            return self.families[name]
+        family = Family(name, kind, help, label_names, create)
+        self.families[name] = family
+        return family
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Family:
+        return self._register(name, "counter", help, labels, Counter)
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = (),
+              function: Callable[[], float] | None = None) -> Family:
+        return self._register(name, "gauge", help, labels, lambda metric: Gauge(metric, function))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = tuple(METRICS_LATENCY_BUCKETS)) -> Family:
+        return self._register(name, "histogram", help, labels, lambda metric: Histogram(metric, tuple(buckets)))
+
+    def render(self) -> str:
+        """
+        :return: every metric in the Prometheus text format
+        """
+        lines = []
+        for family in list(self.families.values()):
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+def resident_memory() -> float:
+    """
+    :return: bytes of memory in use by the process
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_memory()
+
+
+def peak_memory() -> float:
+    """
+    :return: largest number of bytes of memory the process has used
+    """
+    # kilobytes on linux and bytes on mac
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+metrics = MetricsRegistry()
+
+metrics.gauge("process_resident_memory_bytes", "memory in use by the process", function=resident_memory).labels()
+metrics.gauge("process_peak_resident_memory_bytes", "largest memory used by the process",
+              function=peak_memory).labels()
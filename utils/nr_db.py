@@ -1,13 +1,23 @@
 from contextlib import contextmanager
 import traceback
-from motor.motor_asyncio import AsyncIOMotorClient
 
 from utils.exceptions.db_connection import DbConnectionException
 
-from constants.db_settings import HOST, DATABASE_NAME
+from constants.settings import DB_IN_MEMORY
 
-CLIENT = AsyncIOMotorClient(HOST)
-DATABASE = CLIENT[DATABASE_NAME]
+if DB_IN_MEMORY:
+    # local stand in so that nothing is written to the cluster while testing
+    from utils.memory_db import MemoryDatabase, UpdateOne
+
+    DATABASE = MemoryDatabase()
+else:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import UpdateOne
+
+    from constants.db_settings import HOST, DATABASE_NAME
+
+    CLIENT = AsyncIOMotorClient(HOST)
+    DATABASE = CLIENT[DATABASE_NAME]
 
 
 @contextmanager
@@ -18,6 +28,7 @@ def connect_to_collection(collection_name: str):
     """
     try:
         yield DATABASE[collection_name]
-    except:
+    # a cancelled write is not a connection error, it has to reach whoever cancelled it
+    except Exception:
         traceback.print_exc()
         raise DbConnectionException()
@@ -0,0 +1,273 @@
+import asyncio
+from asyncio import AbstractEventLoop
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from logging import Logger
+from time import monotonic
+
+from kiteconnect import KiteConnect
+
+from constants.enums.product_type import ProductType
+from constants.settings import ORDER_RATE_LIMIT, ORDER_POLL_INTERVAL, ORDER_FILL_TIMEOUT, ORDER_CANCEL_GRACE, \
+    PAPER_BROKER, BLOCKING_CALL_TIMEOUT
+from utils.executor import run_blocking
+from utils.kite_scheduler import kite_scheduler
+from utils.logger import get_logger, log_event
+from utils.metrics import metrics
+from utils.paper_broker import paper_broker
+
+logger: Logger = get_logger(__name__)
+
+TERMINAL_STATUSES = {"COMPLETE", "REJECTED", "CANCELLED"}
+
+orders_total = metrics.counter("orders_total", "orders placed or failed to be placed", ("transaction_type", "outcome"))
+orders_settled = metrics.counter("orders_settled_total", "placed orders by their final status",
+                                 ("transaction_type", "status"))
+
+
+@dataclass
+class OrderHandle:
+    """
+        State of one placed order which is updated from the order history or the postbacks.
+
+        It can be awaited, which waits till the order reaches COMPLETE, REJECTED or CANCELLED.
+    """
+    symbol: str
+    transaction_type: str
+    quantity: int
+    order_id: str | None = None
+    status: str = "PENDING"
+    filled_quantity: int = 0
+    average_price: float | None = None
+    message: str | None = None
+    _done: asyncio.Event = field(default_factory=asyncio.Event, init=False, repr=False)
+
+    @property
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def update(self, order: dict):
+        """
+        updates the handle from an order as returned by the order history or sent as postback
+        :param order: order dictionary of kite
+        :return: None
+        """
+        self.status = order.get("status", self.status)
+        self.filled_quantity = int(order.get("filled_quantity") or 0)
+        if order.get("average_price"):
+            self.average_price = float(order["average_price"])
+        self.message = order.get("status_message") or self.message
+        if self.status in TERMINAL_STATUSES:
+            self._done.set()
+
+    def close(self, status: str | None = None, message: str | None = None):
+        if status is not None:
+            self.status = status
+        if message is not None:
+            self.message = message
+        self._done.set()
+
+    async def wait(self, timeout: float | None = None) -> "OrderHandle":
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self
+
+    def __await__(self):
+        return self.wait().__await__()
+
+
+@dataclass
+class OrderGateway:
+    """
+        Places market orders concurrently without going above the rate limit of the broker.
+
+        Each order is followed by polling its history till it reaches a final state. If the broker sends
+        postbacks (kite postback url, the order updates on the websocket or the paper broker) they are
+        passed to on_order_update which settles the handle without waiting for the next poll. An order which
+        is still open after fill_timeout is cancelled and followed till the broker confirms its final state,
+        and no other order is placed for its symbol till then, so a late fill is never missed. The caller of
+        execute waits at most fill_timeout and cancel_grace and gets whatever was filled by then.
+
+        The broker calls have their own pool since the callers of execute_from_thread wait on the
+        shared blocking pool and would otherwise starve the orders they are waiting for.
+    """
+    broker: object = field(default_factory=lambda: paper_broker if PAPER_BROKER else kite_scheduler)
+    rate_limit: int = ORDER_RATE_LIMIT
+    poll_interval: float = ORDER_POLL_INTERVAL
+    fill_timeout: float = ORDER_FILL_TIMEOUT
+    cancel_grace: float = ORDER_CANCEL_GRACE
+    _loop: AbstractEventLoop | None = field(default=None, init=False)
+    _handles: dict[str, OrderHandle] = field(default_factory=dict, init=False)
+    # symbols with an order which has not reached a final state
+    _unsettled: set[str] = field(default_factory=set, init=False)
+    _early_updates: dict[str, list[dict]] = field(default_factory=dict, init=False)
+    _sent_at: deque = field(default_factory=deque, init=False)
+    _throttle_lock: asyncio.Lock | None = field(default=None, init=False)
+    _executor: ThreadPoolExecutor = field(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=ORDER_RATE_LIMIT, thread_name_prefix="orders"),
+        init=False
+    )
+
+    def start(self, loop: AbstractEventLoop):
+        """
+        sets the event loop on which the orders are handled
+        :param loop: running event loop
+        :return: None
+        """
+        self._loop = loop
+        self._throttle_lock = asyncio.Lock()
+        if self.broker is paper_broker:
+            paper_broker.on_order_update = self.on_order_update
+
+    async def _throttle(self):
+        # not more than rate_limit orders are sent in any one second
+        async with self._throttle_lock:
+            while len(self._sent_at) >= self.rate_limit:
+                wait = 1 - (monotonic() - self._sent_at[0])
+                if wait <= 0:
+                    self._sent_at.popleft()
+                else:
+                    await asyncio.sleep(wait)
+            self._sent_at.append(monotonic())
+
+    async def submit(self, symbol: str, quantity: int, transaction_type: str, product_type: ProductType,
+                     exchange: str) -> OrderHandle:
+        """
+        places a market order and returns its handle straight away, the fill is followed in the background
+        :param symbol: trading symbol
+        :param quantity: quantity to be bought or sold
+        :param transaction_type: BUY or SELL
+        :param product_type: DELIVERY or INTRADAY
+        :param exchange: NSE or BSE
+        :return: handle of the order which can be awaited for the fill
+        """
+        handle = OrderHandle(symbol=symbol, transaction_type=transaction_type, quantity=quantity)
+        if symbol in self._unsettled:
+            handle.close("REJECTED", f"an earlier order of {symbol} has not reached a final state")
+            logger.info(f"{transaction_type} order for {symbol} not placed: {handle.message}")
+            orders_total.labels(transaction_type, "failed").inc()
+            return handle
+        # taken before the first await so that two orders of the symbol can not both pass the check
+        self._unsettled.add(symbol)
+        await self._throttle()
+        try:
+            response = await run_blocking(
+                self.broker.place_order,
+                variety=KiteConnect.VARIETY_REGULAR,
+                order_type=KiteConnect.ORDER_TYPE_MARKET,
+                exchange=KiteConnect.EXCHANGE_NSE if exchange == 'NSE' else KiteConnect.EXCHANGE_BSE,
+                tradingsymbol=symbol,
+                transaction_type=transaction_type,
+                quantity=quantity,
+                product=KiteConnect.PRODUCT_MIS if product_type == ProductType.INTRADAY else KiteConnect.PRODUCT_CNC,
+                validity=KiteConnect.VALIDITY_DAY,
+                executor=self._executor
+            )
+            logger.info(f"response{response}")
+            # the order id is a number, anything else is an error
+            int(response)
+        except Exception as error:
+            logger.exception(f"Error while placing {transaction_type} order for {symbol}")
+            handle.close("REJECTED", str(error))
+            self._unsettled.discard(symbol)
+            orders_total.labels(transaction_type, "failed").inc()
+            log_event("order", order_id=None, symbol=symbol, transaction_type=transaction_type, status=handle.status,
+                      quantity=quantity, filled_quantity=0, average_price=None, message=handle.message)
+            return handle
+
+        orders_total.labels(transaction_type, "placed").inc()
+        handle.order_id = str(response)
+        handle.status = "OPEN"
+        self._handles[handle.order_id] = handle
+        # a postback which arrived while the order was being placed is not missed
+        for order in self._early_updates.pop(handle.order_id, []):
+            handle.update(order)
+        asyncio.create_task(self._reconcile(handle))
+        return handle
+
+    async def _reconcile(self, handle: OrderHandle):
+        cancel_at = monotonic() + self.fill_timeout
+        while not handle.is_done:
+            await asyncio.sleep(self.poll_interval)
+            if handle.is_done:
+                break
+            try:
+                history: list = await run_blocking(self.broker.order_history, handle.order_id, executor=self._executor)
+                if len(history) > 0:
+                    handle.update(history[-1])
+            except Exception:
+                logger.exception(f"Error while fetching order history of {handle.order_id}")
+
+            if not handle.is_done and monotonic() >= cancel_at:
+                # the unfilled rest is cancelled and the order is still followed, the cancellation or a fill
+                # which came first shows up in the history like any other update
+                logger.info(f"order {handle.order_id} of {handle.symbol} still {handle.status} after "
+                            f"{self.fill_timeout}s, cancelling it")
+                try:
+                    await run_blocking(self.broker.cancel_order, variety=KiteConnect.VARIETY_REGULAR,
+                                       order_id=handle.order_id, executor=self._executor)
+                except Exception:
+                    logger.exception(f"Error while cancelling order {handle.order_id}")
+                # tried again if the order is still open after another fill_timeout
+                cancel_at = monotonic() + self.fill_timeout
+
+        self._handles.pop(handle.order_id, None)
+        self._unsettled.discard(handle.symbol)
+        orders_settled.labels(handle.transaction_type, handle.status).inc()
+        log_event("order", order_id=handle.order_id, symbol=handle.symbol, transaction_type=handle.transaction_type,
+                  status=handle.status, quantity=handle.quantity, filled_quantity=handle.filled_quantity,
+                  average_price=handle.average_price, message=handle.message)
+
+    def on_order_update(self, order: dict):
+        """
+        settles the handle of an order from a postback, can be called from any thread
+        :param order: order dictionary as sent by the broker
+        :return: None
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._apply_update, order)
+        else:
+            self._apply_update(order)
+
+    def _apply_update(self, order: dict):
+        order_id = str(order.get("order_id"))
+        handle = self._handles.get(order_id)
+        if handle is not None:
+            handle.update(order)
+            return
+        # orders placed outside the gateway are also received, so only the latest few are kept
+        if order_id not in self._early_updates and len(self._early_updates) >= 100:
+            self._early_updates.pop(next(iter(self._early_updates)))
+        self._early_updates.setdefault(order_id, []).append(order)
+
+    async def execute(self, symbol: str, quantity: int, transaction_type: str, product_type: ProductType,
+                      exchange: str) -> OrderHandle:
+        """
+            places the order and waits till it is filled, rejected or cancelled, but not longer than the fill
+            timeout and the grace for its cancel. An order which is still not final is returned with the
+            quantity filled so far, it keeps being followed and blocks the symbol till it is final
+        """
+        handle = await self.submit(symbol, quantity, transaction_type, product_type, exchange)
+        await handle.wait(self.fill_timeout + self.cancel_grace)
+        if not handle.is_done:
+            logger.warning(f"order {handle.order_id} of {symbol} is still {handle.status} with "
+                           f"{handle.filled_quantity}/{quantity} filled, it is followed in the background")
+        return handle
+
+    def execute_from_thread(self, symbol: str, quantity: int, transaction_type: str, product_type: ProductType,
+                            exchange: str) -> OrderHandle:
+        """
+            same as execute but for the worker threads, it blocks only the calling thread
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.execute(symbol, quantity, transaction_type, product_type, exchange), self._loop
+        )
+        # execute is bounded already, this only covers the throttle and the call placing the order, the
+        # future is not cancelled since the order may have been placed and is followed by the gateway
+        return future.result(self.fill_timeout + self.cancel_grace + BLOCKING_CALL_TIMEOUT + 1)
+
+
+order_gateway = OrderGateway()
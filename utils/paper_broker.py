@@ -0,0 +1,111 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import count
+from logging import Logger
+from threading import Lock, Timer
+from typing import Callable
+
+from constants.settings import PAPER_FILL_LATENCY
+from utils.depth_walk import fill_for_quantity
+from utils.logger import get_logger
+from utils.quote_snapshot import quote_snapshot
+from utils.streaming.depth_table import depth_table
+
+logger: Logger = get_logger(__name__)
+
+
+def market_depth(instrument: str) -> dict | None:
+    """
+        latest depth from the websocket or else from the quotes
+    """
+    depth = depth_table.depth(instrument)
+    return depth if depth is not None else quote_snapshot.depth(instrument)
+
+
+@dataclass
+class PaperBroker:
+    """
+        Local stand in for kite which accepts the same place_order and order_history calls.
+
+        A market order is filled after the latency against the opposite side of the depth, so a thin book
+        gives a partial fill at a worse average price just like the exchange. The order updates are sent
+        to on_order_update the same way kite sends its postbacks.
+    """
+    depth_source: Callable[[str], dict | None] = market_depth
+    latency: float = PAPER_FILL_LATENCY
+    on_order_update: Callable[[dict], None] | None = None
+    _orders: dict[str, list[dict]] = field(default_factory=dict, init=False)
+    _order_ids: count = field(default_factory=lambda: count(1), init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def place_order(self, variety, exchange, tradingsymbol, transaction_type, quantity, product, order_type,
+                    validity=None, **kwargs) -> str:
+        order_id = f"{datetime.now():%y%m%d}{next(self._order_ids):09d}"
+        order = {
+            "order_id": order_id,
+            "variety": variety,
+            "exchange": exchange,
+            "tradingsymbol": tradingsymbol,
+            "transaction_type": transaction_type,
+            "quantity": quantity,
+            "product": product,
+            "order_type": order_type,
+            "validity": validity,
+            "status": "OPEN",
+            "filled_quantity": 0,
+            "pending_quantity": quantity,
+            "average_price": 0,
+            "status_message": None,
+            "order_timestamp": datetime.now(),
+        }
+        self._record(order)
+        timer = Timer(self.latency, self._fill, args=(order_id,))
+        timer.daemon = True
+        timer.start()
+        return order_id
+
+    def cancel_order(self, variety, order_id: str, **kwargs) -> str:
+        order = self.order_history(order_id)[-1]
+        if order["status"] in ("COMPLETE", "REJECTED", "CANCELLED"):
+            raise ValueError(f"order {order_id} is already {order['status']}")
+        self._record(dict(order, status="CANCELLED", pending_quantity=0, status_message="cancelled by the user",
+                          order_timestamp=datetime.now()))
+        return order_id
+
+    def order_history(self, order_id: str) -> list[dict]:
+        with self._lock:
+            return [dict(order) for order in self._orders.get(order_id, [])]
+
+    def _record(self, order: dict):
+        with self._lock:
+            self._orders.setdefault(order["order_id"], []).append(order)
+        if self.on_order_update is not None:
+            self.on_order_update(dict(order))
+
+    def _fill(self, order_id: str):
+        order = self.order_history(order_id)[-1]
+        # an order cancelled before the fill stays cancelled
+        if order["status"] != "OPEN":
+            return
+        depth = self.depth_source(f"{order['exchange']}:{order['tradingsymbol']}")
+        # a buy order takes the sell side of the book and a sell order takes the buy side
+        side = "sell" if order["transaction_type"] == "BUY" else "buy"
+        filled, average_price = fill_for_quantity(depth[side] if depth is not None else [], order["quantity"])
+
+        order = dict(order, filled_quantity=filled, pending_quantity=0, average_price=average_price or 0,
+                     order_timestamp=datetime.now())
+        if filled == order["quantity"]:
+            order["status"] = "COMPLETE"
+        elif filled > 0:
+            # the rest of a market order which can not be filled is cancelled by the exchange
+            order["status"] = "CANCELLED"
+            order["status_message"] = "partially filled, remaining quantity cancelled"
+        else:
+            order["status"] = "REJECTED"
+            order["status_message"] = "no depth available"
+        logger.info(f"paper order {order_id} {order['transaction_type']} {order['tradingsymbol']}: {order['status']} "
+                    f"{filled}/{order['quantity']} @ {average_price}")
+        self._record(order)
+
+
+paper_broker = PaperBroker()
@@ -0,0 +1,129 @@
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from constants.settings import PRICE_BUFFER_CAPACITY, PERSIST_PRICES, PRICE_FLUSH_EVERY
+from utils.clock import clock
+
+
+@dataclass
+class PriceBuffer:
+    """
+        Holds the latest prices of one stock in a preallocated numpy array.
+
+        Every price is written twice, at i and i + capacity, so the latest `capacity` prices are always
+        one contiguous slice and can be handed out as a view without copying.
+
+        The prices are persisted by appending only the new rows to temp/<symbol>.csv, the file is never
+        rewritten and keeps the same format which was earlier produced by DataFrame.to_csv. The prices of a
+        simulated day are neither loaded from nor written to the file.
+    """
+    symbol: str
+    capacity: int = PRICE_BUFFER_CAPACITY
+    persist: bool = PERSIST_PRICES
+    flush_every: int = PRICE_FLUSH_EVERY
+    count: int = field(default=0, init=False)
+    _data: np.ndarray = field(default=None, init=False)
+    _flushed: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        self._data = np.empty(2 * self.capacity, dtype=np.float64)
+        if clock.simulated:
+            self.persist = False
+
+    @property
+    def file_path(self) -> str:
+        return f"temp/{self.symbol}.csv"
+
+    def load(self) -> np.ndarray:
+        """
+        loads the prices saved earlier in the file into the buffer
+        :return: all the prices present in the file
+        """
+        if clock.simulated:
+            return np.empty(0, dtype=np.float64)
+        try:
+            history: pd.DataFrame = pd.read_csv(self.file_path)
+            history.drop(history.columns[0], axis=1, inplace=True)
+            prices: np.ndarray = history['price'].bfill().ffill().dropna().to_numpy(dtype=np.float64)
+        except (FileNotFoundError, KeyError, pd.errors.EmptyDataError):
+            return np.empty(0, dtype=np.float64)
+
+        # positions in the ring depend on the total count so writing starts from the oldest price kept
+        self.count = max(prices.shape[0] - self.capacity, 0)
+        for price in prices[-self.capacity:]:
+            self._write(price)
+        self._flushed = self.count
+        return prices
+
+    def _write(self, price: float):
+        position = self.count % self.capacity
+        self._data[position] = price
+        self._data[position + self.capacity] = price
+        self.count += 1
+
+    def append(self, price: float):
+        """
+        adds the latest price in place and appends it to the file once enough prices are pending
+        :param price: latest price of the stock
+        :return: None
+        """
+        self._write(price)
+        if self.count - self._flushed >= self.flush_every:
+            self.flush()
+
+    @property
+    def prices(self) -> np.ndarray:
+        """
+            read only view of the latest prices, oldest first
+        """
+        if self.count <= self.capacity:
+            view = self._data[:self.count]
+        else:
+            start = self.count % self.capacity
+            view = self._data[start:start + self.capacity]
+        view.flags.writeable = False
+        return view
+
+    def state(self) -> tuple[int, int, np.ndarray]:
+        """
+            total count, flushed count and a copy of the prices held, enough to rebuild the buffer
+        """
+        return self.count, self._flushed, self.prices.copy()
+
+    def restore(self, count: int, flushed: int, prices: np.ndarray):
+        """
+        rebuilds the buffer from its state, the prices which were not flushed are flushed later as usual
+        :param count: total number of prices appended
+        :param flushed: number of prices already in the file
+        :param prices: the latest prices, oldest first
+        :return: None
+        """
+        prices = prices[-self.capacity:]
+        self.count = count - len(prices)
+        for price in prices:
+            self._write(price)
+        self._flushed = flushed
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def flush(self):
+        """
+        appends the prices which are not yet saved to the file
+        :return: None
+        """
+        pending = self.count - self._flushed
+        if not self.persist or pending <= 0:
+            return
+        new_file = not os.path.exists(self.file_path)
+        with open(self.file_path, "a") as file:
+            if new_file:
+                file.write(",price\n")
+            # only the prices still present in the buffer can be written
+            for index, price in zip(range(self.count - min(pending, self.capacity), self.count),
+                                    self.prices[-min(pending, self.capacity):]):
+                file.write(f"{index},{float(price)!r}\n")
+        self._flushed = self.count
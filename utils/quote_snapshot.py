@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+from time import monotonic
+
+from constants.enums.request_priority import RequestPriority
+from constants.settings import QUOTE_TTL, QUOTE_BATCH_SIZE, MARKET_SIMULATOR
+from utils.kite_scheduler import kite_scheduler
+from utils.market_simulator import market_simulator
+
+
+@dataclass
+class QuoteSnapshot:
+    """
+        Market depth of all the tracked instruments fetched with as few quote calls as possible.
+
+        refresh is called once per loop with every instrument which will be needed in that loop and
+        all the consumers then read the depth from here. If an instrument is missing or its quote is
+        older than ttl seconds then it is fetched on its own. With MARKET_SIMULATOR the quotes come from
+        the simulated market instead of kite.
+    """
+    ttl: float = QUOTE_TTL
+    batch_size: int = QUOTE_BATCH_SIZE
+    _quotes: dict[str, dict] = field(default_factory=dict, init=False)
+    _fetched_at: dict[str, float] = field(default_factory=dict, init=False)
+
+    def _fetch(self, instruments: list[str], priority: RequestPriority):
+        for start in range(0, len(instruments), self.batch_size):
+            source = market_simulator if MARKET_SIMULATOR else kite_scheduler
+            response: dict = source.quote(instruments[start:start + self.batch_size], priority)
+            fetched_at = monotonic()
+            for instrument, quote in response.items():
+                self._quotes[instrument] = quote
+                self._fetched_at[instrument] = fetched_at
+
+    def refresh(self, instruments: list[str], priority: RequestPriority = RequestPriority.WATCHLIST):
+        """
+        fetches the quotes of all the given instruments in batches
+        :param instruments: list of instruments in the form EXCHANGE:SYMBOL
+        :param priority: priority of the quote requests
+        :return: None
+        """
+        self._fetch(list(dict.fromkeys(instruments)), priority)
+
+    def quote(self, instrument: str, priority: RequestPriority = RequestPriority.WATCHLIST) -> dict:
+        """
+        returns the full quote of the instrument from the snapshot, fetching it if it is stale
+        :param instrument: instrument in the form EXCHANGE:SYMBOL
+        :param priority: priority of the quote request if it has to be fetched
+        :return: quote as returned by kite
+        """
+        fetched_at = self._fetched_at.get(instrument)
+        if fetched_at is None or monotonic() - fetched_at > self.ttl:
+            self._fetch([instrument], priority)
+        return self._quotes[instrument]
+
+    def depth(self, instrument: str, priority: RequestPriority = RequestPriority.WATCHLIST) -> dict:
+        """
+        returns the market depth having buy and sell orders
+        :param instrument: instrument in the form EXCHANGE:SYMBOL
+        :param priority: priority of the quote request if it has to be fetched
+        :return: dictionary with buy and sell list
+        """
+        return self.quote(instrument, priority)["depth"]
+
+    def invalidate(self, instrument: str | None = None):
+        """
+        removes the quote of the instrument or of all the instruments so that it is fetched again
+        :param instrument: instrument in the form EXCHANGE:SYMBOL or None for all
+        :return: None
+        """
+        if instrument is None:
+            self._quotes.clear()
+            self._fetched_at.clear()
+        else:
+            self._quotes.pop(instrument, None)
+            self._fetched_at.pop(instrument, None)
+
+
+quote_snapshot = QuoteSnapshot()
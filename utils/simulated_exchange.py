@@ -0,0 +1,108 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from logging import Logger
+
+from kiteconnect import KiteConnect
+
+from constants.enums.product_type import ProductType
+from constants.settings import BACKTEST_SPREAD, BACKTEST_DEPTH_LEVELS, BACKTEST_LEVEL_QUANTITY
+from utils.clock import clock
+from utils.depth_walk import fill_for_quantity
+from utils.logger import get_logger
+from utils.order_gateway import OrderHandle
+from utils.streaming.depth_table import depth_table, DepthTable
+
+logger: Logger = get_logger(__name__)
+
+
+@dataclass
+class Fill:
+    time: datetime
+    symbol: str
+    transaction_type: str
+    quantity: int
+    filled_quantity: int
+    average_price: float | None
+    status: str
+
+
+@dataclass
+class SimulatedExchange:
+    """
+        Market of a backtest.
+
+        The price of every bar is turned into a depth around it which is written to the depth table, so the
+        models read their quotes the same way as when streaming. The orders are filled straight away against
+        the opposite side of that depth at the time of the clock, a thin depth giving a partial fill at a
+        worse price, and every fill is kept.
+    """
+    spread: float = BACKTEST_SPREAD
+    levels: int = BACKTEST_DEPTH_LEVELS
+    level_quantity: int = BACKTEST_LEVEL_QUANTITY
+    tick_size: float = 0.05
+    table: DepthTable = field(default_factory=lambda: depth_table)
+    exchange: str = "NSE"
+    fills: list[Fill] = field(default_factory=list, init=False)
+
+    def _round(self, price: float) -> float:
+        return round(round(price / self.tick_size) * self.tick_size, 2)
+
+    def depth(self, price: float) -> dict:
+        """
+        depth in the format of a kite quote with the levels a tick apart around the price
+        :param price: price of the bar
+        :return: dictionary with buy and sell list
+        """
+        half_spread = max(self._round(price * self.spread / 2), self.tick_size)
+        return {
+            "buy": [{"price": self._round(price - half_spread - level * self.tick_size),
+                     "quantity": self.level_quantity, "orders": 1} for level in range(self.levels)],
+            "sell": [{"price": self._round(price + half_spread + level * self.tick_size),
+                      "quantity": self.level_quantity, "orders": 1} for level in range(self.levels)],
+        }
+
+    def publish(self, prices: dict[str, float]):
+        """
+        writes the depth of every symbol which has a price in the bar, the others keep their last depth
+        :param prices: price of the bar for every symbol
+        :return: None
+        """
+        for symbol, price in prices.items():
+            if price == price and price > 0:
+                self.table.update(f"{self.exchange}:{symbol}", {"last_price": price, "depth": self.depth(price)})
+
+    def quote(self, instrument: str) -> dict | None:
+        """
+        latest depth of the instrument, used as the quote source of the models so that nothing goes to kite
+        :param instrument: instrument in the form EXCHANGE:SYMBOL
+        :return: dictionary with buy and sell list or None if the symbol has not had a price yet
+        """
+        return self.table.depth(instrument)
+
+    def execute(self, symbol: str, quantity: int, product_type: ProductType, exchange: str,
+                transaction_type: str) -> OrderHandle | None:
+        """
+        fills a market order against the latest depth of the symbol, used as the order executor of take_position
+        :param symbol: trading symbol
+        :param quantity: quantity of the order
+        :param product_type: product type of the order
+        :param exchange: exchange of the symbol
+        :param transaction_type: BUY or SELL
+        :return: the filled order or None if nothing was filled
+        """
+        depth = self.table.depth(f"{exchange}:{symbol}")
+        # a buy order takes the sell side of the book and a sell order takes the buy side
+        side = "sell" if transaction_type == KiteConnect.TRANSACTION_TYPE_BUY else "buy"
+        filled, average_price = fill_for_quantity(depth[side] if depth is not None else [], quantity)
+
+        handle = OrderHandle(symbol=symbol, transaction_type=transaction_type, quantity=quantity)
+        handle.filled_quantity = filled
+        handle.average_price = average_price
+        if filled == quantity:
+            handle.close("COMPLETE")
+        elif filled > 0:
+            handle.close("CANCELLED", "partially filled, remaining quantity cancelled")
+        else:
+            handle.close("REJECTED", "no depth available")
+        self.fills.append(Fill(clock.now(), symbol, transaction_type, quantity, filled, average_price, handle.status))
+        return handle if filled > 0 else None
@@ -0,0 +1,63 @@
+from dataclasses import dataclass, field
+from threading import Lock
+from time import monotonic
+
+
+@dataclass
+class DepthTable:
+    """
+        Latest market depth of every streamed instrument.
+
+        It is written from the websocket thread and read from the trading loop, so every access goes
+        through a lock. The depth is kept in the same format as the depth of a kite quote.
+    """
+    _depths: dict[str, dict] = field(default_factory=dict, init=False)
+    _last_prices: dict[str, float] = field(default_factory=dict, init=False)
+    _received_at: dict[str, float] = field(default_factory=dict, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def update(self, instrument: str, tick: dict):
+        """
+        stores the depth and last price of a full mode tick
+        :param instrument: instrument in the form EXCHANGE:SYMBOL
+        :param tick: tick as parsed by KiteTicker
+        :return: None
+        """
+        with self._lock:
+            if "depth" in tick:
+                self._depths[instrument] = tick["depth"]
+            self._last_prices[instrument] = tick["last_price"]
+            self._received_at[instrument] = monotonic()
+
+    def depth(self, instrument: str) -> dict | None:
+        """
+        returns the latest depth of the instrument or None if it has not been received
+        :param instrument: instrument in the form EXCHANGE:SYMBOL
+        :return: dictionary with buy and sell list
+        """
+        with self._lock:
+            return self._depths.get(instrument)
+
+    def last_price(self, instrument: str) -> float | None:
+        with self._lock:
+            return self._last_prices.get(instrument)
+
+    def age(self, instrument: str) -> float | None:
+        """
+            seconds since the last tick of the instrument was received
+        """
+        with self._lock:
+            received_at = self._received_at.get(instrument)
+        return None if received_at is None else monotonic() - received_at
+
+    def clear(self):
+        """
+            removes everything so that the consumers fall back on the quotes when the stream is down
+        """
+        with self._lock:
+            self._depths.clear()
+            self._last_prices.clear()
+            self._received_at.clear()
+
+
+depth_table = DepthTable()
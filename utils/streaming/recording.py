@@ -0,0 +1,23 @@
+import json
+
+
+def load_recording(path: str) -> list[dict]:
+    """
+    reads the ticks recorded by TickStream
+    :param path: path of the jsonl file
+    :return: list of {"time": epoch, "ticks": [...]}
+    """
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def recorded_tokens(path: str) -> dict[str, int]:
+    """
+    instrument tokens present in the recording so that the stream can be subscribed without kite
+    :param path: path of the jsonl file
+    :return: dictionary with instrument as key and token as value
+    """
+    return {
+        tick["instrument"]: tick["instrument_token"]
+        for batch in load_recording(path) for tick in batch["ticks"] if "instrument" in tick
+    }
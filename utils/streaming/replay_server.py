@@ -0,0 +1,164 @@
+# A local stand in for the kite websocket which plays back the ticks recorded by TickStream.
+# Set TICKER_ROOT_URI = "ws://127.0.0.1:8765" and start it with
+#     python -m utils.streaming.replay_server temp/ticks.jsonl --port 8765 --speed 10
+import argparse
+import asyncio
+import json
+import struct
+from datetime import datetime
+
+from autobahn.asyncio.websocket import WebSocketServerProtocol, WebSocketServerFactory
+
+from utils.streaming.recording import load_recording
+
+PRICE_DIVISOR = 100.0
+DEPTH_LEVELS = 5
+
+
+def _price(value) -> int:
+    return int(round((value or 0) * PRICE_DIVISOR))
+
+
+def _timestamp(value) -> int:
+    if not value:
+        return 0
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(datetime.fromisoformat(str(value)).timestamp())
+
+
+def encode_full_packet(tick: dict) -> bytes:
+    """
+    encodes a tick in the 184 bytes full mode packet which is parsed by KiteTicker
+    :param tick: tick in the same format as received in on_ticks
+    :return: binary packet
+    """
+    ohlc: dict = tick.get("ohlc", {})
+    packet = struct.pack(
+        ">16I",
+        tick["instrument_token"],
+        _price(tick.get("last_price")),
+        tick.get("last_traded_quantity", 0),
+        _price(tick.get("average_traded_price")),
+        tick.get("volume_traded", 0),
+        tick.get("total_buy_quantity", 0),
+        tick.get("total_sell_quantity", 0),
+        _price(ohlc.get("open")),
+        _price(ohlc.get("high")),
+        _price(ohlc.get("low")),
+        _price(ohlc.get("close")),
+        _timestamp(tick.get("last_trade_time")),
+        tick.get("oi", 0),
+        tick.get("oi_day_high", 0),
+        tick.get("oi_day_low", 0),
+        _timestamp(tick.get("exchange_timestamp")),
+    )
+    depth: dict = tick.get("depth", {})
+    for side in ["buy", "sell"]:
+        levels: list = depth.get(side, [])[:DEPTH_LEVELS]
+        levels = levels + [{"quantity": 0, "price": 0, "orders": 0}] * (DEPTH_LEVELS - len(levels))
+        for level in levels:
+            packet += struct.pack(">IIHxx", level["quantity"], _price(level["price"]), level["orders"])
+    return packet
+
+
+def encode_message(ticks: list[dict]) -> bytes:
+    """
+    packs the ticks in one binary message, 2 bytes for number of packets followed by length and packet
+    :param ticks: list of ticks
+    :return: binary message
+    """
+    message = struct.pack(">H", len(ticks))
+    for tick in ticks:
+        packet = encode_full_packet(tick)
+        message += struct.pack(">H", len(packet)) + packet
+    return message
+
+
+class ReplayProtocol(WebSocketServerProtocol):
+    """
+        Handles the subscribe, unsubscribe and mode messages sent by KiteTicker
+    """
+
+    def onOpen(self):
+        self.tokens = set()
+        self.factory.clients.add(self)
+
+    def onMessage(self, payload, is_binary):
+        if is_binary:
+            return
+        try:
+            message: dict = json.loads(payload.decode("utf-8"))
+        except ValueError:
+            return
+        match message.get("a"):
+            case "subscribe":
+                self.tokens.update(message["v"])
+            case "unsubscribe":
+                self.tokens.difference_update(message["v"])
+            case "mode":
+                self.tokens.update(message["v"][1])
+        self.factory.subscribed.set()
+
+    def onClose(self, was_clean, code, reason):
+        self.factory.clients.discard(self)
+
+
+class ReplayServerFactory(WebSocketServerFactory):
+    protocol = ReplayProtocol
+
+    def __init__(self, recording: list[dict], speed: float = 1.0, loop_forever: bool = False, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recording = recording
+        self.speed = speed
+        self.loop_forever = loop_forever
+        self.clients: set[ReplayProtocol] = set()
+        self.subscribed = asyncio.Event()
+
+    async def replay(self):
+        """
+            sends the recorded ticks to every client with the recorded gaps divided by speed,
+            a speed of 0 sends them as fast as possible
+        """
+        await self.subscribed.wait()
+        while True:
+            previous_time = None
+            for batch in self.recording:
+                if previous_time is not None and self.speed > 0:
+                    await asyncio.sleep(max(batch["time"] - previous_time, 0) / self.speed)
+                previous_time = batch["time"]
+                for client in list(self.clients):
+                    ticks = [tick for tick in batch["ticks"] if tick["instrument_token"] in client.tokens]
+                    if len(ticks) > 0:
+                        client.sendMessage(encode_message(ticks), isBinary=True)
+                # lets the clients receive the message even when there is no gap
+                await asyncio.sleep(0)
+            if not self.loop_forever:
+                break
+
+
+async def serve(path: str, host: str = "127.0.0.1", port: int = 8765, speed: float = 1.0, loop_forever: bool = False):
+    """
+    starts the replay server and plays back the recording once the first client subscribes
+    :param path: path of the recorded jsonl file
+    :param host: host to listen on
+    :param port: port to listen on
+    :param speed: how many times faster than recorded the ticks are sent
+    :param loop_forever: whether to start again from the beginning when the recording ends
+    :return: None
+    """
+    factory = ReplayServerFactory(load_recording(path), speed, loop_forever, f"ws://{host}:{port}")
+    server = await asyncio.get_running_loop().create_server(factory, host, port)
+    async with server:
+        await factory.replay()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="plays back the ticks recorded from the kite websocket")
+    parser.add_argument("path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--loop", action="store_true")
+    arguments = parser.parse_args()
+    asyncio.run(serve(arguments.path, arguments.host, arguments.port, arguments.speed, arguments.loop))
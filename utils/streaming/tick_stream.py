@@ -0,0 +1,162 @@
+import asyncio
+import json
+from asyncio import AbstractEventLoop
+from dataclasses import dataclass, field
+from logging import Logger
+from time import time
+
+from kiteconnect import KiteTicker
+from twisted.internet import reactor
+
+from constants.global_contexts import kite_context
+from constants.settings import TICKER_ROOT_URI, TICK_RECORD_PATH, LOG_TICK_EVENTS
+from utils.instrument_master import instrument_master
+from utils.logger import get_logger, log_event
+from utils.order_gateway import order_gateway
+from utils.quote_snapshot import quote_snapshot
+from utils.streaming.depth_table import depth_table
+
+logger: Logger = get_logger(__name__)
+
+
+@dataclass
+class TickStream:
+    """
+        Streams full mode ticks of the subscribed instruments from the kite websocket.
+
+        Every tick updates the depth table and the instrument is queued on the event loop so that the
+        strategy is evaluated for it as soon as its tick arrives. If an instrument ticks again before it
+        has been evaluated, it is queued only once since the depth table already has the latest tick.
+    """
+    root: str | None = TICKER_ROOT_URI
+    record_path: str | None = TICK_RECORD_PATH
+    _ticker: KiteTicker | None = field(default=None, init=False)
+    _loop: AbstractEventLoop | None = field(default=None, init=False)
+    _queue: asyncio.Queue | None = field(default=None, init=False)
+    _pending: set[str] = field(default_factory=set, init=False)
+    _instruments: dict[int, str] = field(default_factory=dict, init=False)
+    _tokens: dict[str, int] = field(default_factory=dict, init=False)
+
+    @property
+    def is_connected(self) -> bool:
+        return self._ticker is not None and self._ticker.is_connected()
+
+    def start(self, loop: AbstractEventLoop):
+        """
+        connects to the websocket in its own thread
+        :param loop: event loop on which the ticks are queued
+        :return: None
+        """
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._ticker = KiteTicker(kite_context.api_key, kite_context.access_token, root=self.root)
+        self._ticker.on_connect = self._on_connect
+        self._ticker.on_ticks = self._on_ticks
+        self._ticker.on_close = self._on_close
+        # the order updates sent on the websocket settle the orders without waiting for the next poll
+        self._ticker.on_order_update = self._on_order_update
+        self._ticker.connect(threaded=True)
+        logger.info(f"TICK STREAM STARTED on {self._ticker.root}")
+
+    def stop(self):
+        if self._ticker is not None:
+            # the websocket belongs to the reactor thread so everything sent on it is handed over to that thread
+            reactor.callFromThread(self._ticker.close)
+            self._ticker = None
+        depth_table.clear()
+
+    def subscribe(self, instruments: list[str], instrument_tokens: dict[str, int] | None = None):
+        """
+        subscribes the instruments in full mode which are not yet subscribed
+        :param instruments: list of instruments in the form EXCHANGE:SYMBOL
+        :param instrument_tokens: tokens of the instruments, if not provided then they are taken from the
+        instrument master and from the quotes for the ones which are not found there
+        :return: None
+        """
+        new_instruments = [instrument for instrument in dict.fromkeys(instruments) if instrument not in self._tokens]
+        if len(new_instruments) == 0:
+            return
+
+        if instrument_tokens is None:
+            try:
+                instrument_tokens = instrument_master.instrument_tokens(new_instruments)
+            except:
+                logger.exception("Instrument master could not be loaded")
+                instrument_tokens = {}
+            missing = [instrument for instrument in new_instruments if instrument not in instrument_tokens]
+            if len(missing) > 0:
+                quote_snapshot.refresh(missing)
+                for instrument in missing:
+                    try:
+                        instrument_tokens[instrument] = quote_snapshot.quote(instrument)["instrument_token"]
+                    except KeyError:
+                        pass
+        tokens = []
+        for instrument in new_instruments:
+            try:
+                token = instrument_tokens[instrument]
+            except KeyError:
+                logger.info(f"instrument token not found for {instrument}")
+                continue
+            self._tokens[instrument] = token
+            self._instruments[token] = instrument
+            tokens.append(token)
+
+        # tokens subscribed before the connection opens are sent in _on_connect
+        if self.is_connected and len(tokens) > 0:
+            reactor.callFromThread(self._subscribe, self._ticker, tokens)
+
+    @staticmethod
+    def _subscribe(ws: KiteTicker, tokens: list[int]):
+        ws.subscribe(tokens)
+        ws.set_mode(ws.MODE_FULL, tokens)
+
+    def _on_connect(self, ws: KiteTicker, response):
+        tokens = list(self._instruments.keys())
+        if len(tokens) > 0:
+            self._subscribe(ws, tokens)
+
+    def _on_close(self, ws: KiteTicker, code, reason):
+        # the consumers fall back on the quotes till the connection is back
+        depth_table.clear()
+
+    @staticmethod
+    def _on_order_update(ws: KiteTicker, order: dict):
+        order_gateway.on_order_update(order)
+
+    def _on_ticks(self, ws: KiteTicker, ticks: list[dict]):
+        for tick in ticks:
+            instrument = self._instruments.get(tick["instrument_token"])
+            if instrument is None:
+                continue
+            tick["instrument"] = instrument
+            depth_table.update(instrument, tick)
+            if LOG_TICK_EVENTS:
+                log_event("tick", instrument=instrument, last_price=tick.get("last_price"),
+                          volume_traded=tick.get("volume_traded"), exchange_timestamp=tick.get("exchange_timestamp"))
+            self._loop.call_soon_threadsafe(self._notify, instrument)
+
+        if self.record_path is not None:
+            with open(self.record_path, "a") as file:
+                file.write(json.dumps({"time": time(), "ticks": ticks}, default=str) + "\n")
+
+    def _notify(self, instrument: str):
+        if instrument not in self._pending:
+            self._pending.add(instrument)
+            self._queue.put_nowait(instrument)
+
+    async def next_tick(self, timeout: float) -> str | None:
+        """
+        waits for the next instrument which has received a tick
+        :param timeout: maximum seconds to wait
+        :return: instrument in the form EXCHANGE:SYMBOL or None if nothing arrived
+        """
+        try:
+            instrument = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._pending.discard(instrument)
+        return instrument
+
+
+tick_stream = TickStream()
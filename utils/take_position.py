@@ -1,73 +1,84 @@
-import json
 from logging import Logger
-from kiteconnect.exceptions import InputException
+from typing import Callable
+
+from kiteconnect import KiteConnect
 
 from constants.enums.product_type import ProductType
-from constants.global_contexts import kite_context
 from constants.settings import DEBUG
+from utils.order_gateway import order_gateway, OrderHandle
+from utils.tracing import tracer
 
 from utils.logger import get_logger
 
 logger: Logger = get_logger(__name__)
 
+# when set the orders are sent to it instead of the gateway, e.g. to the simulated exchange of a backtest
+_order_executor: Callable[[str, int, ProductType, str, str], OrderHandle | None] | None = None
+
 
-def short(symbol: str, quantity: int, product_type: ProductType, exchange: str):
+def set_order_executor(executor: Callable[[str, int, ProductType, str, str], OrderHandle | None] | None):
     """
-        takes a short position which means it will
-        1. sell the position which has already been bought, or
-        2. sell a negative quantity of stocks
+    routes the orders to the given function, None sends them to the gateway again
+    :param executor: takes symbol, quantity, product type, exchange and transaction type and returns the
+        filled order or None if nothing was filled
+    :return: None
+    """
+    global _order_executor
+    _order_executor = executor
+
+
+def _filled_handle(symbol: str, quantity: int, transaction_type: str) -> OrderHandle:
+    """
+        in DEBUG nothing is placed and the order is taken as filled at the price known to the caller
     """
+    handle = OrderHandle(symbol=symbol, transaction_type=transaction_type, quantity=quantity)
+    handle.filled_quantity = quantity
+    handle.close("COMPLETE")
+    return handle
+
+
+def _execute(symbol: str, quantity: int, product_type: ProductType, exchange: str,
+             transaction_type: str) -> OrderHandle | None:
     logger.info(symbol)
-    if DEBUG:
-        return True
-    try:
-        response = kite_context.place_order(
-            variety=kite_context.VARIETY_REGULAR,
-            order_type=kite_context.ORDER_TYPE_MARKET,
-            exchange=kite_context.EXCHANGE_NSE if exchange == 'NSE' else kite_context.EXCHANGE_BSE,
-            tradingsymbol=symbol,
-            transaction_type=kite_context.TRANSACTION_TYPE_SELL,
-            quantity=quantity,
-            product=kite_context.PRODUCT_MIS if product_type == ProductType.INTRADAY else kite_context.PRODUCT_CNC,
-            validity=kite_context.VALIDITY_DAY
-        )
-        logger.info(f"response{response}")
+    # from sending the order till it is filled, or given up
+    with tracer.span("place_order", transaction_type=transaction_type, quantity=quantity) as span:
+        if _order_executor is not None:
+            return _order_executor(symbol, quantity, product_type, exchange, transaction_type)
+        if DEBUG:
+            return _filled_handle(symbol, quantity, transaction_type)
         try:
-            order_id = int(response)
-            return True
+            order = order_gateway.execute_from_thread(symbol, quantity, transaction_type, product_type, exchange)
         except:
-            raise Exception(f"{response}")
-    except:
-        logger.exception("Error during selling")
-        return False
+            logger.exception(f"Error during {'buying' if transaction_type == KiteConnect.TRANSACTION_TYPE_BUY else 'selling'}")
+            span.set(status="ERROR")
+            return None
+        span.set(status=order.status, filled_quantity=order.filled_quantity)
+        # an order which is accepted can still be rejected, or be filled only partly
+        if order.filled_quantity <= 0:
+            logger.info(f"{transaction_type} order for {symbol} not filled: {order.status} {order.message}")
+            return None
+        return order
 
 
-def long(symbol: str, quantity: int, product_type: ProductType, exchange: str):
+def short(symbol: str, quantity: int, product_type: ProductType, exchange: str) -> OrderHandle | None:
+    """
+        takes a short position which means it will
+        1. sell the position which has already been bought, or
+        2. sell a negative quantity of stocks
+
+        It waits for the fill and returns the order with the filled quantity and average price,
+        or None if nothing was filled. It must not be called from the event loop thread.
+    """
+    return _execute(symbol, quantity, product_type, exchange, KiteConnect.TRANSACTION_TYPE_SELL)
+
+
+def long(symbol: str, quantity: int, product_type: ProductType, exchange: str) -> OrderHandle | None:
     """
         takes a long position which means it will
         1. buy the position which has already been short, or
         2. buy a positive quantity of stocks
+
+        It waits for the fill and returns the order with the filled quantity and average price,
+        or None if nothing was filled. It must not be called from the event loop thread.
     """
-    logger.info(symbol)
-    if DEBUG:
-        return True
-    try:
-        response = kite_context.place_order(
-            variety=kite_context.VARIETY_REGULAR,
-            order_type=kite_context.ORDER_TYPE_MARKET,
-            exchange=kite_context.EXCHANGE_NSE if exchange == 'NSE' else kite_context.EXCHANGE_BSE,
-            tradingsymbol=symbol,
-            transaction_type=kite_context.TRANSACTION_TYPE_BUY,
-            quantity=quantity,
-            product=kite_context.PRODUCT_MIS if product_type == ProductType.INTRADAY else kite_context.PRODUCT_CNC,
-            validity=kite_context.VALIDITY_DAY
-        )
-        logger.info(f"response{response}")
-        try:
-            order_id = int(response)
-            return True
-        except:
-            raise Exception(f"{response}")
-    except:
-        logger.exception("Error during buying")
-        return False
+    return _execute(symbol, quantity, product_type, exchange, KiteConnect.TRANSACTION_TYPE_BUY)
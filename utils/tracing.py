@@ -0,0 +1,234 @@
+import json
+import os
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from functools import wraps
+from itertools import count
+from statistics import mean, quantiles
+from threading import local, get_ident
+from time import perf_counter_ns, time_ns
+from typing import Callable
+
+from constants.settings import TRACE_SAMPLE_RATE, TRACE_RING_SIZE
+
+# perf_counter has the resolution for the durations and this puts its readings on the wall clock
+_EPOCH_OFFSET_NS = time_ns() - perf_counter_ns()
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    trace_id: int
+    span_id: int
+    parent_id: int | None
+    symbol: str | None
+    thread: int
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "symbol": self.symbol, "thread": self.thread, "start_ns": self.start_ns + _EPOCH_OFFSET_NS,
+                "duration_ms": self.duration_ns / 1e6, "attributes": self.attributes}
+
+
+class _NoSpan:
+    """
+        returned when nothing is recorded so that a span costs only the call when tracing is off
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class _ActiveSpan:
+    __slots__ = ("tracer", "span")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self):
+        self.tracer._stack().append(self.span)
+        self.span.start_ns = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.span.end_ns = perf_counter_ns()
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        self.tracer._stack().pop()
+        # appending to a deque is atomic so the worker threads do not need a lock
+        self.tracer.spans.append(self.span)
+        return False
+
+    def set(self, **attributes):
+        self.span.attributes.update(attributes)
+
+
+@dataclass
+class Tracer:
+    """
+        Spans of the stages of every trading decision kept in a ring of the latest `capacity` spans.
+
+        A decision e.g. updating the price of a stock, checking the breach of a position or buying is a root
+        span, and it is sampled with the probability sample_rate. The spans opened by the same thread while it
+        is running become its children, every other span is dropped, so a stage which is reached from many
+        decisions is traced only as part of the ones which are sampled. With a sample rate of 0 a span costs
+        one call returning a shared object that does nothing.
+    """
+    sample_rate: float = TRACE_SAMPLE_RATE
+    capacity: int = TRACE_RING_SIZE
+    spans: deque[Span] = field(default=None, init=False)
+    _ids: count = field(default_factory=lambda: count(1), init=False)
+    _local: local = field(default_factory=local, init=False)
+
+    def __post_init__(self):
+        self.spans = deque(maxlen=self.capacity)
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def set_sample_rate(self, sample_rate: float):
+        """
+        :param sample_rate: fraction of the decisions which are traced, 0 turns tracing off
+        :return: None
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample rate has to be between 0 and 1, got {sample_rate}")
+        self.sample_rate = sample_rate
+
+    def span(self, name: str, symbol: str | None = None, root: bool = False, **attributes) -> _ActiveSpan | _NoSpan:
+        """
+        span to be used as a context manager around a stage
+        :param name: name of the stage e.g. observe_price
+        :param symbol: stock of the decision, taken from the parent if not given
+        :param root: True if the stage starts a decision, else it is recorded only inside a sampled decision
+        :param attributes: anything else to be kept with the span
+        :return: context manager whose set method adds attributes
+        """
+        if self.sample_rate <= 0:
+            return NO_SPAN
+        stack = self._stack()
+        if stack:
+            parent = stack[-1]
+            return _ActiveSpan(self, Span(name, parent.trace_id, next(self._ids), parent.span_id,
+                                          symbol or parent.symbol, get_ident(), 0, attributes=attributes))
+        if not root or random.random() >= self.sample_rate:
+            return NO_SPAN
+        span_id = next(self._ids)
+        return _ActiveSpan(self, Span(name, span_id, span_id, None, symbol, get_ident(), 0, attributes=attributes))
+
+    def clear(self):
+        self.spans.clear()
+
+    def traces(self, symbol: str | None = None, limit: int | None = None) -> list[dict]:
+        """
+        the latest decisions with their stages in the order they started
+        :param symbol: only the decisions of this stock if given
+        :param limit: most recent number of decisions returned
+        :return: one dictionary per decision with the offset and duration of every stage in milliseconds
+        """
+        grouped: dict[int, list[Span]] = {}
+        for span in list(self.spans):
+            if symbol is None or span.symbol == symbol:
+                grouped.setdefault(span.trace_id, []).append(span)
+
+        traces = []
+        for trace_id, spans in grouped.items():
+            spans.sort(key=lambda span: span.start_ns)
+            root = next((span for span in spans if span.span_id == trace_id), None)
+            # the root of a decision which is still running, or which was pushed out of the ring, is not there
+            if root is None:
+                continue
+            depths = {root.span_id: 0}
+            stages = []
+            for span in spans:
+                depths[span.span_id] = depths.get(span.parent_id, 0) + 1 if span is not root else 0
+                stages.append({"name": span.name, "depth": depths[span.span_id],
+                               "offset_ms": (span.start_ns - root.start_ns) / 1e6,
+                               "duration_ms": span.duration_ns / 1e6, "attributes": span.attributes})
+            traces.append({"trace_id": trace_id, "name": root.name, "symbol": root.symbol,
+                           "started_at_ns": root.start_ns + _EPOCH_OFFSET_NS,
+                           "duration_ms": root.duration_ns / 1e6, "stages": stages})
+        traces.sort(key=lambda trace: trace["started_at_ns"])
+        return traces[-limit:] if limit else traces
+
+    def summary(self) -> dict[str, dict]:
+        """
+        :return: count, mean, p50, p95 and maximum in milliseconds of every stage in the ring
+        """
+        durations: dict[str, list[float]] = {}
+        for span in list(self.spans):
+            durations.setdefault(span.name, []).append(span.duration_ns / 1e6)
+        result = {}
+        for name, values in sorted(durations.items()):
+            percentiles = quantiles(values, n=100, method="inclusive") if len(values) > 1 else values * 99
+            result[name] = {"count": len(values), "mean_ms": mean(values), "p50_ms": percentiles[49],
+                            "p95_ms": percentiles[94], "max_ms": max(values)}
+        return result
+
+    def chrome_trace(self) -> dict:
+        """
+        :return: the spans in the trace event format read by chrome://tracing and Perfetto
+        """
+        process = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {"name": span.name, "cat": span.symbol or "trace", "ph": "X", "pid": process, "tid": span.thread,
+                 "ts": (span.start_ns + _EPOCH_OFFSET_NS) / 1e3, "dur": span.duration_ns / 1e3,
+                 "args": {"symbol": span.symbol, "trace_id": span.trace_id, **span.attributes}}
+                for span in list(self.spans)
+            ],
+        }
+
+    def export_chrome(self, path: str):
+        """
+        writes the chrome trace of the spans in the ring
+        :param path: json file to be written
+        :return: None
+        """
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+
+
+tracer = Tracer()
+
+
+def traced(name: str, root: bool = False, symbol: Callable[..., str | None] | None = None):
+    """
+    runs the decorated function inside a span
+    :param name: name of the stage
+    :param root: True if the function starts a decision
+    :param symbol: gives the stock from the arguments of the function
+    :return: decorator
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if tracer.sample_rate <= 0:
+                return function(*args, **kwargs)
+            with tracer.span(name, symbol(*args, **kwargs) if symbol is not None else None, root):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
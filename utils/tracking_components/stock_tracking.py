@@ -1,7 +1,11 @@
 from datetime import datetime
-import yfinance as yf
 
-from utils.indicators.kaufman_indicator import kaufman_indicator
+import numpy as np
+import pandas as pd
+
+from constants.strategy_parameters import strategy_parameters
+from utils.history_cache import download_history
+from utils.indicators.kaufman_indicator import kaufman_indicator_matrix
 
 
 def filter_stocks(obtained_stock_list):
@@ -11,48 +15,61 @@ def filter_stocks(obtained_stock_list):
         if '-BE' not in symbol:
             initial_stock_list.append(symbol)
 
-    monthly_data = yf.download(tickers=[f"{stock}.NS" for stock in initial_stock_list], period='1y', interval='1d',
-                               show_errors=False)['Open']
+    monthly_data = download_history([f"{stock}.NS" for stock in initial_stock_list], period='1y', interval='1d',
+                                    price_field='Open')
 
     monthly_data = monthly_data.bfill().ffill()
     monthly_data = monthly_data.dropna(axis=1)
 
+    return screen_stocks(monthly_data)
+
+
+def screen_stocks(monthly_data: pd.DataFrame, now: datetime | None = None) -> list:
+    """
+    checks all the stocks together on a (days x stocks) matrix and returns the ones whose KAMA line has
+    recently gone from below the medium line to above it
+    :param monthly_data: daily prices with one column per stock
+    :param now: time against which the crossover is checked to be recent
+    :return: list of the selected stocks
+    """
+    if now is None:
+        now = datetime.now()
+
     # checking whether all the stock follows 2 conditions
     # 1. going from below the medium line to above the medium line
     # 2. touching the minimum line and then increasing
-    final_stock_list = []
-
-    for stock_name in list(monthly_data.columns):
-        rsi_stock = monthly_data[[stock_name]]
-        rsi_stock.insert(1, "line", kaufman_indicator(rsi_stock[stock_name]))
-        rsi_stock.insert(2, "max", rsi_stock.line.rolling(window=60).max())
-        rsi_stock.insert(3, "min", rsi_stock.line.rolling(window=60).min())
-        rsi_stock.insert(4, "med", (8 / 10) * rsi_stock["max"] + (2 / 10) * rsi_stock["min"])
-        # going from below the medium line to above the medium line
-        check = (rsi_stock["line"] > rsi_stock["med"])
-        for index in range(check.shape[0]):
-            if index > 1:
-                if check.iloc[index] and check.iloc[index - 1] == False:
-                    if 6 > datetime.now().weekday() > 0:
-                        if (datetime.now() - check.index[index]).days < 2:
-                            final_stock_list.append(stock_name)
-                    # used for testing on sundays
-                    elif datetime.now().weekday() == 6:
-                        if (datetime.now() - check.index[index]).days < 3:
-                            final_stock_list.append(stock_name)
-                    else:
-                        if (datetime.now() - check.index[index]).days < 4:
-                            final_stock_list.append(stock_name)
-        # touching the minimum line and then increasing
-        # check = (rsi_stock["line"] == rsi_stock["min"])
-        # for index in range(check.shape[0]):
-        #     if index > 1:
-        #         if (check.iloc[index - 1] or check.iloc[index - 2]) and check.iloc[index] == False:
-        #             if datetime.now().weekday() > 0:
-        #                 if (datetime.now() - check.index[index]).days < 2:
-        #                     final_stock_list.append(stock_name)
-        #             else:
-        #                 if (datetime.now() - check.index[index]).days < 4:
-        #                     final_stock_list.append(stock_name)
+    line = pd.DataFrame(kaufman_indicator_matrix(monthly_data), index=monthly_data.index, columns=monthly_data.columns)
+    window = strategy_parameters.screen_window
+    maximum = line.rolling(window=window).max()
+    minimum = line.rolling(window=window).min()
+    med = strategy_parameters.screen_maximum_weight * maximum + strategy_parameters.screen_minimum_weight * minimum
+    # going from below the medium line to above the medium line
+    check = (line > med).to_numpy()
+    crossed = np.zeros(check.shape, dtype=bool)
+    crossed[2:] = check[2:] & ~check[1:-1]
+
+    if 6 > now.weekday() > 0:
+        maximum_days = 2
+    # used for testing on sundays
+    elif now.weekday() == 6:
+        maximum_days = 3
+    else:
+        maximum_days = 4
+    recent = np.array([(now - day).days < maximum_days for day in monthly_data.index])
+
+    selected = (crossed & recent[:, None]).any(axis=0)
+    final_stock_list = list(monthly_data.columns[selected])
+
+    # touching the minimum line and then increasing
+    # check = (rsi_stock["line"] == rsi_stock["min"])
+    # for index in range(check.shape[0]):
+    #     if index > 1:
+    #         if (check.iloc[index - 1] or check.iloc[index - 2]) and check.iloc[index] == False:
+    #             if datetime.now().weekday() > 0:
+    #                 if (datetime.now() - check.index[index]).days < 2:
+    #                     final_stock_list.append(stock_name)
+    #             else:
+    #                 if (datetime.now() - check.index[index]).days < 4:
+    #                     final_stock_list.append(stock_name)
 
     return list(set(final_stock_list))
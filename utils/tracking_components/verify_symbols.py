@@ -1,10 +1,83 @@
 import asyncio
+from logging import Logger
 from os import getcwd
-import re
+from typing import AsyncIterator
 
+import numpy as np
 import pandas as pd
 
-from constants.global_contexts import kite_context
+from constants.enums.request_priority import RequestPriority
+from constants.settings import SYMBOL_BLOCK_SIZE, SYMBOL_RESOLVE_CONCURRENCY
+from utils.executor import run_blocking
+from utils.instrument_master import instrument_master
+from utils.kite_scheduler import kite_scheduler
+from utils.logger import get_logger
+
+logger: Logger = get_logger(__name__)
+
+
+def price_band(response: dict, lower_price: float, higher_price: float) -> list[str]:
+    """
+    filters the ltp response on the price band
+    :param response: ltp response of the form {'NSE:20MICRONS-BE': {'last_price': 234.23, ...}, ...}
+    :param lower_price: lowest price above which the stocks are chosen
+    :param higher_price: maximum price below which the stocks are chosen
+    :return: symbols without the exchange e.g. ['20MICRONS-BE']
+    """
+    symbols = np.array([key.split(":")[-1] for key in response.keys()], dtype=object)
+    prices = np.fromiter((value['last_price'] for value in response.values()), dtype=float, count=len(response))
+    return list(symbols[(prices > lower_price) & (prices < higher_price)])
+
+
+async def resolve_symbols(lower_price=0, higher_price=400, initial_stock_list=None) -> AsyncIterator[list[str]]:
+    """
+    Resolves the symbols block by block and yields each block as soon as its prices arrive, so the
+    consumer can start on the first blocks while the rest of the universe is still being fetched.
+    The blocks are yielded in the order they complete.
+
+    Some symbol is trade to trade basis so-BE is attached at the end. The correct form is taken from the
+    instrument master so only the price is asked from kite. If the master can not be loaded then both forms
+    are asked in the same ltp call and only the one which exists is returned by kite
+    :param lower_price: lowest price above which the stocks are chosen
+    :param higher_price: maximum price below which the stocks are chosen
+    :param initial_stock_list: dataframe with a Symbol column, temp/EQUITY_NSE.csv if None
+    :return: async iterator of lists of symbols in correct_format e.g. ['20MICRONS-BE', 'RELIANCE']
+    """
+    if initial_stock_list is None:
+        initial_stock_list = pd.read_csv(getcwd() + "/temp/EQUITY_NSE.csv")[['Symbol']]
+    symbols = list(initial_stock_list['Symbol'])
+    try:
+        await run_blocking(instrument_master.load, timeout=None)
+        resolved = True
+    except:
+        logger.exception("Instrument master could not be loaded, the -BE symbols are probed with ltp")
+        resolved = False
+
+    # the calls wait for the rate limit in the thread pool so only a few are handed over at a time
+    semaphore = asyncio.Semaphore(SYMBOL_RESOLVE_CONCURRENCY)
+
+    async def get_block(block: list[str]) -> list[str]:
+        if resolved:
+            instruments = [f"NSE:{symbol}" for symbol in map(instrument_master.resolve, block) if symbol is not None]
+        else:
+            instruments = [f"NSE:{stock}" for stock in block] + [f"NSE:{stock}-BE" for stock in block]
+        if len(instruments) == 0:
+            return []
+        async with semaphore:
+            response: dict = await run_blocking(kite_scheduler.ltp, instruments, RequestPriority.SCREENING,
+                                                timeout=None)
+        return price_band(response, lower_price, higher_price)
+
+    tasks = [
+        asyncio.create_task(get_block(symbols[start:start + SYMBOL_BLOCK_SIZE]))
+        for start in range(0, len(symbols), SYMBOL_BLOCK_SIZE)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 async def get_correct_symbol(lower_price=0, higher_price=400, initial_stock_list=None):
@@ -15,38 +88,7 @@ async def get_correct_symbol(lower_price=0, higher_price=400, initial_stock_list
     :param higher_price: maximum price below which the stocks are chosen
     :return: a list of symbols in correct_format e.g. ['20MICRONS-BE', 'RELIANCE']
     """
-    if initial_stock_list is None:
-        initial_stock_list = pd.read_csv(getcwd() + "/temp/EQUITY_NSE.csv")[['Symbol']]
-
-    async def get_stocks(sub_list_of_stocks: list):
-        """
-        Given a list of symbols, it identifies whether there is a BE in symbol or not.
-        If the symbol is not removed or has -BE then it is included in output else it is ignored
-        :param sub_list_of_stocks: a list of stock symbols
-        :return: dictionary with a key as correct stock symbol and value as current stock price
-        """
-        dict1 = {}
-        dict1.update(kite_context.ltp([f"NSE:{stock}" for stock in sub_list_of_stocks]))
-        dict1.update(kite_context.ltp([f"NSE:{stock}-BE" for stock in sub_list_of_stocks]))
-        return dict1
-
-    # dividing the entire list into a sub blocks of 300 stocks or fewer (for the last one)
-    blocks = [(counter * 300, (counter + 1) * 300) for counter in range(int(len(initial_stock_list) / 300))]
-    if len(initial_stock_list) % 300 > 0:
-        blocks.append((int(len(initial_stock_list) / 300) * 300, len(initial_stock_list)))
-
-    # asynchronously getting the prices for each sub block
-    data = await asyncio.gather(*[
-        get_stocks(initial_stock_list['Symbol'][block[0]:block[1]]) for block in blocks
-    ])
-
-    # one block is one dict of form {'NSE:20MICRONS-BE':234.23,'NSE:RELIANCE':3435.23}
-    # hence iterating through one block at a time merging all data into one after removing NSE
-    raw_data = {re.split(":", key)[-1]: [block[key]['last_price']] for block in data for key in block.keys()}
-
-    # converting it into csv and filtering the price range
-    temp_df = pd.DataFrame(raw_data)
-    temp_df = temp_df.transpose()
-    temp_df.columns = ['Close']
-    temp_df = temp_df[(temp_df['Close'] > lower_price) & (temp_df['Close'] < higher_price)]
-    return list(temp_df.index)
+    correct_symbols = []
+    async for block in resolve_symbols(lower_price, higher_price, initial_stock_list):
+        correct_symbols.extend(block)
+    return correct_symbols
@@ -0,0 +1,65 @@
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from utils.exclude_dates import load_holidays
+
+
+@dataclass
+class TradingCalendar:
+    """
+        Answers the number of trading days between two dates in O(1).
+
+        The holidays are loaded only once and a cumulative count of trading days is kept for every date
+        from the earliest date asked. A weekday counts as one day and every holiday in the list removes one.
+    """
+    _holidays: list[date] | None = field(default=None, init=False)
+    # the earliest date and the cumulative counts from it, replaced in one assignment so that a thread
+    # reading it while another one rebuilds sees either the old or the new index but never half of one
+    _index: tuple[date, list[int]] | None = field(default=None, init=False)
+
+    @property
+    def holidays(self) -> list[date]:
+        if self._holidays is None:
+            self._holidays = [day.date() for day in load_holidays()['dates']]
+        return self._holidays
+
+    def _build(self, start: date, end: date) -> tuple[date, list[int]]:
+        holiday_count: dict[date, int] = {}
+        for day in self.holidays:
+            holiday_count[day] = holiday_count.get(day, 0) + 1
+
+        cumulative = []
+        total = 0
+        for offset in range((end - start).days + 1):
+            day = start + timedelta(days=offset)
+            total += (1 if day.weekday() < 5 else 0) - holiday_count.get(day, 0)
+            cumulative.append(total)
+        self._index = (start, cumulative)
+        return self._index
+
+    def trading_days(self, start: date, end: date) -> int:
+        """
+        number of trading days from start to end, both included
+        :param start: first date
+        :param end: last date
+        :return: count of weekdays minus the holidays in between
+        """
+        if start > end:
+            return 0
+        index = self._index
+        if index is None or start < index[0] or (end - index[0]).days >= len(index[1]):
+            # the index is built a year ahead so that it is not rebuilt every day
+            index = self._build(start if index is None else min(start, index[0]), end + timedelta(days=366))
+        origin, cumulative = index
+        before = cumulative[(start - origin).days - 1] if start > origin else 0
+        return cumulative[(end - origin).days] - before
+
+    def reload(self):
+        """
+            loads the holidays again, to be used if temp/holidays.json changes
+        """
+        self._holidays = None
+        self._index = None
+
+
+trading_calendar = TradingCalendar()
@@ -0,0 +1,139 @@
+import asyncio
+from asyncio import AbstractEventLoop
+from dataclasses import dataclass, field
+from logging import Logger
+from threading import Condition, get_ident
+
+from constants.settings import PERSIST_INTERVAL, PERSIST_MAX_PENDING, PERSIST_BACKPRESSURE_TIMEOUT
+from models.db_models import jsonify_field, document_filter
+from utils.logger import get_logger
+from utils.nr_db import connect_to_collection, UpdateOne
+
+logger: Logger = get_logger(__name__)
+
+
+@dataclass
+class WriteBehindQueue:
+    """
+        Keeps the models whose fields have changed and writes only those fields in the background.
+
+        mark is cheap and is called from the trading loop whenever a persisted field changes. Every interval
+        the changed fields of all the marked models are written with one bulk_write of $set updates per
+        collection, the values being read at the time of writing so a field which changes on every tick is
+        written once per interval. If more than max_pending models are waiting then the callers from the
+        worker threads are held till a flush makes room, and the loop flushes straight away.
+    """
+    interval: float = PERSIST_INTERVAL
+    max_pending: int = PERSIST_MAX_PENDING
+    backpressure_timeout: float = PERSIST_BACKPRESSURE_TIMEOUT
+    _dirty: dict[tuple[str, str], tuple[object, set[str]]] = field(default_factory=dict, init=False)
+    _condition: Condition = field(default_factory=Condition, init=False)
+    _loop: AbstractEventLoop | None = field(default=None, init=False)
+    _loop_thread: int | None = field(default=None, init=False)
+    _wake: asyncio.Event | None = field(default=None, init=False)
+    _task: asyncio.Task | None = field(default=None, init=False)
+    _flush_lock: asyncio.Lock | None = field(default=None, init=False)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def mark(self, model, *keys: str):
+        """
+        marks the fields of the model to be written, models without a collection are not persisted
+        :param model: StockInfo, Holding or any model with COLLECTION and schema
+        :param keys: fields of the schema which have changed
+        :return: None
+        """
+        collection = getattr(model, "COLLECTION", None)
+        if collection is None:
+            return
+        keys = [key for key in keys if key in model.schema]
+        if len(keys) == 0:
+            return
+        document_key = (collection, repr(document_filter(model)))
+
+        with self._condition:
+            if document_key not in self._dirty and len(self._dirty) >= self.max_pending and self._loop is not None:
+                self._loop.call_soon_threadsafe(self._wake.set)
+                # the loop thread can not wait for the flush which has to run on it
+                if get_ident() != self._loop_thread:
+                    self._condition.wait_for(lambda: len(self._dirty) < self.max_pending, self.backpressure_timeout)
+            _, dirty_keys = self._dirty.setdefault(document_key, (model, set()))
+            dirty_keys.update(keys)
+
+    def start(self, loop: AbstractEventLoop):
+        """
+        starts flushing on the interval in the given loop, must be called from that loop
+        :param loop: running event loop
+        :return: None
+        """
+        self._loop = loop
+        self._loop_thread = get_ident()
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        """
+        writes all the marked fields, the ones which fail are marked again to be tried in the next flush
+        :return: None
+        """
+        with self._condition:
+            dirty, self._dirty = self._dirty, {}
+            self._condition.notify_all()
+        if len(dirty) == 0:
+            return
+
+        operations: dict[str, list] = {}
+        for (collection, _), (model, keys) in dirty.items():
+            update = {"$set": {key: jsonify_field(model, key) for key in keys}}
+            operations.setdefault(collection, []).append(UpdateOne(document_filter(model), update, upsert=True))
+
+        unwritten = list(operations)
+        try:
+            async with self._flush_lock if self._flush_lock is not None else asyncio.Lock():
+                for collection_name, requests in operations.items():
+                    try:
+                        with connect_to_collection(collection_name) as collection:
+                            await collection.bulk_write(requests, ordered=False)
+                    except Exception:
+                        logger.exception(f"{len(requests)} updates of {collection_name} could not be written")
+                        self._mark_again(dirty, [collection_name])
+                    unwritten.remove(collection_name)
+        except asyncio.CancelledError:
+            # the collections which are not written yet are marked again for the flush in stop
+            self._mark_again(dirty, unwritten)
+            raise
+
+    def _mark_again(self, dirty: dict, collection_names: list[str]):
+        for (collection, _), (model, keys) in dirty.items():
+            if collection in collection_names:
+                self.mark(model, *keys)
+
+    async def stop(self):
+        """
+            stops the interval and writes whatever is left
+        """
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                # only the cancel of the interval is swallowed, stop itself can still be cancelled
+                if not task.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        await self.flush()
+
+
+write_behind = WriteBehindQueue()